@@ -0,0 +1,798 @@
+"""
+ERP connectors (IXC, MK-Auth, SGP, RadiusNet)
+One class per ERP behind a common interface, sharing pooled keep-alive HTTP
+clients per host, retry/backoff and per-ERP rate limits
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # Uma linha INFO por requisição ao ERP é ruído
+
+# Padrões para todos os ERPs (cada conector pode sobrescrever)
+ERP_CALL_TIMEOUT = float(os.environ.get('ERP_CALL_TIMEOUT', '30'))  # segundos por chamada
+ERP_SYNC_DEADLINE = float(os.environ.get('ERP_SYNC_DEADLINE', os.environ.get('IXC_SYNC_DEADLINE', '1800')))  # segundos por sincronização
+ERP_MAX_RETRIES = int(os.environ.get('ERP_MAX_RETRIES', '2'))
+ERP_RETRY_BACKOFF = float(os.environ.get('ERP_RETRY_BACKOFF', '1'))  # segundos, dobra a cada tentativa
+ERP_RETRY_STATUSES = {429, 502, 503, 504}
+
+# IXC: paginação adaptativa do fn_areceber e detalhes de clientes em lotes
+IXC_CONCURRENCY = int(os.environ.get('IXC_CONCURRENCY', '8'))
+IXC_CALL_TIMEOUT = float(os.environ.get('IXC_CALL_TIMEOUT', '30'))
+IXC_RATE_LIMIT = float(os.environ.get('IXC_RATE_LIMIT', '20'))  # requisições/s por host
+IXC_PAGE_SIZE = int(os.environ.get('IXC_PAGE_SIZE', '1000'))
+IXC_PAGE_SIZE_MIN = 250
+IXC_PAGE_SIZE_MAX = 4000
+IXC_PAGE_TARGET_SECONDS = float(os.environ.get('IXC_PAGE_TARGET_SECONDS', '5'))
+IXC_CLIENT_BATCH = int(os.environ.get('IXC_CLIENT_BATCH', '500'))  # ids por requisição em /cliente
+
+
+class ErpError(Exception):
+    """ERP call failed in a way the sync reports as an error message"""
+
+
+class ErpDeadlineExceeded(ErpError):
+    """The whole-sync deadline ran out before the ERP calls finished"""
+
+
+def content_hash(data) -> str:
+    """Stable digest of a JSON-like structure (used to detect unchanged ERP records)"""
+    raw = json.dumps(data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def only_digits(value) -> str:
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+class ErpHttpPool:
+    """One pooled keep-alive AsyncClient per ERP host, shared by every integration"""
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.transport: Optional[httpx.AsyncBaseTransport] = None  # Permite injetar transporte (simulador/testes)
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self.clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                verify=False,  # Muitos ERPs usam certificado autoassinado
+                timeout=ERP_CALL_TIMEOUT,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                transport=self.transport
+            )
+            self.clients[origin] = client
+        return client
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+
+http_pool = ErpHttpPool()
+
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            delay = self.next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_at = max(loop.time(), self.next_at) + self.interval
+
+
+rate_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+
+class ErpConnector:
+    """Base connector: HTTP with deadline, retry/backoff and rate limit; subclasses implement the ERP"""
+
+    integration_type = ""
+    display_name = ""
+    call_timeout = ERP_CALL_TIMEOUT
+    max_retries = ERP_MAX_RETRIES
+    retry_backoff = ERP_RETRY_BACKOFF
+    rate_limit: Optional[float] = None  # requisições/s por host (None = sem limite)
+    # Identificador do cliente no ERP (primeiro campo preenchido); sem id, o CPF do ERP
+    external_id_fields: Tuple[str, ...] = ("id",)
+    cpf_fields: Tuple[str, ...] = ("cpf",)
+    # Listagem vazia do ERP inativa todos os importados desta integração? Um path
+    # errado ou filtro do ERP também devolve lista vazia, então só com opt-in
+    reconcile_when_empty = False
+
+    def __init__(self, integration: dict, deadline: Optional[float] = None):
+        self.integration = integration
+        self.credentials = integration.get("credentials") or {}
+        self.api_url = (integration.get("api_url") or "").rstrip('/')
+        # Prazo absoluto (loop.time()) para todas as chamadas desta sincronização
+        self.deadline = deadline
+        self.records_seen = 0
+        # False quando uma listagem trouxe menos registros que o total anunciado
+        # pelo ERP: o sync importa o que veio, mas não reconcilia com ela
+        self.listing_complete = True
+        self.stats = {"requests": 0, "retries": 0, "bytes": 0}
+
+    @classmethod
+    def for_sync(cls, integration: dict) -> "ErpConnector":
+        return cls(integration, asyncio.get_running_loop().time() + ERP_SYNC_DEADLINE)
+
+    def timeout_for(self, timeout: Optional[float]) -> float:
+        timeout = timeout or self.call_timeout
+        if self.deadline is None:
+            return timeout
+        remaining = self.deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise ErpDeadlineExceeded(f"Prazo de {ERP_SYNC_DEADLINE:.0f}s da sincronização esgotado")
+        return min(timeout, remaining)
+
+    def rate_limiter(self, url: str) -> Optional[RateLimiter]:
+        if not self.rate_limit:
+            return None
+        key = (self.integration_type, urlsplit(url).netloc)
+        if key not in rate_limiters:
+            rate_limiters[key] = RateLimiter(self.rate_limit)
+        return rate_limiters[key]
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """HTTP call with rate limit and retry (connection errors, 429 and 5xx gateway errors)"""
+        limiter = self.rate_limiter(url)
+        attempt = 0
+        while True:
+            if limiter:
+                await limiter.wait()
+            try:
+                response = await http_pool.get(url).request(method, url, timeout=self.timeout_for(timeout), **kwargs)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                self.stats["requests"] += 1
+                self.stats["bytes"] += len(response.content)
+                if response.status_code not in ERP_RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+
+            attempt += 1
+            self.stats["retries"] += 1
+            delay = self.retry_backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            self.timeout_for(delay)  # Não espera além do prazo da sincronização
+            await asyncio.sleep(delay)
+
+    # Interface implementada por cada ERP
+    async def test(self) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    async def iter_debtors(self) -> AsyncIterator[List[dict]]:
+        """Yield pages of debtors as {"external_id", "hash", "record"}"""
+        raise NotImplementedError
+        yield []
+
+    async def fetch_details(self, debtors: List[dict]) -> List[dict]:
+        """Full client records (ready for normalize_fields) for the given debtors"""
+        return [{**debtor["record"], "hash_debito": debtor["hash"]} for debtor in debtors]
+
+    async def cleanup_snapshot(self) -> set:
+        """CPFs with any overdue debt in the ERP (used by the cleanup of imported clients)"""
+        raise NotImplementedError(f"Cleanup não implementado para {self.integration_type}")
+
+    @classmethod
+    def normalize_fields(cls, record: dict) -> dict:
+        """Map an ERP client record to name/cpf/email/phone/address/bairro/debt_amount/reason"""
+        raise NotImplementedError
+
+    @classmethod
+    def external_id(cls, record: dict) -> str:
+        """Stable id of a client in its ERP ('' when the record has neither id nor CPF)"""
+        for field in cls.external_id_fields:
+            value = record.get(field)
+            if value not in (None, ""):
+                return str(value)
+        for field in cls.cpf_fields:
+            cpf = only_digits(record.get(field))
+            if cpf:
+                return f"cpf:{cpf}"
+        return ""
+
+
+class DelinquentListConnector(ErpConnector):
+    """ERPs with one REST endpoint returning the delinquent clients with their debt"""
+
+    test_path = ""
+    debtors_path = ""
+    debtors_key = ""
+    unauthorized_message = "❌ Credenciais inválidas"
+
+    async def auth_headers(self) -> dict:
+        raise NotImplementedError
+
+    def debt_threshold(self) -> int:
+        return (self.integration.get("settings") or {}).get("debt_days_threshold", 5)
+
+    async def test(self) -> Tuple[bool, str]:
+        try:
+            response = await self.request("GET", f"{self.api_url}{self.test_path}",
+                                          headers=await self.auth_headers(), timeout=10)
+            if response.status_code == 200:
+                return True, f"✅ Conexão com {self.display_name} estabelecida com sucesso"
+            elif response.status_code in (401, 403):
+                return False, self.unauthorized_message
+            return False, f"❌ Erro HTTP {response.status_code}"
+        except ErpError as e:
+            return False, f"❌ {str(e)}"
+        except httpx.TimeoutException:
+            return False, f"❌ Timeout na conexão com {self.display_name}. Verifique a URL"
+        except httpx.TransportError:
+            return False, "❌ Erro de conexão. Verifique a URL da API"
+        except Exception as e:
+            return False, f"❌ Erro inesperado: {str(e)}"
+
+    async def iter_debtors(self) -> AsyncIterator[List[dict]]:
+        response = await self.request(
+            "GET", f"{self.api_url}{self.debtors_path.format(dias=self.debt_threshold())}",
+            headers=await self.auth_headers()
+        )
+        if response.status_code != 200:
+            raise ErpError(f"Erro ao buscar clientes: HTTP {response.status_code}")
+
+        # Resposta sem a lista esperada não é "zero devedores": tratar como vazia
+        # zeraria o sync (e a reconciliação) por causa de um path ou formato errado
+        try:
+            data = response.json()
+        except ValueError:
+            raise ErpError(f"Resposta inválida do {self.display_name}: corpo não é JSON")
+        rows = data.get(self.debtors_key) if isinstance(data, dict) else None
+        if not isinstance(rows, list):
+            raise ErpError(f"Resposta inesperada do {self.display_name}: campo '{self.debtors_key}' ausente ou não é uma lista")
+        self.records_seen += len(rows)
+        yield [
+            {"external_id": self.external_id(row), "hash": content_hash(row), "record": row}
+            for row in rows
+        ]
+
+
+class MkAuthConnector(DelinquentListConnector):
+    integration_type = "mk-auth"
+    display_name = "MK-Auth"
+    test_path = "/api/v1/health"  # Ajustar conforme documentação do MK-Auth
+    debtors_path = "/api/v1/clientes/inadimplentes?dias={dias}"
+    debtors_key = "data"
+    unauthorized_message = "❌ Token de autenticação inválido"
+    external_id_fields = ("id", "codigo", "login")
+    cpf_fields = ("cpf", "document")
+
+    async def auth_headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.credentials.get('api_token')}",
+            "Content-Type": "application/json"
+        }
+
+    @classmethod
+    def normalize_fields(cls, record: dict) -> dict:
+        return {
+            "name": record.get("name", record.get("full_name", "")).strip().upper(),
+            "cpf": only_digits(record.get("cpf", record.get("document", ""))),
+            "email": record.get("email", "").strip().lower(),
+            "phone": only_digits(record.get("phone", record.get("mobile", ""))),
+            "address": record.get("street", "").strip(),
+            "bairro": record.get("neighborhood", record.get("district", "")).strip(),
+            "debt_amount": float(record.get("debt", record.get("debt_amount", 0))),
+            "reason": "Inadimplência"
+        }
+
+
+class SgpConnector(DelinquentListConnector):
+    integration_type = "sgp"
+    display_name = "SGP"
+    test_path = "/api/auth/validate"  # Ajustar conforme documentação do SGP
+    debtors_path = "/api/clientes/inadimplentes?dias_atraso={dias}"
+    debtors_key = "clientes"
+    unauthorized_message = "❌ Credenciais inválidas (API Key ou Secret incorretos)"
+    external_id_fields = ("id", "id_cliente", "codigo")
+    cpf_fields = ("cpf",)
+
+    async def auth_headers(self) -> dict:
+        return {
+            "X-API-Key": self.credentials.get("api_key"),
+            "X-API-Secret": self.credentials.get("api_secret"),
+            "Content-Type": "application/json"
+        }
+
+    @classmethod
+    def normalize_fields(cls, record: dict) -> dict:
+        return {
+            "name": record.get("nome_cliente", record.get("nome", "")).strip().upper(),
+            "cpf": only_digits(record.get("cpf", "")),
+            "email": record.get("email_principal", record.get("email", "")).strip().lower(),
+            "phone": only_digits(record.get("telefone_principal", record.get("telefone", ""))),
+            "address": record.get("logradouro", record.get("endereco", "")).strip(),
+            "bairro": record.get("bairro", "").strip(),
+            "debt_amount": float(record.get("valor_em_aberto", record.get("debito", 0))),
+            "reason": "Inadimplência"
+        }
+
+
+class RadiusNetConnector(DelinquentListConnector):
+    integration_type = "radiusnet"
+    display_name = "RadiusNet"
+    debtors_path = "/api/clientes/inadimplentes?dias={dias}"
+    debtors_key = "clientes"
+    external_id_fields = ("id", "codigo")
+    cpf_fields = ("cpf", "documento")
+
+    def __init__(self, integration: dict, deadline: Optional[float] = None):
+        super().__init__(integration, deadline)
+        self.token: Optional[str] = None
+
+    async def login(self) -> dict:
+        response = await self.request("POST", f"{self.api_url}/api/login", json={
+            "username": self.credentials.get("username"),
+            "password": self.credentials.get("password")
+        }, timeout=10)
+        if response.status_code == 401:
+            raise ErpError("Credenciais inválidas")
+        if response.status_code != 200:
+            raise ErpError("Falha na autenticação com RadiusNet")
+        return response.json()
+
+    async def auth_headers(self) -> dict:
+        if not self.token:
+            self.token = (await self.login()).get("token")
+            if not self.token:
+                raise ErpError("Token não recebido do RadiusNet")
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+
+    async def test(self) -> Tuple[bool, str]:
+        try:
+            result = await self.login()
+            if result.get("success") or result.get("token"):
+                return True, "✅ Conexão com RadiusNet estabelecida com sucesso"
+            return False, "❌ Falha na autenticação"
+        except ErpError as e:
+            return False, f"❌ {str(e)}"
+        except httpx.TimeoutException:
+            return False, "❌ Timeout na conexão com RadiusNet. Verifique a URL"
+        except httpx.TransportError:
+            return False, "❌ Erro de conexão. Verifique a URL da API"
+        except Exception as e:
+            return False, f"❌ Erro inesperado: {str(e)}"
+
+    @classmethod
+    def normalize_fields(cls, record: dict) -> dict:
+        return {
+            "name": record.get("nome", record.get("cliente_nome", "")).strip().upper(),
+            "cpf": only_digits(record.get("cpf", record.get("documento", ""))),
+            "email": record.get("email", "").strip().lower(),
+            "phone": only_digits(record.get("telefone", record.get("contato", ""))),
+            "address": record.get("endereco", "").strip(),
+            "bairro": record.get("bairro", "").strip(),
+            "debt_amount": float(record.get("debito_total", record.get("valor_devido", 0))),
+            "reason": "Inadimplência"
+        }
+
+
+class IxcConnector(ErpConnector):
+    """IXC webservice: open titles (fn_areceber) paginated and grouped in memory, client details (/cliente) in batches"""
+
+    integration_type = "ixc"
+    display_name = "IXC"
+    call_timeout = IXC_CALL_TIMEOUT
+    rate_limit = IXC_RATE_LIMIT
+    external_id_fields = ("id",)
+    cpf_fields = ("cnpj_cpf",)
+    overdue_days = 60  # Importa apenas títulos com MAIS DE 60 DIAS de atraso
+    oldest_titles = 2  # Débito = soma dos 2 títulos mais antigos
+
+    def __init__(self, integration: dict, deadline: Optional[float] = None):
+        super().__init__(integration, deadline)
+        self.token = str(self.credentials.get("token", "") or "").strip()
+        if not self.token or ':' not in self.token:
+            raise ErpError("Token mal formatado. Formato esperado: ID:HASH")
+        self.headers = {
+            "ixcsoft": "listar",
+            "Content-Type": "application/json",
+            # Token formato ID:HASH, enviado como Basic Auth
+            "Authorization": f"Basic {base64.b64encode(self.token.encode()).decode()}"
+        }
+
+    async def listar(self, resource: str, payload: dict, timeout: Optional[float] = None) -> httpx.Response:
+        """POST a listing query (header ixcsoft: listar) to /{resource}"""
+        return await self.request("POST", f"{self.api_url}/{resource}", headers=self.headers,
+                                  json=payload, timeout=timeout)
+
+    async def iter_pages(self, resource: str, payload: dict) -> AsyncIterator[list]:
+        """Yield the records of a listing page by page, resuming after the last id seen"""
+        # Paginação por chave (id > último id, sempre página 1) em vez de page/rp:
+        # títulos baixados durante a leitura deslocariam o offset e pulariam registros
+        id_field = f"{resource}.id"
+        grid = json.loads(payload.get("grid_param") or "[]")
+        rp = max(IXC_PAGE_SIZE_MIN, min(IXC_PAGE_SIZE, IXC_PAGE_SIZE_MAX))
+        max_rp = IXC_PAGE_SIZE_MAX
+        last_id = None
+        received = 0
+        total = None
+        loop = asyncio.get_running_loop()
+
+        while True:
+            filters = grid + ([{"TB": id_field, "OP": ">", "P": str(last_id)}] if last_id is not None else [])
+            started = loop.time()
+            response = await self.listar(resource, {
+                **payload,
+                "sortname": id_field,
+                "sortorder": "asc",
+                "page": "1",
+                "rp": str(rp),
+                "grid_param": json.dumps(filters)
+            })
+            if response.status_code != 200:
+                raise ErpError(f"HTTP {response.status_code} em {resource} (após id {last_id})")
+            data = response.json()
+            if data.get("type") == "error":
+                raise ErpError(f"Erro IXC em {resource}: {data.get('mensagem', '')}")
+            registros = data.get("registros") or []
+            if total is None:
+                try:
+                    total = int(data.get("total") or 0)
+                except (TypeError, ValueError):
+                    total = None
+
+            if registros:
+                yield registros
+            received += len(registros)
+            # Página curta só encerra quando o total já chegou: instalações que limitam
+            # o rp abaixo do pedido devolvem páginas curtas no meio da listagem
+            if not registros or (len(registros) < rp and total is not None and received >= total):
+                break
+
+            ids = [int(r["id"]) for r in registros if str(r.get("id", "")).isdigit()]
+            if not ids or (last_id is not None and max(ids) <= last_id):
+                raise ErpError(f"{resource}: ids fora de ordem na paginação (após id {last_id})")
+            last_id = max(ids)
+
+            # Ajusta o tamanho da próxima página pelo tempo de resposta desta (ou ao
+            # limite do ERP, se ele devolveu menos que o pedido)
+            elapsed = loop.time() - started
+            if len(registros) < rp:
+                rp = max_rp = len(registros)
+            elif elapsed > IXC_PAGE_TARGET_SECONDS and rp // 2 >= IXC_PAGE_SIZE_MIN:
+                rp //= 2
+            elif elapsed < IXC_PAGE_TARGET_SECONDS / 2 and rp * 2 <= max_rp:
+                rp *= 2
+
+        # Títulos baixados durante a leitura também reduzem o recebido, mas não há como
+        # distinguir de registros perdidos: a listagem fica marcada como incompleta
+        if total is not None and received < total:
+            self.listing_complete = False
+            logger.warning(f"IXC {resource}: {received} de {total} registros recebidos, listagem incompleta")
+
+    async def test(self) -> Tuple[bool, str]:
+        try:
+            # Payload mínimo para teste
+            response = await self.listar("cliente", {
+                "qtype": "cliente.id",
+                "query": "1",
+                "oper": ">=",
+                "page": "1",
+                "rp": "1",
+                "sortname": "cliente.id",
+                "sortorder": "desc"
+            }, timeout=10)
+
+            if response.status_code == 200:
+                try:
+                    result = response.json()
+                    if isinstance(result, dict):
+                        if result.get("type") == "error":
+                            return False, f"❌ Erro IXC: {result.get('mensagem', 'Token inválido')}"
+                        if result.get("total") is not None or result.get("registros") is not None:
+                            return True, "✅ Conexão com IXC estabelecida com sucesso"
+                    return True, "✅ Conexão com IXC estabelecida"
+                except Exception:
+                    return True, "✅ Conexão com IXC estabelecida"
+            elif response.status_code == 401:
+                # Verifica se o token está correto
+                return False, "❌ Erro 401: Token inválido. Verifique se o token está correto e ativo no painel IXC. Contate o suporte do IXC se necessário."
+            elif response.status_code == 403:
+                return False, "❌ Acesso negado. Verifique permissões"
+            return False, f"❌ Erro HTTP {response.status_code}"
+
+        except httpx.TimeoutException:
+            return False, "❌ Timeout (10s)"
+        except httpx.ConnectError as e:
+            if "SSL" in str(e) or "certificate" in str(e).lower():
+                return False, "❌ Erro de SSL"
+            return False, "❌ Erro de conexão"
+        except Exception as e:
+            return False, f"❌ Erro: {str(e)}"
+
+    async def iter_debtors(self) -> AsyncIterator[List[dict]]:
+        """Yield every debtor in a single page, after the whole title listing was read
+
+        Titles come sorted by fn_areceber.id (the keyset iter_pages pages on), so any
+        page may still hold an older title of any client and no group can be closed
+        before the last page. The buffer keeps at most oldest_titles titles per
+        debtor, so memory grows with the number of debtors, not with the number of
+        open titles; the raw pages are dropped as soon as they are grouped.
+        """
+        # Buscar apenas títulos ATIVOS (status='A') E LIBERADOS (liberado='S') vencidos há
+        # MAIS DE overdue_days dias; evita importar títulos pagos, cancelados ou não liberados
+        data_limite = (date.today() - timedelta(days=self.overdue_days)).isoformat()
+        payload = {
+            "qtype": "fn_areceber.data_vencimento",
+            "query": data_limite,
+            "oper": "<",
+            "sortname": "fn_areceber.id",  # Ordem estável entre páginas
+            "sortorder": "asc",
+            "grid_param": '[{"TB":"fn_areceber.status", "OP" : "=", "P" : "A"},{"TB":"fn_areceber.liberado", "OP" : "=", "P" : "S"}]'
+        }
+        logger.info(f"IXC: buscando títulos ativos, liberados e vencidos antes de {data_limite}")
+
+        # Agrupa página a página guardando só os títulos mais antigos de cada cliente
+        # (memória limitada a oldest_titles títulos por devedor)
+        cliente_debitos: Dict[str, list] = {}
+        async for titulos in self.iter_pages("fn_areceber", payload):
+            self.records_seen += len(titulos)
+            self.keep_oldest_titulos(cliente_debitos, titulos)
+
+        debtors = []
+        for cliente_id, mais_antigos in cliente_debitos.items():
+            debtors.append({
+                "external_id": cliente_id,
+                "hash": content_hash([(t['titulo'].get('id'), t['data_vencimento'], t['valor']) for t in mais_antigos]),
+                "record": {
+                    'valor_total': sum(t['valor'] for t in mais_antigos),
+                    'titulos': [t['titulo'] for t in mais_antigos],
+                    'quantidade': len(mais_antigos)
+                }
+            })
+        if debtors:
+            yield debtors
+
+    def keep_oldest_titulos(self, cliente_debitos: dict, titulos: list):
+        """Group a page of open titles by client, keeping only the oldest per client"""
+        for titulo in titulos:
+            cliente_id = titulo.get('cliente_id') or titulo.get('id_cliente')
+            valor_aberto = float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0))
+
+            # Apenas títulos com valor > 0
+            if not cliente_id or valor_aberto <= 0:
+                continue
+
+            mais_antigos = cliente_debitos.setdefault(str(cliente_id), [])  # Mesma chave de fetch_clientes
+            if any(t['titulo'].get('id') == titulo.get('id') for t in mais_antigos if titulo.get('id')):
+                continue  # Mesmo título repetido entre páginas
+            mais_antigos.append({
+                'valor': valor_aberto,
+                'data_vencimento': titulo.get('data_vencimento', ''),
+                'titulo': titulo
+            })
+            # Ordena por data de vencimento (mais antigo primeiro) e descarta o resto
+            mais_antigos.sort(key=lambda x: x['data_vencimento'])
+            del mais_antigos[self.oldest_titles:]
+
+    async def fetch_details(self, debtors: List[dict]) -> List[dict]:
+        clientes = await self.fetch_clientes(debtor["external_id"] for debtor in debtors)
+        records = []
+        for debtor in debtors:
+            cliente = clientes.get(debtor["external_id"])
+            if not cliente:
+                continue
+            debito = debtor["record"]
+            # Valor de débito real (apenas os títulos mais antigos) e boletos desses títulos
+            cliente['valor_debito'] = debito['valor_total']
+            cliente['numero_titulos'] = debito['quantidade']
+            cliente['total_titulos_vencidos'] = debito['quantidade']
+            cliente['boletos'] = self.build_boletos(debito['titulos'])
+            cliente['hash_debito'] = debtor["hash"]
+            records.append(cliente)
+        return records
+
+    async def cleanup_snapshot(self) -> set:
+        # Diferente da sincronização, o cleanup precisa ver TODOS os débitos vencidos
+        # para não remover clientes que têm débitos entre 1-60 dias
+        payload = {
+            "qtype": "fn_areceber.data_vencimento",
+            "query": date.today().isoformat(),
+            "oper": "<",  # Menor que hoje = qualquer débito vencido
+            "sortname": "fn_areceber.id",
+            "sortorder": "asc"
+        }
+        cliente_ids = set()
+        async for titulos in self.iter_pages("fn_areceber", payload):
+            self.records_seen += len(titulos)
+            for titulo in titulos:
+                # Filtrar por status "A"
+                if titulo.get('status', 'A') not in ['A', 'a']:
+                    continue
+                cliente_id = titulo.get('cliente_id') or titulo.get('id_cliente')
+                valor_aberto = float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0))
+                if cliente_id and valor_aberto > 0:
+                    cliente_ids.add(str(cliente_id))
+
+        clientes = await self.fetch_clientes(cliente_ids)
+        return {cpf for cpf in (only_digits(c.get('cnpj_cpf')) for c in clientes.values()) if cpf}
+
+    async def fetch_clientes(self, cliente_ids) -> Dict[str, dict]:
+        """Fetch /cliente in batches of IXC_CLIENT_BATCH ids (IN filter, id-range fallback)"""
+        ids = sorted({str(cliente_id) for cliente_id in cliente_ids}, key=lambda i: (len(i), i))
+        batches = [ids[i:i + IXC_CLIENT_BATCH] for i in range(0, len(ids), IXC_CLIENT_BATCH)]
+        semaphore = asyncio.Semaphore(IXC_CONCURRENCY)
+
+        async def fetch(batch):
+            async with semaphore:
+                wanted = set(batch)
+                found = {}
+                try:
+                    found = await self._fetch_clientes_in(batch, wanted)
+                except ErpDeadlineExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Erro ao buscar lote de {len(batch)} cliente(s) por id: {e}")
+
+                # Versões do IXC sem suporte a IN ignoram o filtro: completa por faixa de ids
+                missing = [cliente_id for cliente_id in batch if cliente_id not in found]
+                if missing:
+                    try:
+                        found.update(await self._fetch_clientes_range(missing, wanted))
+                    except ErpDeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"Erro ao buscar faixa de clientes {missing[0]}..{missing[-1]}: {e}")
+                return found
+
+        tasks = [asyncio.ensure_future(fetch(batch)) for batch in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Prazo esgotado (ou cancelamento): não deixa requisições órfãs rodando
+            for task in tasks:
+                task.cancel()
+            raise
+
+        clientes = {}
+        for found in results:
+            clientes.update(found)
+        missing = len(ids) - len(clientes)
+        if missing:
+            logger.warning(f"{missing} cliente(s) não encontrados no IXC")
+        return clientes
+
+    async def _fetch_clientes_in(self, batch: list, wanted: set) -> Dict[str, dict]:
+        """One /cliente request filtered by `cliente.id IN (...)`"""
+        response = await self.listar("cliente", {
+            "qtype": "cliente.id",
+            "query": "",
+            "oper": "!=",
+            "page": "1",
+            "rp": str(len(batch)),
+            "sortname": "cliente.id",
+            "sortorder": "asc",
+            "grid_param": json.dumps([{"TB": "cliente.id", "OP": "IN", "P": ",".join(batch)}])
+        })
+        if response.status_code != 200:
+            raise ErpError(f"HTTP {response.status_code}")
+        data = response.json()
+        if data.get("type") == "error":
+            raise ErpError(data.get("mensagem", ""))
+        return {
+            str(cliente.get("id")): cliente
+            for cliente in data.get("registros") or []
+            if str(cliente.get("id")) in wanted
+        }
+
+    async def _fetch_clientes_range(self, missing: list, wanted: set) -> Dict[str, dict]:
+        """Page through `cliente.id` ranges covering the missing ids, keeping only the wanted ones"""
+        found = {}
+        numeric = sorted(int(cliente_id) for cliente_id in missing if cliente_id.isdigit())
+        # Agrupa ids próximos em faixas para não varrer a base inteira de clientes
+        ranges = []
+        for cliente_id in numeric:
+            if ranges and cliente_id - ranges[-1][1] <= IXC_CLIENT_BATCH:
+                ranges[-1][1] = cliente_id
+            else:
+                ranges.append([cliente_id, cliente_id])
+
+        for inicio, fim in ranges:
+            payload = {
+                "qtype": "cliente.id",
+                "query": str(inicio),
+                "oper": ">=",
+                "sortname": "cliente.id",
+                "sortorder": "asc",
+                "grid_param": json.dumps([{"TB": "cliente.id", "OP": "<=", "P": str(fim)}])
+            }
+            async for registros in self.iter_pages("cliente", payload):
+                for cliente in registros:
+                    if str(cliente.get("id")) in wanted:
+                        found[str(cliente.get("id"))] = cliente
+        return found
+
+    def build_boletos(self, titulos: list) -> list:
+        """Boleto info (value, due date, digitable line, URL) for the given IXC titles"""
+        boletos = []
+        for titulo in titulos:
+            # Gera URL do boleto se não houver gateway_link
+            url_boleto = titulo.get('gateway_link', '')
+            if not url_boleto and titulo.get('id'):
+                # Formato padrão IXC: https://seuixc.com.br/central_assinante_web/boleto/{id_titulo}
+                url_boleto = f"{self.api_url.replace('/webservice/v1', '')}/central_assinante_web/boleto/{titulo.get('id')}"
+
+            boleto_info = {
+                'valor': float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0)),
+                'vencimento': titulo.get('data_vencimento', ''),
+                'linha_digitavel': titulo.get('linha_digitavel', ''),
+                'url_boleto': url_boleto,
+                'nosso_numero': titulo.get('nn_boleto', ''),
+                'id_titulo': titulo.get('id', ''),
+                'codigo_barras': titulo.get('codigo_barras', '')
+            }
+            # Só adiciona se tiver informações válidas
+            if boleto_info['valor'] > 0:
+                boletos.append(boleto_info)
+        return boletos
+
+    @classmethod
+    def normalize_fields(cls, record: dict) -> dict:
+        num_titulos = record.get("numero_titulos", 0)
+        return {
+            "name": record.get("razao", record.get("fantasia", "")).strip().upper(),
+            "cpf": only_digits(record.get("cnpj_cpf", "")),
+            "email": record.get("email", "").strip().lower(),
+            "phone": only_digits(record.get("telefone_celular", record.get("fone", ""))),
+            "address": record.get("endereco", "").strip(),
+            "bairro": record.get("bairro", "").strip(),
+            # Usa valor de débito real (soma dos 2 títulos mais antigos)
+            "debt_amount": float(record.get("valor_debito", 0)),
+            "reason": f"Importado do IXC - {num_titulos} título(s) vencido(s)" if num_titulos else "Importado do IXC",
+            # Preserva boletos
+            "boletos": record.get("boletos", [])
+        }
+
+
+# Registro de conectores: adicionar um ERP = uma classe nova aqui
+ERP_CONNECTORS = {
+    connector.integration_type: connector
+    for connector in (IxcConnector, MkAuthConnector, SgpConnector, RadiusNetConnector)
+}
+
+
+def get_connector_class(integration_type: str):
+    """Connector class for an integration type (None when unsupported)"""
+    return ERP_CONNECTORS.get(integration_type)
+
+
+def get_connector(integration: dict, for_sync: bool = False) -> ErpConnector:
+    """Instantiate the integration's connector (with the sync deadline when for_sync)"""
+    connector_class = get_connector_class(integration.get("integration_type"))
+    if connector_class is None:
+        raise ErpError(f"Tipo de integração não suportado: {integration.get('integration_type')}")
+    return connector_class.for_sync(integration) if for_sync else connector_class(integration)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Simulador local dos ERPs (IXC, MK-Auth, SGP, RadiusNet) para testar e medir a sincronização
+
+Serve os endpoints chamados por erp_connectors.py com uma base sintética
+reprodutível (clientes com CPFs válidos e títulos em aberto, pagos e recentes),
+com latência e erros injetáveis. Cada ERP fica sob um prefixo; use como
+api_url da integração:
+
+    IXC:       http://localhost:8765/ixc/webservice/v1
+    MK-Auth:   http://localhost:8765/mkauth
+    SGP:       http://localhost:8765/sgp
+    RadiusNet: http://localhost:8765/radiusnet
+
+Uso:
+    python erp_simulator.py --clients 50000 --latency-ms 40 --error-rate 0.01
+
+Em tempo de execução:
+    GET/PUT /_sim/config    latência, jitter e taxa de erros
+    POST    /_sim/advance   altera os títulos de uma fração dos devedores (testa o sync incremental)
+"""
+import argparse
+import asyncio
+import json
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from search_benchmark import BAIRROS, make_address, make_cpf, make_name
+
+RADIUSNET_TOKEN = "simulador-radiusnet"
+FILTER_CACHE_SIZE = 8  # listagens filtradas guardadas (uma por payload sem page/rp)
+
+
+class SimulatorConfig:
+    """Data volume, latency and error injection of the simulator"""
+
+    def __init__(self, clients: int = 10000, debtor_ratio: float = 0.3, titles_per_client: int = 3,
+                 latency_ms: float = 20, jitter_ms: float = 10, latency_per_1k_ms: float = 0,
+                 error_rate: float = 0.0, seed: int = 42):
+        self.clients = clients
+        self.debtor_ratio = debtor_ratio
+        self.titles_per_client = titles_per_client
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.latency_per_1k_ms = latency_per_1k_ms  # latência extra por 1000 registros na resposta
+        self.error_rate = error_rate
+        self.seed = seed
+
+    RUNTIME_FIELDS = ("latency_ms", "jitter_ms", "latency_per_1k_ms", "error_rate")
+
+    def runtime(self) -> dict:
+        return {field: getattr(self, field) for field in self.RUNTIME_FIELDS}
+
+
+class ErpDataset:
+    """Synthetic IXC-shaped clients and titles; the simple ERPs are views over the same data"""
+
+    def __init__(self, config: SimulatorConfig):
+        self.rng = random.Random(config.seed)
+        self.today = date.today()
+        self.clients: Dict[str, dict] = {}
+        self.titles: List[dict] = []
+        self.filter_cache: Dict[str, list] = {}
+        self.generation = 0
+
+        title_id = 0
+        for number in range(1, config.clients + 1):
+            cliente_id = str(number)
+            self.clients[cliente_id] = {
+                "id": cliente_id,
+                "razao": make_name(self.rng),
+                "fantasia": "",
+                "cnpj_cpf": make_cpf(self.rng),
+                "email": f"cliente{number}@simulador.local",
+                "telefone_celular": f"({self.rng.randint(11, 99)}) 9{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}",
+                "endereco": make_address(self.rng),
+                "bairro": self.rng.choice(BAIRROS),
+                "ativo": "S"
+            }
+            debtor = self.rng.random() < config.debtor_ratio
+            for _ in range(max(1, int(self.rng.expovariate(1 / config.titles_per_client)))):
+                title_id += 1
+                if debtor and self.rng.random() < 0.7:
+                    days_overdue, status = self.rng.randint(61, 720), "A"  # vencido há mais de 60 dias
+                elif self.rng.random() < 0.5:
+                    days_overdue, status = self.rng.randint(1, 60), "A"  # vencido recentemente
+                else:
+                    days_overdue, status = self.rng.randint(-30, 720), "R"  # recebido
+                self.titles.append(self.make_title(title_id, cliente_id, days_overdue, status))
+
+    def make_title(self, title_id: int, cliente_id: str, days_overdue: int, status: str) -> dict:
+        valor = round(self.rng.choice([79.9, 99.9, 119.9, 149.9]) * self.rng.uniform(0.9, 1.1), 2)
+        return {
+            "id": str(title_id),
+            "cliente_id": cliente_id,
+            "data_vencimento": (self.today - timedelta(days=days_overdue)).isoformat(),
+            "valor": f"{valor:.2f}",
+            "valor_aberto": f"{valor:.2f}" if status == "A" else "0.00",
+            "status": status,
+            "liberado": "S",
+            "linha_digitavel": f"34191.{title_id:05d} 00000.000000 00000.000000 1 {valor * 100:014.0f}",
+            "nn_boleto": f"{title_id:011d}",
+            "gateway_link": ""
+        }
+
+    def advance(self, fraction: float) -> int:
+        """Change the open value of one title for a fraction of the debtors"""
+        open_titles = [titulo for titulo in self.titles if titulo["status"] == "A"]
+        changed = self.rng.sample(open_titles, int(len(open_titles) * fraction)) if open_titles else []
+        for titulo in changed:
+            titulo["valor_aberto"] = f"{float(titulo['valor_aberto']) + 10:.2f}"
+        self.generation += 1
+        self.filter_cache.clear()
+        return len(changed)
+
+    def debtors(self, min_days: int) -> Dict[str, float]:
+        """cliente_id -> open value of the titles overdue for more than `min_days`"""
+        limit = (self.today - timedelta(days=min_days)).isoformat()
+        totals: Dict[str, float] = {}
+        for titulo in self.titles:
+            if titulo["status"] == "A" and titulo["data_vencimento"] < limit:
+                totals[titulo["cliente_id"]] = totals.get(titulo["cliente_id"], 0) + float(titulo["valor_aberto"])
+        return totals
+
+
+def compare(value: str, oper: str, target: str) -> bool:
+    """IXC filter operator on string fields (numeric comparison when both sides are numbers)"""
+    if oper in ("IN", "in"):
+        return value in {item.strip() for item in target.split(",")}
+    try:
+        left, right = float(value), float(target)
+    except (TypeError, ValueError):
+        left, right = value or "", target or ""
+    return {
+        "=": left == right, "!=": left != right, "<": left < right,
+        "<=": left <= right, ">": left > right, ">=": left >= right
+    }.get(oper, False)
+
+
+def ixc_listing(dataset: ErpDataset, resource: str, payload: dict) -> list:
+    """Filtered and sorted records for an IXC listing payload (cached per payload without page/rp)"""
+    key = json.dumps({"resource": resource, **{k: v for k, v in payload.items() if k not in ("page", "rp")}},
+                     sort_keys=True)
+    if key in dataset.filter_cache:
+        return dataset.filter_cache[key]
+
+    filters = []
+    if payload.get("qtype") and payload.get("oper"):
+        filters.append((payload["qtype"], payload["oper"], str(payload.get("query", ""))))
+    for item in json.loads(payload.get("grid_param") or "[]"):
+        filters.append((item["TB"], item["OP"], str(item["P"])))
+
+    if resource == "cliente":
+        records = list(dataset.clients.values())
+        # Atalho do filtro por id (o connector pede lotes de até 500 ids)
+        for field, oper, target in filters:
+            if field == "cliente.id" and oper.upper() == "IN":
+                records = [dataset.clients[i.strip()] for i in target.split(",") if i.strip() in dataset.clients]
+    else:
+        records = dataset.titles
+
+    for field, oper, target in filters:
+        name = field.split(".")[-1]
+        records = [record for record in records if compare(record.get(name, ""), oper, target)]
+
+    sortname = (payload.get("sortname") or "id").split(".")[-1]
+    records = sorted(
+        records,
+        key=lambda record: int(record[sortname]) if str(record.get(sortname, "")).isdigit() else str(record.get(sortname, "")),
+        reverse=payload.get("sortorder") == "desc"
+    )
+    if len(dataset.filter_cache) >= FILTER_CACHE_SIZE:
+        dataset.filter_cache.pop(next(iter(dataset.filter_cache)))
+    dataset.filter_cache[key] = records
+    return records
+
+
+def create_app(config: Optional[SimulatorConfig] = None) -> FastAPI:
+    config = config or SimulatorConfig()
+    dataset = ErpDataset(config)
+    app = FastAPI(title="Simulador de ERPs")
+    app.state.config = config
+    app.state.dataset = dataset
+
+    @app.middleware("http")
+    async def inject_latency_and_errors(request: Request, call_next):
+        if request.url.path.startswith("/_sim"):
+            return await call_next(request)
+        await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse({"type": "error", "mensagem": "Erro simulado"}, status_code=503)
+        response = await call_next(request)
+        records = int(response.headers.get("X-Sim-Records", "0"))
+        if config.latency_per_1k_ms and records:
+            await asyncio.sleep(config.latency_per_1k_ms * records / 1000 / 1000)
+        return response
+
+    # Controle do simulador
+    @app.get("/_sim/health")
+    async def health():
+        return {"status": "ok", "clients": len(dataset.clients), "titles": len(dataset.titles),
+                "generation": dataset.generation}
+
+    @app.get("/_sim/config")
+    async def get_config():
+        return config.runtime()
+
+    @app.put("/_sim/config")
+    async def update_config(request: Request):
+        for field, value in (await request.json()).items():
+            if field in SimulatorConfig.RUNTIME_FIELDS:
+                setattr(config, field, float(value))
+        return config.runtime()
+
+    @app.post("/_sim/advance")
+    async def advance(fraction: float = 0.02):
+        return {"changed_titles": dataset.advance(fraction), "generation": dataset.generation}
+
+    # IXC (webservice v1: POST com header ixcsoft: listar e Basic Auth ID:HASH)
+    async def ixc_list(resource: str, request: Request):
+        authorization = request.headers.get("Authorization", "")
+        if not authorization.startswith("Basic "):
+            return JSONResponse({"type": "error", "mensagem": "Token inválido"}, status_code=401)
+        payload = await request.json()
+        records = ixc_listing(dataset, resource, payload)
+        page, rp = int(payload.get("page") or 1), int(payload.get("rp") or 20)
+        registros = records[(page - 1) * rp:page * rp]
+        return JSONResponse(
+            {"page": str(page), "total": str(len(records)), "registros": registros},
+            headers={"X-Sim-Records": str(len(registros))}
+        )
+
+    @app.post("/ixc/webservice/v1/fn_areceber")
+    async def ixc_fn_areceber(request: Request):
+        return await ixc_list("fn_areceber", request)
+
+    @app.post("/ixc/webservice/v1/cliente")
+    async def ixc_cliente(request: Request):
+        return await ixc_list("cliente", request)
+
+    def delinquent_rows(min_days: int, build) -> list:
+        return [build(dataset.clients[cliente_id], round(total, 2))
+                for cliente_id, total in dataset.debtors(min_days).items()]
+
+    # MK-Auth (Bearer api_token)
+    @app.get("/mkauth/api/v1/health")
+    async def mkauth_health(request: Request):
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        return {"status": "ok"}
+
+    @app.get("/mkauth/api/v1/clientes/inadimplentes")
+    async def mkauth_debtors(request: Request, dias: int = 5):
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        rows = delinquent_rows(dias, lambda c, total: {
+            "id": c["id"], "name": c["razao"], "cpf": c["cnpj_cpf"], "email": c["email"],
+            "phone": c["telefone_celular"], "street": c["endereco"], "neighborhood": c["bairro"], "debt": total
+        })
+        return JSONResponse({"data": rows}, headers={"X-Sim-Records": str(len(rows))})
+
+    # SGP (X-API-Key / X-API-Secret)
+    def sgp_authorized(request: Request) -> bool:
+        return bool(request.headers.get("X-API-Key") and request.headers.get("X-API-Secret"))
+
+    @app.get("/sgp/api/auth/validate")
+    async def sgp_validate(request: Request):
+        if not sgp_authorized(request):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        return {"valid": True}
+
+    @app.get("/sgp/api/clientes/inadimplentes")
+    async def sgp_debtors(request: Request, dias_atraso: int = 5):
+        if not sgp_authorized(request):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        rows = delinquent_rows(dias_atraso, lambda c, total: {
+            "id": c["id"], "nome_cliente": c["razao"], "cpf": c["cnpj_cpf"], "email_principal": c["email"],
+            "telefone_principal": c["telefone_celular"], "logradouro": c["endereco"], "bairro": c["bairro"],
+            "valor_em_aberto": total
+        })
+        return JSONResponse({"clientes": rows}, headers={"X-Sim-Records": str(len(rows))})
+
+    # RadiusNet (login com usuário/senha devolve o token Bearer)
+    @app.post("/radiusnet/api/login")
+    async def radiusnet_login(request: Request):
+        body = await request.json()
+        if not body.get("username") or not body.get("password"):
+            return JSONResponse({"success": False}, status_code=401)
+        return {"success": True, "token": RADIUSNET_TOKEN}
+
+    @app.get("/radiusnet/api/clientes/inadimplentes")
+    async def radiusnet_debtors(request: Request, dias: int = 5):
+        if request.headers.get("Authorization") != f"Bearer {RADIUSNET_TOKEN}":
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        rows = delinquent_rows(dias, lambda c, total: {
+            "id": c["id"], "nome": c["razao"], "cpf": c["cnpj_cpf"], "email": c["email"],
+            "telefone": c["telefone_celular"], "endereco": c["endereco"], "bairro": c["bairro"],
+            "debito_total": total
+        })
+        return JSONResponse({"clientes": rows}, headers={"X-Sim-Records": str(len(rows))})
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Simulator options (shared with sync_benchmark.py, which starts the simulator itself)"""
+    parser.add_argument("--clients", type=int, default=10000, help="clientes na base do ERP")
+    parser.add_argument("--debtor-ratio", type=float, default=0.3, help="fração de clientes com títulos vencidos há mais de 60 dias")
+    parser.add_argument("--titles-per-client", type=int, default=3, help="média de títulos por cliente")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--latency-per-1k-ms", type=float, default=0, help="latência extra por 1000 registros na resposta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de requisições respondidas com HTTP 503")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def config_from_args(args) -> SimulatorConfig:
+    return SimulatorConfig(
+        clients=args.clients, debtor_ratio=args.debtor_ratio, titles_per_client=args.titles_per_client,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, latency_per_1k_ms=args.latency_per_1k_ms,
+        error_rate=args.error_rate, seed=args.seed
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Simulador local de ERPs")
+    add_config_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    app = create_app(config_from_args(args))
+    health = {"clients": len(app.state.dataset.clients), "titles": len(app.state.dataset.titles)}
+    print(f"🧪 Simulador de ERPs em http://{args.host}:{args.port} ({health['clients']} clientes, {health['titles']} títulos)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
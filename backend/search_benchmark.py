@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Benchmark das buscas entre provedores (nome, CPF, endereço) contra um MongoDB local
+
+Gera um dataset sintético reprodutível (provedores, clientes com CPFs válidos,
+nomes/bairros realistas e dívidas com distribuição log-normal), chama as
+funções dos endpoints de server.py e grava p50/p95/p99 de latência e
+documentos examinados em JSON para comparar versões.
+
+Uso:
+    python search_benchmark.py --clients 2000000 --output bench.json
+    python search_benchmark.py --skip-seed --baseline bench.json
+
+Os documentos examinados vêm do profiler do MongoDB (nível 2), então o banco
+precisa ser um mongod local (não funciona em clusters compartilhados do Atlas).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+# Configuração: o benchmark usa um banco próprio para nunca tocar nos dados reais
+BENCHMARK_DB_NAME = os.environ.get("BENCHMARK_DB_NAME", "controleisp_benchmark")
+INSERT_BATCH_SIZE = 10000
+
+FIRST_NAMES = [
+    "JOSE", "JOAO", "ANTONIO", "FRANCISCO", "CARLOS", "PAULO", "PEDRO", "LUCAS", "LUIZ", "LUIS",
+    "MARCOS", "GABRIEL", "RAFAEL", "DANIEL", "MARCELO", "BRUNO", "EDUARDO", "FELIPE", "THIAGO",
+    "TIAGO", "RODRIGO", "MATEUS", "GUILHERME", "GUSTAVO", "WELLINGTON", "WASHINGTON", "MARIA",
+    "ANA", "FRANCISCA", "ANTONIA", "ADRIANA", "JULIANA", "MARCIA", "FERNANDA", "PATRICIA",
+    "ALINE", "SANDRA", "CAMILA", "AMANDA", "BRUNA", "JESSICA", "LETICIA", "JULIA", "LUCIANA",
+    "VANESSA", "MARIANA", "GABRIELA", "VERA", "KATIA", "CATIA", "HELLEN", "ELEN", "RAIMUNDA"
+]
+SURNAMES = [
+    "SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "SOUSA", "RODRIGUES", "FERREIRA", "ALVES", "PEREIRA",
+    "LIMA", "GOMES", "COSTA", "RIBEIRO", "MARTINS", "CARVALHO", "ALMEIDA", "LOPES", "SOARES",
+    "FERNANDES", "VIEIRA", "BARBOSA", "ROCHA", "DIAS", "NASCIMENTO", "ANDRADE", "MOREIRA",
+    "NUNES", "MARQUES", "MACHADO", "MENDES", "FREITAS", "CARDOSO", "RAMOS", "GONCALVES",
+    "GONÇALVES", "SANTANA", "TEIXEIRA", "ARAUJO", "ARAÚJO", "QUEIROZ", "CONCEIÇÃO", "CAVALCANTI"
+]
+CONNECTORS = ["", "", "", "DA ", "DE ", "DOS "]
+STREET_TYPES = ["Rua", "R.", "Avenida", "Av.", "Travessa", "Tv.", "Alameda", "Estrada"]
+STREET_NAMES = [
+    "das Flores", "Sete de Setembro", "Quinze de Novembro", "Tiradentes", "Dom Pedro II",
+    "Santos Dumont", "Rui Barbosa", "Getúlio Vargas", "Castro Alves", "José Bonifácio",
+    "Marechal Deodoro", "Barão do Rio Branco", "das Palmeiras", "Boa Vista", "São João"
+]
+BAIRROS = [
+    "Centro", "Jardim América", "Jd. América", "Vila Nova", "Vl. Nova", "Boa Vista",
+    "São José", "Santa Cruz", "Planalto", "Industrial", "Parque das Árvores",
+    "Conjunto Habitacional", "Cidade Nova", "Bela Vista", "Santo Antônio", "Aeroporto"
+]
+REASONS = ["Inadimplência", "Mensalidades em atraso", "Equipamento não devolvido", "Importado do IXC"]
+
+
+def make_cpf(rng: random.Random) -> str:
+    """Random CPF with valid check digits (formatted)"""
+    digits = [rng.randint(0, 9) for _ in range(9)]
+    for length in (9, 10):
+        total = sum(d * w for d, w in zip(digits, range(length + 1, 1, -1)))
+        digits.append((total * 10 % 11) % 10)
+    cpf = "".join(map(str, digits))
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+def make_name(rng: random.Random) -> str:
+    name = rng.choice(FIRST_NAMES)
+    if rng.random() < 0.35:
+        name += " " + rng.choice(FIRST_NAMES)
+    for _ in range(rng.choice((1, 2, 2, 3))):
+        name += " " + rng.choice(CONNECTORS) + rng.choice(SURNAMES)
+    # Parte dos ERPs manda o nome em caixa mista
+    return name if rng.random() < 0.7 else name.title()
+
+
+def make_address(rng: random.Random) -> str:
+    address = f"{rng.choice(STREET_TYPES)} {rng.choice(STREET_NAMES)}, {rng.randint(1, 3000)}"
+    if rng.random() < 0.15:
+        address += f" - Apto {rng.randint(1, 40)}"
+    return address
+
+
+def make_client(rng: random.Random, provider_id: str, cpf: str, now: datetime) -> dict:
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "provider_id": provider_id,
+        "name": make_name(rng),
+        "cpf": cpf,
+        "email": "",
+        "phone": f"({rng.randint(11, 99)}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        "address": make_address(rng),
+        "bairro": rng.choice(BAIRROS),
+        # Log-normal: maioria entre R$ 50 e R$ 500, cauda longa de dívidas altas
+        "debt_amount": round(min(rng.lognormvariate(math.log(180), 0.8), 20000), 2),
+        "reason": rng.choice(REASONS),
+        "risk_level": rng.choices([1, 2, 3, 4, 5], weights=[10, 20, 40, 20, 10])[0],
+        "inclusion_date": (now - timedelta(days=rng.randint(1, 1500))).isoformat(),
+        "observations": "",
+        "is_active": rng.random() < 0.9,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+async def seed_dataset(server, args) -> dict:
+    """Drop the benchmark database and generate providers and clients"""
+    rng = random.Random(args.seed)
+    db = server.db
+    now = datetime.now(timezone.utc)
+
+    await db.client.drop_database(db.name)
+
+    providers = [{
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "name": f"Provedor Benchmark {i + 1}",
+        "nome_fantasia": f"Net Benchmark {i + 1}",
+        "cnpj": f"{i:02d}.000.000/0001-00",
+        "phone": "(11) 4000-0000",
+        "email": f"provedor{i + 1}@benchmark.local",
+        "logo_url": None,
+        "is_active": True,
+        "is_blocked": False,
+        "financial_generated": True,
+        "created_at": now.isoformat()
+    } for i in range(args.providers)]
+    await db.providers.insert_many(providers)
+    provider_ids = [p["id"] for p in providers]
+    # Poucos provedores grandes e muitos pequenos
+    provider_cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(provider_ids))))
+
+    # ~20% dos CPFs aparecem em mais de um provedor (o caso que a busca por CPF resolve)
+    cpf_pool = [make_cpf(rng) for _ in range(max(1, int(args.clients * 0.8)))]
+
+    print(f"🌱 Gerando {args.clients} clientes em {args.providers} provedores...")
+    started = time.perf_counter()
+    inserted = 0
+    while inserted < args.clients:
+        batch = []
+        for _ in range(min(INSERT_BATCH_SIZE, args.clients - inserted)):
+            provider_id = rng.choices(provider_ids, cum_weights=provider_cum_weights)[0]
+            client = make_client(rng, provider_id, rng.choice(cpf_pool), now)
+            client.update(server.client_search_fields(client))
+            batch.append(client)
+        await db.clients.insert_many(batch, ordered=False)
+        inserted += len(batch)
+        print(f"   {inserted}/{args.clients} ({time.perf_counter() - started:.0f}s)")
+
+    await server.apply_index_registry()
+    await server.rebuild_negative_registry()
+    return {"providers": args.providers, "clients": args.clients, "seed": args.seed}
+
+
+async def sample_queries(server, args) -> dict:
+    """Deterministic query mix drawn from the seeded data"""
+    rng = random.Random(args.seed + 1)
+    db = server.db
+    # ids são UUIDs gerados pela seed: os primeiros por id formam uma amostra estável
+    sample = await db.clients.find(
+        {"is_active": True},
+        {"_id": 0, "provider_id": 1, "name": 1, "cpf": 1, "address": 1, "bairro": 1}
+    ).sort("id", 1).limit(args.queries).to_list(None)
+    provider_ids = [p["id"] for p in await db.providers.find({}, {"_id": 0, "id": 1}).to_list(None)]
+
+    queries = {"name": [], "name_fuzzy": [], "cpf": [], "address": []}
+    for client in sample:
+        # Quem busca é outro provedor; termos são pedaços do que um atendente digitaria
+        searcher = rng.choice(provider_ids)
+        words = client["name"].split()
+        term = rng.choice([words[0], " ".join(words[:2]), words[-1][:rng.randint(3, max(3, len(words[-1])))]])
+        queries["name"].append((searcher, term))
+        queries["name_fuzzy"].append((searcher, " ".join(words[:2])))
+        # Metade dos CPFs consultados não está negativada em lugar nenhum
+        cpf = client["cpf"] if rng.random() < 0.5 else make_cpf(rng)
+        queries["cpf"].append((searcher, cpf))
+        street = client["address"].split(",")[0]
+        queries["address"].append((searcher, rng.choice([street, f"{street} {client['bairro']}", client["address"]])))
+    return queries
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, examined: list, keys: list, results: list, errors: int) -> dict:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "max": round(max(latencies, default=0.0), 3)
+        },
+        "docs_examined": {
+            "p50": percentile(examined, 50),
+            "p95": percentile(examined, 95),
+            "max": max(examined, default=0)
+        },
+        "keys_examined": {
+            "p50": percentile(keys, 50),
+            "p95": percentile(keys, 95),
+            "max": max(keys, default=0)
+        },
+        "avg_results": round(sum(results) / len(results), 2) if results else 0.0
+    }
+
+
+async def profiled_counts(db, since: datetime) -> tuple:
+    """Sum docsExamined/keysExamined of the profiled operations after `since`"""
+    docs = keys = 0
+    async for entry in db.system.profile.find({"ts": {"$gt": since}, "ns": {"$ne": f"{db.name}.system.profile"}}):
+        docs += entry.get("docsExamined", 0)
+        keys += entry.get("keysExamined", 0)
+    return docs, keys
+
+
+async def run_case(server, call, items: list, profile: bool) -> dict:
+    """Time `call(item)` for every item; optionally collect profiler counters"""
+    from fastapi import HTTPException
+    db = server.db
+    latencies, examined, keys, results = [], [], [], []
+    errors = 0
+
+    for item in items:
+        since = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+        started = time.perf_counter()
+        try:
+            found = await call(item)
+        except HTTPException:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(len(found))
+        if profile:
+            docs, key_count = await profiled_counts(db, since)
+            examined.append(docs)
+            keys.append(key_count)
+
+    return summarize(latencies, examined, keys, results, errors)
+
+
+async def run_benchmark(server, args) -> dict:
+    from fastapi import Response
+    db = server.db
+    queries = await sample_queries(server, args)
+    await server.rebuild_negative_cpf_filter()
+
+    def search(endpoint, search_type, fuzzy=False):
+        async def call(item):
+            provider_id, term = item
+            request = server.ClientSearchRequest(search_term=term, search_type=search_type, fuzzy=fuzzy)
+            return await endpoint(request, Response(), current_user={"user_id": provider_id, "user_type": "provider"})
+        return call
+
+    cases = {
+        "search_name": (search(server.search_clients_by_name, "name"), queries["name"]),
+        "search_name_fuzzy": (search(server.search_clients_by_name, "name", fuzzy=True), queries["name_fuzzy"]),
+        "search_cpf": (search(server.search_clients_by_cpf, "cpf"), queries["cpf"]),
+        "search_address": (search(server.search_clients_by_address, "address"), queries["address"]),
+    }
+
+    # format_cross_provider_clients isolado: páginas de 50 listagens, com e sem cache de provedores
+    pages = []
+    async for entry in db.negative_registry.find({"provider_count": {"$gt": 1}}).sort("_id", 1).limit(args.queries):
+        pages.append(entry["listings"][:server.SEARCH_RESULTS_LIMIT])
+
+    async def format_cold(listings):
+        server.invalidate_provider_card()
+        return await server.format_cross_provider_clients(listings)
+
+    cases["format_cross_provider_clients_cold"] = (format_cold, pages)
+    cases["format_cross_provider_clients_warm"] = (server.format_cross_provider_clients, pages)
+
+    results = {}
+    for name, (call, items) in cases.items():
+        print(f"⏱️  {name} ({len(items)} consultas)")
+        # Aquecimento (cache do WiredTiger e dos provedores), depois latência sem profiler
+        await run_case(server, call, items[:args.warmup], profile=False)
+        results[name] = await run_case(server, call, items, profile=False)
+
+        # Segunda passada com profiler nível 2 só para contar documentos examinados
+        await db.command("profile", 2)
+        profiled = await run_case(server, call, items[:args.profile_queries], profile=True)
+        await db.command("profile", 0)
+        results[name]["docs_examined"] = profiled["docs_examined"]
+        results[name]["keys_examined"] = profiled["keys_examined"]
+
+    return results
+
+
+def compare_with_baseline(results: dict, baseline_path: str, tolerance: float) -> list:
+    """Return the cases whose p95 latency or p95 docs examined regressed past tolerance"""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, key in (("latency_ms", "p95"), ("docs_examined", "p95")):
+            before, after = previous[metric][key], current[metric][key]
+            if before and after > before * tolerance:
+                regressions.append(f"{name}.{metric}.{key}: {before} -> {after}")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark das buscas entre provedores")
+    parser.add_argument("--clients", type=int, default=2000000)
+    parser.add_argument("--providers", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=500, help="consultas por endpoint")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--profile-queries", type=int, default=100, help="consultas medidas com o profiler")
+    parser.add_argument("--skip-seed", action="store_true", help="reaproveita o dataset já gerado")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="regressão se p95 > baseline * tolerância")
+    args = parser.parse_args()
+
+    # server.py lê DB_NAME no import: aponta para o banco do benchmark antes
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["DB_NAME"] = BENCHMARK_DB_NAME
+    sys.path.insert(0, str(Path(__file__).parent))
+    import server
+
+    dataset = {"providers": args.providers, "clients": args.clients, "seed": args.seed}
+    if not args.skip_seed:
+        dataset = await seed_dataset(server, args)
+
+    report = {
+        "revision": git_revision(),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "database": BENCHMARK_DB_NAME,
+        "dataset": dataset,
+        "queries_per_case": args.queries,
+        "results": await run_benchmark(server, args)
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"✅ Resultado salvo em {args.output}")
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare_with_baseline(report["results"], args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regressão: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Nenhuma regressão em relação ao baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,19 +1,32 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne, DeleteOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_preferences import Secondary, SecondaryPreferred, Nearest, Primary
+from bson import SON
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
+import time
+import threading
+import platform
+from collections import OrderedDict
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
 import jwt
 import hashlib
+import math
 import re
+import difflib
+import unicodedata
 import smtplib
 import secrets
 from email.mime.text import MIMEText
@@ -28,12 +41,19 @@ import brazilnum.cpf as cpf_utils
 # EFI BANK INTEGRATION
 from efi_service import get_efi_service
 
+# ERP CONNECTORS (IXC, MK-Auth, SGP, RadiusNet)
+from erp_connectors import (
+    ErpError, ErpDeadlineExceeded, content_hash, get_connector, get_connector_class, http_pool as erp_http_pool
+)
+
 import qrcode
 from io import BytesIO
 import base64
 import json
 import hmac
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -41,6 +61,10 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT
 import io
+import csv
+import itertools
+import shutil
+import tempfile
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import asyncio
@@ -96,10 +120,103 @@ s3_client = boto3.client(
 print(f"[R2-CONFIG] Cliente S3 inicializado com sucesso")
 
 # MongoDB connection
+# Pool, timeouts e compressão configuráveis por ambiente; só as opções
+# definidas são repassadas (o resto fica no padrão do driver).
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+MONGO_CLIENT_OPTIONS = {
+    option: cast(os.environ[env])
+    for option, env, cast in (
+        ("maxPoolSize", "MONGO_MAX_POOL_SIZE", int),
+        ("minPoolSize", "MONGO_MIN_POOL_SIZE", int),
+        ("maxIdleTimeMS", "MONGO_MAX_IDLE_TIME_MS", int),
+        ("waitQueueTimeoutMS", "MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+        ("serverSelectionTimeoutMS", "MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+        ("connectTimeoutMS", "MONGO_CONNECT_TIMEOUT_MS", int),
+        ("socketTimeoutMS", "MONGO_SOCKET_TIMEOUT_MS", int),
+        ("maxConnecting", "MONGO_MAX_CONNECTING", int),
+        ("compressors", "MONGO_COMPRESSORS", str),  # ex.: "zstd,snappy,zlib"
+    )
+    if os.environ.get(env)
+}
+
+
+class MongoPoolMonitor(ConnectionPoolListener):
+    """Connection pool counters (events arrive from driver threads, hence the lock)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "connections_open": 0, "connections_created": 0, "connections_closed": 0,
+            "checked_out": 0, "checked_out_peak": 0, "waiting": 0, "waiting_peak": 0,
+            "checkouts": 0, "checkout_failures": 0, "pool_clears": 0
+        }
+    
+    def _update(self, **deltas):
+        with self.lock:
+            for key, delta in deltas.items():
+                self.counters[key] += delta
+            self.counters["checked_out_peak"] = max(self.counters["checked_out_peak"], self.counters["checked_out"])
+            self.counters["waiting_peak"] = max(self.counters["waiting_peak"], self.counters["waiting"])
+    
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+    
+    def connection_check_out_started(self, event):
+        self._update(waiting=1)
+    
+    def connection_checked_out(self, event):
+        self._update(waiting=-1, checked_out=1, checkouts=1)
+    
+    def connection_check_out_failed(self, event):
+        self._update(waiting=-1, checkout_failures=1)
+    
+    def connection_checked_in(self, event):
+        self._update(checked_out=-1)
+    
+    def connection_created(self, event):
+        self._update(connections_open=1, connections_created=1)
+    
+    def connection_closed(self, event):
+        self._update(connections_open=-1, connections_closed=1)
+    
+    def pool_cleared(self, event):
+        self._update(pool_clears=1)
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+
+
+mongo_pool_monitor = MongoPoolMonitor()
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_pool_monitor], **MONGO_CLIENT_OPTIONS)
 db = client[os.environ['DB_NAME']]
 
+# Leituras de busca, estatísticas e exportação podem ir para secundários do
+# replica set (em standalone, secondaryPreferred lê do primário). Escritas,
+# autenticação e qualquer leitura-após-escrita continuam em `db` (primário).
+MONGO_READ_PREFERENCES = {
+    "primary": Primary, "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred, "nearest": Nearest
+}
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '-1'))  # mínimo 90 se definido
+if MONGO_READ_PREFERENCE == "primary":
+    read_preference = Primary()
+else:
+    read_preference = MONGO_READ_PREFERENCES.get(MONGO_READ_PREFERENCE, SecondaryPreferred)(
+        max_staleness=MONGO_MAX_STALENESS_SECONDS
+    )
+read_db = client.get_database(os.environ['DB_NAME'], read_preference=read_preference)
+
 # Create the main app without a prefix
 app = FastAPI(title="ControleIsp", description="Sistema de Gestão de Clientes Negativos")
 
@@ -140,154 +257,206 @@ security = HTTPBearer()
 # Initialize APScheduler for auto-sync
 scheduler = AsyncIOScheduler()
 
-# Function to run auto-sync task
-async def run_scheduled_auto_sync():
-    """Background task to check and run auto-sync for integrations"""
+# Auto-sync scheduling
+# Um job do APScheduler por integração (id auto_sync_{integration_id}) no
+# horário auto_sync_time. As sincronizações rodam em paralelo, limitadas por
+# AUTO_SYNC_MAX_CONCURRENT no total e AUTO_SYNC_MAX_PER_PROVIDER por provedor.
+# Cada execução agendada também vira um documento em sync_jobs com active_key,
+# o mesmo lock do sync manual e do cron: uma integração que ainda está
+# sincronizando (em qualquer worker) não começa outra execução.
+AUTO_SYNC_MAX_CONCURRENT = int(os.environ.get('AUTO_SYNC_MAX_CONCURRENT', '4'))
+AUTO_SYNC_MAX_PER_PROVIDER = int(os.environ.get('AUTO_SYNC_MAX_PER_PROVIDER', '1'))
+AUTO_SYNC_REFRESH_MINUTES = int(os.environ.get('AUTO_SYNC_REFRESH_MINUTES', '10'))
+auto_sync_semaphore = asyncio.Semaphore(AUTO_SYNC_MAX_CONCURRENT)
+provider_sync_semaphores: Dict[str, asyncio.Semaphore] = {}
+# Contador em scheduler_leases incrementado a cada integração criada/alterada/removida;
+# o líder compara a cada renovação do lease e reagenda na hora (o job local só
+# vale se este worker for o líder)
+AUTO_SYNC_CHANGES_ID = "auto_sync_changes"
+
+
+def auto_sync_job_id(integration_id: str) -> str:
+    return f"auto_sync_{integration_id}"
+
+
+def schedule_integration_auto_sync(integration: dict):
+    """Create, move or remove the integration's auto-sync job to match its settings"""
+    job_id = auto_sync_job_id(integration["id"])
+    if not (integration.get("auto_sync_enabled") and integration.get("is_active", True)):
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+        return
+    
     try:
-        from datetime import datetime, time as dt_time
-        
-        now = datetime.now()
-        current_time_str = now.strftime("%H:%M")
-        
-        print(f"\n{'='*80}")
-        print(f"🕐 SCHEDULER AUTO-SYNC VERIFICANDO às {current_time_str}")
-        print(f"{'='*80}\n")
-        
-        # Find all integrations with auto_sync_enabled = True
-        integrations = await db.provider_integrations.find({
-            "auto_sync_enabled": True,
-            "is_active": True
-        }).to_list(length=None)
-        
-        print(f"📊 Encontradas {len(integrations)} integrações com auto-sync ativo")
-        
-        if not integrations:
-            print("⏭️  Nenhuma integração com auto-sync ativo. Aguardando...")
-            return
-        
-        for integration in integrations:
-            # Check if it's time to sync (compare time only)
-            auto_sync_time = integration.get("auto_sync_time", "05:00")
-            
-            # Allow a 1-minute window for sync (executado a cada 1 minuto)
-            hour, minute = map(int, auto_sync_time.split(":"))
-            sync_time = dt_time(hour, minute)
-            current_time = dt_time(now.hour, now.minute)
-            
-            # Check if current time matches sync time
-            if current_time == sync_time:
-                integration_name = integration.get("display_name", "Sem nome")
-                integration_type = integration["integration_type"]
-                provider_id = integration["provider_id"]
-                
-                print(f"\n🚀 INICIANDO SINCRONIZAÇÃO:")
-                print(f"   📋 Integração: {integration_name}")
-                print(f"   🔧 Tipo: {integration_type.upper()}")
-                print(f"   ⏰ Horário: {auto_sync_time}")
-                
-                try:
-                    # Run sync based on integration type
-                    if integration_type == "ixc":
-                        sync_result = await sync_ixc_data(integration, provider_id)
-                    elif integration_type == "mk-auth":
-                        sync_result = await sync_mkauth_data(integration, provider_id)
-                    elif integration_type == "sgp":
-                        sync_result = await sync_sgp_data(integration, provider_id)
-                    elif integration_type == "radiusnet":
-                        sync_result = await sync_radiusnet_data(integration, provider_id)
-                    else:
-                        sync_result = {
-                            "status": "error",
-                            "message": f"Tipo de integração não suportado: {integration_type}"
-                        }
-                    
-                    # Update last_sync
-                    await db.provider_integrations.update_one(
-                        {"id": integration["id"]},
-                        {
-                            "$set": {
-                                "last_sync": datetime.now(timezone.utc).isoformat(),
-                                "last_sync_status": sync_result.get("status", "error"),
-                                "last_sync_message": sync_result.get("message", ""),
-                                "sync_count": integration.get("sync_count", 0) + 1
-                            }
-                        }
-                    )
-                    
-                    if sync_result.get("status") == "success":
-                        print(f"   ✅ SUCESSO: {sync_result.get('message')}")
-                        print(f"   📊 Clientes sincronizados: {sync_result.get('clients_synced', 0)}")
-                    else:
-                        print(f"   ❌ ERRO: {sync_result.get('message')}")
-                    
-                except Exception as e:
-                    print(f"   ❌ ERRO CRÍTICO: {str(e)}")
-                    await db.provider_integrations.update_one(
-                        {"id": integration["id"]},
-                        {
-                            "$set": {
-                                "last_sync": datetime.now(timezone.utc).isoformat(),
-                                "last_sync_status": "error",
-                                "last_sync_message": f"Erro: {str(e)}"
-                            }
-                        }
-                    )
-        
-        print(f"\n{'='*80}")
-        print(f"✅ SCHEDULER AUTO-SYNC FINALIZADO")
-        print(f"{'='*80}\n")
-        
-    except Exception as e:
-        print(f"\n❌ ERRO NO SCHEDULER AUTO-SYNC: {str(e)}\n")
+        hour, minute = map(int, (integration.get("auto_sync_time") or "05:00").split(":"))
+    except ValueError:
+        print(f"⚠️ Horário de auto-sync inválido na integração {integration['id']}: {integration.get('auto_sync_time')}")
+        return
+    
+    trigger = CronTrigger(hour=hour, minute=minute)
+    job = scheduler.get_job(job_id)
+    if job and str(job.trigger) == str(trigger):
+        return  # Já agendado neste horário
+    
+    scheduler.add_job(
+        run_integration_auto_sync,
+        trigger,
+        args=[integration["id"]],
+        id=job_id,
+        name=f"Auto Sync {integration.get('integration_type', '').upper()} {integration.get('provider_id')}",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300  # Aceita até 5 min de atraso (ex.: reinício do servidor)
+    )
 
 
-# System Configuration Model
-class SystemConfig(BaseModel):
-    backend_url: Optional[str] = None
-    webhook_url: Optional[str] = None
-    updated_by: Optional[str] = None
-    updated_at: Optional[str] = None
+def unschedule_integration_auto_sync(integration_id: str):
+    job_id = auto_sync_job_id(integration_id)
+    if scheduler.get_job(job_id):
+        scheduler.remove_job(job_id)
 
-# Endpoints para Configurações do Sistema
-@api_router.get("/admin/system-config")
-async def get_system_config(current_user=Depends(get_current_admin)):
-    """Get system configuration (admin only)"""
+
+async def register_auto_sync_jobs() -> int:
+    """Rebuild the per-integration jobs from the database (also picks up edits made by other workers)"""
+    integrations = await db.provider_integrations.find(
+        {"auto_sync_enabled": True, "is_active": True},
+        {"_id": 0, "id": 1, "provider_id": 1, "integration_type": 1, "auto_sync_enabled": 1,
+         "auto_sync_time": 1, "is_active": 1}
+    ).to_list(length=None)
+    
+    wanted = set()
+    for integration in integrations:
+        schedule_integration_auto_sync(integration)
+        wanted.add(auto_sync_job_id(integration["id"]))
+    
+    # Remove jobs de integrações desativadas ou removidas
+    for job in scheduler.get_jobs():
+        if job.id.startswith("auto_sync_") and job.id not in wanted:
+            scheduler.remove_job(job.id)
+    return len(wanted)
+
+
+async def notify_auto_sync_change():
+    """Ask the scheduler leader (possibly another worker) to re-read the auto-sync jobs"""
     try:
-        config = await db.system_config.find_one({}) or {}
-        return {
-            "backend_url": config.get("backend_url", ""),
-            "webhook_url": config.get("webhook_url", ""),
-            "updated_by": config.get("updated_by", ""),
-            "updated_at": config.get("updated_at", "")
-        }
+        await db.scheduler_leases.update_one(
+            {"_id": AUTO_SYNC_CHANGES_ID}, {"$inc": {"version": 1}}, upsert=True
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao carregar configurações: {str(e)}")
+        print(f"⚠️ Erro ao avisar o scheduler sobre mudança no auto-sync: {e}")
 
-@api_router.put("/admin/system-config")
-async def update_system_config(
-    config: SystemConfig, 
-    current_user=Depends(get_current_admin)
-):
-    """Update system configuration (admin only)"""
-    try:
-        config_data = {
-            "backend_url": config.backend_url or "",
-            "webhook_url": config.webhook_url or "",
-            "updated_by": current_user.get("email", ""),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
+
+async def auto_sync_changes_version() -> int:
+    changes = await db.scheduler_leases.find_one({"_id": AUTO_SYNC_CHANGES_ID}, {"version": 1})
+    return (changes or {}).get("version", 0)
+
+
+async def run_integration_auto_sync(integration_id: str):
+    """Scheduled sync of one integration, bounded by the global and per-provider caps"""
+    integration = await db.provider_integrations.find_one({"id": integration_id})
+    if not integration or not integration.get("auto_sync_enabled") or not integration.get("is_active"):
+        unschedule_integration_auto_sync(integration_id)
+        return
+    
+    integration_name = integration.get("display_name", "Sem nome")
+    integration_type = integration["integration_type"]
+    provider_id = integration["provider_id"]
+    
+    provider_semaphore = provider_sync_semaphores.setdefault(
+        provider_id, asyncio.Semaphore(AUTO_SYNC_MAX_PER_PROVIDER)
+    )
+    async with provider_semaphore, auto_sync_semaphore:
+        # Lock no Mongo (active_key): falha se já houver sync na fila ou rodando em qualquer worker
+        job = await claim_integration_sync(integration, "scheduled")
+        if job is None:
+            print(f"⏭️ Auto-sync de {integration_name} ignorado: sincronização já na fila ou em andamento")
+            return
         
-        # Upsert configuration
-        await db.system_config.replace_one(
-            {}, 
-            config_data, 
-            upsert=True
+        print(f"\n🚀 INICIANDO SINCRONIZAÇÃO: {integration_name} ({integration_type.upper()}) - horário {integration.get('auto_sync_time')}")
+        sync_result = await run_sync_job(job)
+        if sync_result.get("status") == "success":
+            print(f"   ✅ {integration_name}: {sync_result.get('message')}")
+        else:
+            print(f"   ❌ {integration_name}: {sync_result.get('message')}")
+
+
+# Scheduler leader election
+# Com vários workers/réplicas, só o dono do lease "scheduler" (coleção
+# scheduler_leases) dispara os jobs do APScheduler; os demais mantêm o
+# scheduler pausado e só atendem requisições. O líder renova o lease a cada
+# SCHEDULER_HEARTBEAT_SECONDS; se parar de renovar, outro assume quando o lease
+# expira (SCHEDULER_LEASE_SECONDS).
+SCHEDULER_LEASE_ID = "scheduler"
+SCHEDULER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', '30'))
+SCHEDULER_HEARTBEAT_SECONDS = int(os.environ.get('SCHEDULER_HEARTBEAT_SECONDS', '10'))
+scheduler_instance_id = f"{platform.node()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+scheduler_is_leader = False
+auto_sync_seen_version = None
+
+
+async def try_acquire_scheduler_lease() -> bool:
+    """Acquire or renew the scheduler lease; False when another live instance holds it"""
+    now = datetime.now(timezone.utc)
+    update = {
+        "holder": scheduler_instance_id,
+        "expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS),
+        "heartbeat_at": now
+    }
+    if not scheduler_is_leader:
+        update["acquired_at"] = now  # Novo líder (ou primeiro lease)
+    try:
+        lease = await db.scheduler_leases.find_one_and_update(
+            {
+                "_id": SCHEDULER_LEASE_ID,
+                "$or": [{"holder": scheduler_instance_id}, {"expires_at": {"$lt": now}}]
+            },
+            {"$set": update},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+    except DuplicateKeyError:
+        return False  # Lease existe, válido e de outra instância
+    return lease.get("holder") == scheduler_instance_id
+
+
+async def release_scheduler_lease():
+    """Give up the lease on shutdown so another instance takes over without waiting for expiry"""
+    await db.scheduler_leases.delete_one({"_id": SCHEDULER_LEASE_ID, "holder": scheduler_instance_id})
+
+
+async def scheduler_leader_loop():
+    """Resume the scheduler while this instance holds the lease, pause it otherwise"""
+    global scheduler_is_leader, auto_sync_seen_version
+    while True:
+        try:
+            leader = await try_acquire_scheduler_lease()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sem acesso ao Mongo não dá para garantir exclusividade: para de agendar
+            print(f"❌ Erro ao renovar lease do scheduler: {e}")
+            leader = False
         
-        return {"message": "Configurações atualizadas com sucesso", "config": config_data}
+        if leader:
+            # Ao assumir (pode ter mudado enquanto estava pausado) ou quando outro worker
+            # alterou alguma integração desde a última renovação
+            try:
+                version = await auto_sync_changes_version()
+                if not scheduler_is_leader or version != auto_sync_seen_version:
+                    await register_auto_sync_jobs()
+                    auto_sync_seen_version = version
+            except Exception as e:
+                print(f"❌ Erro ao agendar auto-sync das integrações: {e}")
+        if leader and not scheduler_is_leader:
+            print(f"👑 Instância {scheduler_instance_id} assumiu o scheduler")
+            scheduler.resume()
+        elif not leader and scheduler_is_leader:
+            print(f"⏸️ Instância {scheduler_instance_id} perdeu o scheduler")
+            scheduler.pause()
+        scheduler_is_leader = leader
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao salvar configurações: {str(e)}")
+        await asyncio.sleep(SCHEDULER_HEARTBEAT_SECONDS)
 
 
 # Utility Functions
@@ -689,18 +858,67 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+# Provider status cache
+# Snapshot de bloqueio/ativação/financeiro por provedor, para que
+# get_current_provider e check_subscription_status não leiam o documento
+# inteiro do provedor a cada requisição. Invalidado pelas rotas que alteram
+# esses campos; o TTL limita a defasagem de escritas feitas por outro processo.
+PROVIDER_STATUS_FIELDS = ("is_blocked", "blocked_reason", "is_active", "financial_generated")
+PROVIDER_STATUS_CACHE_TTL = int(os.environ.get('PROVIDER_STATUS_CACHE_TTL', '30'))  # segundos
+PROVIDER_STATUS_CACHE_SIZE = int(os.environ.get('PROVIDER_STATUS_CACHE_SIZE', '5000'))
+provider_status_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# (provider_id, snapshot) resolvido por get_current_provider na requisição atual
+request_provider_status: ContextVar[Optional[tuple]] = ContextVar("request_provider_status", default=None)
+
+
+async def get_provider_status(provider_id: str) -> Optional[dict]:
+    """Return the cached status snapshot of a provider (None if it does not exist)"""
+    now = time.monotonic()
+    cached = provider_status_cache.get(provider_id)
+    if cached and cached[0] > now:
+        provider_status_cache.move_to_end(provider_id)
+        return cached[1]
+    
+    projection = {"_id": 0, **{field: 1 for field in PROVIDER_STATUS_FIELDS}}
+    provider = await db.providers.find_one({"id": provider_id}, projection)
+    if provider is None:
+        provider_status_cache.pop(provider_id, None)
+        return None
+    
+    snapshot = {
+        "is_blocked": provider.get("is_blocked", False),
+        "blocked_reason": provider.get("blocked_reason"),
+        "is_active": provider.get("is_active", True),
+        "financial_generated": provider.get("financial_generated", False)
+    }
+    provider_status_cache[provider_id] = (now + PROVIDER_STATUS_CACHE_TTL, snapshot)
+    provider_status_cache.move_to_end(provider_id)
+    while len(provider_status_cache) > PROVIDER_STATUS_CACHE_SIZE:
+        provider_status_cache.popitem(last=False)
+    return snapshot
+
+
+def invalidate_provider_status(provider_id: Optional[str] = None):
+    """Drop one provider status from the cache, or every status when no id is given"""
+    if provider_id is None:
+        provider_status_cache.clear()
+    else:
+        provider_status_cache.pop(provider_id, None)
+
+
 async def get_current_provider(current_user=Depends(get_current_user)):
     """Get current provider and verify if not blocked"""
     if current_user["user_type"] != "provider":
         raise HTTPException(status_code=403, detail="Acesso negado")
     
     # Check if provider is blocked
-    provider = await db.providers.find_one({"id": current_user["user_id"]})
+    provider = await get_provider_status(current_user["user_id"])
     if not provider:
         raise HTTPException(status_code=404, detail="Provedor não encontrado")
+    request_provider_status.set((current_user["user_id"], provider))
     
     if provider.get("is_blocked", False):
-        blocked_reason = provider.get("blocked_reason", "Conta bloqueada pelo administrador")
+        blocked_reason = provider.get("blocked_reason") or "Conta bloqueada pelo administrador"
         raise HTTPException(status_code=403, detail=f"Conta bloqueada: {blocked_reason}")
     
     if not provider.get("is_active", True):
@@ -719,6 +937,55 @@ async def get_current_admin(current_user=Depends(get_current_user)):
     return current_user
 
 
+# System Configuration Model
+class SystemConfig(BaseModel):
+    backend_url: Optional[str] = None
+    webhook_url: Optional[str] = None
+    updated_by: Optional[str] = None
+    updated_at: Optional[str] = None
+
+# Endpoints para Configurações do Sistema
+@api_router.get("/admin/system-config")
+async def get_system_config(current_user=Depends(get_current_admin)):
+    """Get system configuration (admin only)"""
+    try:
+        config = await db.system_config.find_one({}) or {}
+        return {
+            "backend_url": config.get("backend_url", ""),
+            "webhook_url": config.get("webhook_url", ""),
+            "updated_by": config.get("updated_by", ""),
+            "updated_at": config.get("updated_at", "")
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao carregar configurações: {str(e)}")
+
+@api_router.put("/admin/system-config")
+async def update_system_config(
+    config: SystemConfig, 
+    current_user=Depends(get_current_admin)
+):
+    """Update system configuration (admin only)"""
+    try:
+        config_data = {
+            "backend_url": config.backend_url or "",
+            "webhook_url": config.webhook_url or "",
+            "updated_by": current_user.get("email", ""),
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        # Upsert configuration
+        await db.system_config.replace_one(
+            {}, 
+            config_data, 
+            upsert=True
+        )
+        
+        return {"message": "Configurações atualizadas com sucesso", "config": config_data}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar configurações: {str(e)}")
+
+
 # Models
 class AdminCreate(BaseModel):
     username: str
@@ -994,6 +1261,21 @@ class CrossProviderClient(BaseModel):
 class ClientSearchRequest(BaseModel):
     search_term: str
     search_type: str  # "name", "cpf", "address"
+    cursor: Optional[str] = None  # Valor do header X-Next-Cursor da página anterior
+    limit: int = 50  # Máximo de SEARCH_RESULTS_LIMIT por página
+    include_total: bool = False  # Preenche o header X-Total-Estimate
+    fuzzy: bool = False  # Busca por nome: compara pela chave fonética
+
+
+class NegativeVerdict(BaseModel):
+    cpf: str
+    is_negative: bool
+    provider_count: int = 0  # Outros provedores que negativaram o CPF
+    total_debt: float = 0.0
+    max_debt: float = 0.0
+    max_risk_level: int = 0
+    oldest_inclusion_date: Optional[str] = None
+    listed_by_current_provider: bool = False
 
 class PaymentReminder(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -1214,6 +1496,7 @@ async def accept_terms(current_user=Depends(get_current_provider)):
                         "financial_generated": False
                     }}
                 )
+                invalidate_provider_status(provider_id)
                 
                 error_msg = result.get("error", "Erro desconhecido ao gerar parcelas")
                 raise HTTPException(
@@ -1525,6 +1808,7 @@ async def generate_automatic_installments(provider_id: str, due_day: int):
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        invalidate_provider_status(provider_id)
         
         print(f"✅ {len(generated_payments)} parcelas geradas com sucesso para provider {provider_id}")
         
@@ -1672,8 +1956,14 @@ async def is_payment_required():
 
 async def check_subscription_status(provider_id: str):
     """Check if provider has active subscription (including promotional)"""
+    # Reuse the status get_current_provider already resolved for this request
+    resolved = request_provider_status.get()
+    if resolved and resolved[0] == provider_id:
+        provider = resolved[1]
+    else:
+        provider = await get_provider_status(provider_id)
+    
     # New system: Check if provider is blocked due to overdue payments
-    provider = await db.providers.find_one({"id": provider_id})
     if not provider:
         return False
     
@@ -1831,7 +2121,7 @@ async def get_providers(current_user=Depends(get_current_user)):
     if current_user["user_type"] != "admin":
         raise HTTPException(status_code=403, detail="Acesso negado")
     
-    providers = await db.providers.find({"is_active": True}).to_list(1000)
+    providers = await read_db.providers.find({"is_active": True}).to_list(1000)
     provider_stats = []
     
     for provider in providers:
@@ -1857,7 +2147,7 @@ async def get_providers(current_user=Depends(get_current_user)):
             }}
         ]
         
-        client_stats = await db.clients.aggregate(pipeline).to_list(1)
+        client_stats = await read_db.clients.aggregate(pipeline).to_list(1)
         
         if client_stats:
             stats = client_stats[0]
@@ -1873,7 +2163,7 @@ async def get_providers(current_user=Depends(get_current_user)):
         
         # Get subscription information
         current_time = datetime.now(timezone.utc)
-        subscription = await db.subscriptions.find_one(
+        subscription = await read_db.subscriptions.find_one(
             {"provider_id": provider["id"]},
             sort=[("created_at", -1)]
         )
@@ -2055,6 +2345,8 @@ async def update_provider_by_admin(provider_id: str, provider_data: dict, curren
             {"id": provider_id},
             {"$set": update_data}
         )
+        invalidate_provider_card(provider_id)
+        invalidate_provider_status(provider_id)
         
         return {"success": True, "message": "Provedor atualizado com sucesso"}
         
@@ -2081,6 +2373,8 @@ async def delete_provider_by_admin(provider_id: str, current_user=Depends(get_cu
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        invalidate_provider_card(provider_id)
+        invalidate_provider_status(provider_id)
         
         return {"success": True, "message": "Provedor desativado com sucesso"}
         
@@ -2113,6 +2407,7 @@ async def block_provider(provider_id: str, block_data: ProviderBlockRequest, cur
         {"id": provider_id},
         {"$set": update_data}
     )
+    invalidate_provider_status(provider_id)
     
     if result.modified_count > 0:
         return ProviderActionResponse(
@@ -2146,6 +2441,7 @@ async def unblock_provider(provider_id: str, current_user=Depends(get_current_us
         {"id": provider_id},
         {"$set": update_data}
     )
+    invalidate_provider_status(provider_id)
     
     if result.modified_count > 0:
         return ProviderActionResponse(
@@ -2290,6 +2586,8 @@ async def delete_provider_admin(provider_id: str, current_user=Depends(get_curre
         {"id": provider_id},
         {"$set": {"is_active": False, "deleted_at": datetime.now(timezone.utc)}}
     )
+    invalidate_provider_card(provider_id)
+    invalidate_provider_status(provider_id)
     
     return {"message": "Provedor excluído com sucesso", "provider_id": provider_id}
 
@@ -2356,6 +2654,8 @@ async def update_provider(
             {"id": provider_id},
             {"$set": update_data}
         )
+        invalidate_provider_card(provider_id)
+        invalidate_provider_status(provider_id)
         
         if result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Nenhuma alteração foi feita")
@@ -2562,6 +2862,7 @@ async def generate_provider_financial(
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        invalidate_provider_status(provider_id)
         
         return {
             "success": True,
@@ -2692,6 +2993,8 @@ async def clear_all_providers(current_user=Depends(get_current_admin)):
         
         # Delete all providers
         result = await db.providers.delete_many({})
+        invalidate_provider_card()
+        invalidate_provider_status()
         
         return {
             "success": True,
@@ -2720,6 +3023,7 @@ async def clear_all_clients(current_user=Depends(get_current_admin)):
         
         # Delete all clients
         result = await db.clients.delete_many({})
+        await db.negative_registry.delete_many({})
         
         return {
             "success": True,
@@ -2815,7 +3119,10 @@ async def clear_entire_database(current_user=Depends(get_current_admin)):
         
         # Delete everything except admin users
         providers_result = await db.providers.delete_many({})
+        invalidate_provider_card()
+        invalidate_provider_status()
         clients_result = await db.clients.delete_many({})
+        await db.negative_registry.delete_many({})
         subscriptions_result = await db.subscriptions.delete_many({})
         notifications_result = await db.notifications.delete_many({})
         reads_result = await db.notification_reads.delete_many({})
@@ -2854,14 +3161,14 @@ async def get_database_stats(current_user=Depends(get_current_admin)):
     
     try:
         stats = {
-            "providers": await db.providers.count_documents({}),
-            "active_providers": await db.providers.count_documents({"is_active": True}),
-            "clients": await db.clients.count_documents({}),
-            "subscriptions": await db.subscriptions.count_documents({}),
-            "active_subscriptions": await db.subscriptions.count_documents({"paid": True}),
-            "notifications": await db.notifications.count_documents({}),
-            "notification_reads": await db.notification_reads.count_documents({}),
-            "payment_reminders": await db.payment_reminders.count_documents({})
+            "providers": await read_db.providers.count_documents({}),
+            "active_providers": await read_db.providers.count_documents({"is_active": True}),
+            "clients": await read_db.clients.count_documents({}),
+            "subscriptions": await read_db.subscriptions.count_documents({}),
+            "active_subscriptions": await read_db.subscriptions.count_documents({"paid": True}),
+            "notifications": await read_db.notifications.count_documents({}),
+            "notification_reads": await read_db.notification_reads.count_documents({}),
+            "payment_reminders": await read_db.payment_reminders.count_documents({})
         }
         
         return {
@@ -2873,6 +3180,41 @@ async def get_database_stats(current_user=Depends(get_current_admin)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas: {str(e)}")
 
+@api_router.get("/admin/database/pool")
+async def get_database_pool_stats(current_user=Depends(get_current_admin)):
+    """Connection pool utilization and routing configuration"""
+    counters = mongo_pool_monitor.snapshot()
+    max_pool_size = MONGO_CLIENT_OPTIONS.get("maxPoolSize", 100)
+    # Counters are summed over every server in the topology
+    nodes = [f"{host}:{port}" for host, port in client.nodes]
+    return {
+        "pool": counters,
+        "utilization": round(counters["checked_out"] / (max_pool_size * max(1, len(nodes))), 4),
+        "max_pool_size": max_pool_size,
+        "client_options": MONGO_CLIENT_OPTIONS,
+        "read_preference": read_db.read_preference.document,
+        "nodes": nodes
+    }
+
+
+@api_router.get("/admin/scheduler/status")
+async def get_scheduler_status(current_user=Depends(get_current_admin)):
+    """Which instance owns the scheduler lease and the jobs registered in this instance"""
+    lease = await db.scheduler_leases.find_one({"_id": SCHEDULER_LEASE_ID})
+    if lease:
+        lease = {key: value.isoformat() if isinstance(value, datetime) else value
+                 for key, value in lease.items() if key != "_id"}
+    return {
+        "instance_id": scheduler_instance_id,
+        "is_leader": scheduler_is_leader,
+        "lease": lease,
+        "jobs": [
+            {"id": job.id, "name": job.name,
+             "next_run_time": job.next_run_time.isoformat() if job.next_run_time else None}
+            for job in scheduler.get_jobs()
+        ]
+    }
+
 @api_router.delete("/admin/database/reset")
 async def reset_database(current_user=Depends(get_current_admin)):
     """DANGEROUS: Reset entire database - USE WITH EXTREME CAUTION"""
@@ -2885,6 +3227,7 @@ async def reset_database(current_user=Depends(get_current_admin)):
             collection = getattr(db, collection_name)
             delete_result = await collection.delete_many({})
             results[collection_name] = delete_result.deleted_count
+        await db.negative_registry.delete_many({})
         
         return {
             "success": True,
@@ -2938,6 +3281,7 @@ async def delete_orphaned_clients(current_user=Depends(get_current_admin)):
         delete_result = await db.clients.delete_many({
             "provider_id": {"$nin": list(active_provider_ids)}
         })
+        await rebuild_negative_registry()
         
         return {
             "success": True,
@@ -2992,9 +3336,12 @@ async def delete_inactive_providers(current_user=Depends(get_current_admin)):
         clients_deleted = await db.clients.delete_many({
             "provider_id": {"$in": inactive_provider_ids}
         })
+        await rebuild_negative_registry()
         
         # Delete the providers
         providers_deleted = await db.providers.delete_many({"is_active": False})
+        invalidate_provider_card()
+        invalidate_provider_status()
         
         return {
             "success": True,
@@ -3027,7 +3374,7 @@ async def generate_database_backup(current_user=Depends(get_current_admin)):
         
         for collection_name in collections_to_backup:
             try:
-                collection = getattr(db, collection_name)
+                collection = getattr(read_db, collection_name)
                 documents = await collection.find({}).to_list(length=None)
                 
                 # Clean documents for JSON serialization
@@ -3101,6 +3448,9 @@ async def restore_database_backup(file: UploadFile = File(...), current_user=Dep
                     
                     # Get collection reference
                     collection = getattr(db, collection_name)
+                    if collection_name == "providers":
+                        invalidate_provider_card()
+                        invalidate_provider_status()
                     
                     # Clear existing data (DANGER!)
                     delete_result = await collection.delete_many({})
@@ -3114,6 +3464,10 @@ async def restore_database_backup(file: UploadFile = File(...), current_user=Dep
                             if "id" not in doc:
                                 doc["id"] = str(uuid.uuid4())
                             
+                            # Recompute normalized search keys for restored clients
+                            if collection_name == "clients":
+                                doc.update(client_search_fields(doc))
+                            
                             # Convert ISO date strings back to datetime objects
                             for key, value in doc.items():
                                 if isinstance(value, str):
@@ -3156,6 +3510,9 @@ async def restore_database_backup(file: UploadFile = File(...), current_user=Dep
                     "status": f"error: {str(e)}"
                 }
         
+        if "clients" in backup_data["collections"]:
+            await rebuild_negative_registry()
+        
         return {
             "success": True,
             "message": "Backup restaurado com sucesso",
@@ -3175,7 +3532,7 @@ async def get_admin_revenue_stats(current_user=Depends(get_current_admin)):
     
     try:
         # Get all paid subscriptions
-        subscriptions = await db.subscriptions.find({
+        subscriptions = await read_db.subscriptions.find({
             "payment_status": {"$in": ["active", "paid", "approved"]}
         }).to_list(length=None)
         
@@ -3230,12 +3587,12 @@ async def get_provider_clients_admin(provider_id: str, current_user=Depends(get_
         raise HTTPException(status_code=403, detail="Acesso negado")
     
     # Check if provider exists
-    provider = await db.providers.find_one({"id": provider_id, "is_active": True})
+    provider = await read_db.providers.find_one({"id": provider_id, "is_active": True})
     if not provider:
         raise HTTPException(status_code=404, detail="Provedor não encontrado")
     
     # Get all clients for this provider
-    clients = await db.clients.find({
+    clients = await read_db.clients.find({
         "provider_id": provider_id,
         "is_active": True
     }).to_list(1000)
@@ -3971,9 +4328,9 @@ async def create_client(client_data: ClientCreate, request: Request, current_use
         raise HTTPException(status_code=400, detail="Nível de risco deve estar entre 1 e 5")
     
     existing_client = await db.clients.find_one({
-        "provider_id": current_user["user_id"],
-        "cpf": client_data.cpf,
-        "is_active": True
+        "cpf_digits": clean_cpf(client_data.cpf),
+        "is_active": True,
+        "provider_id": current_user["user_id"]
     })
     if existing_client:
         raise HTTPException(
@@ -4003,8 +4360,10 @@ async def create_client(client_data: ClientCreate, request: Request, current_use
     )
     
     client_dict = client.dict()
+    client_dict.update(client_search_fields(client_dict))
     # inclusion_date is already a string, no need to convert
     await db.clients.insert_one(client_dict)
+    await refresh_negative_registry([client_dict["cpf_digits"]])
     return client
 
 
@@ -4020,7 +4379,9 @@ async def get_client_contract(client_id: str, current_user=Depends(get_current_p
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
-    provider = await db.providers.find_one({"id": current_user["user_id"]})
+    provider = await get_provider_card(current_user["user_id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provedor não encontrado")
     
     # Novo template de contrato versão 3.0 com LGPD
     # Obter data de contratação do provedor (data de criação da conta)
@@ -4551,7 +4912,7 @@ async def generate_whatsapp_charge_message(client_id: str, current_user=Depends(
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
     # Buscar dados do provedor
-    provider = await db.providers.find_one({"id": current_user["user_id"]})
+    provider = await get_provider_card(current_user["user_id"])
     
     if not provider:
         raise HTTPException(status_code=404, detail="Provedor não encontrado")
@@ -4706,6 +5067,7 @@ async def delete_client(client_id: str, current_user=Depends(get_current_provide
         {"id": client_id},
         {"$set": {"is_active": False, "deleted_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await refresh_negative_registry([client_cpf_digits(client)])
     
     return {"success": True, "message": f"Cliente {client['name']} removido com sucesso"}
 
@@ -4809,6 +5171,7 @@ async def update_client_debt(client_id: str, debt_data: ClientDebtUpdate, curren
     )
     
     if result.modified_count > 0:
+        await refresh_negative_registry([client_cpf_digits(client)])
         return {
             "success": True,
             "message": f"Valor da dívida do cliente {client['name']} atualizado com sucesso",
@@ -4820,37 +5183,390 @@ async def update_client_debt(client_id: str, debt_data: ClientDebtUpdate, curren
         raise HTTPException(status_code=500, detail="Erro ao atualizar valor da dívida")
 
 
-@api_router.post("/provider/search/clients/name", response_model=List[CrossProviderClient])
-async def search_clients_by_name(search_request: ClientSearchRequest, current_user=Depends(get_current_provider)):
-    """Search clients by name from other providers"""
-    
-    # Check if provider has active subscription
-    has_active_subscription = await check_subscription_status(current_user["user_id"])
-    if not has_active_subscription:
-        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
-    
-    search_term = search_request.search_term.strip()
-    if not search_term or len(search_term) < 3:
-        raise HTTPException(status_code=400, detail="Nome deve ter pelo menos 3 caracteres")
-    
-    # Search clients from OTHER providers (not current provider)
-    clients = await db.clients.find({
-        "provider_id": {"$ne": current_user["user_id"]},  # Not from current provider
-        "is_active": True,
-        "name": {"$regex": search_term, "$options": "i"}  # Case insensitive search
-    }).to_list(50)  # Limit results
+# Client search keys
+# Campos normalizados gravados junto com cada cliente para que as buscas entre
+# provedores sejam leituras por índice em vez de regex/collection scan.
+# Incrementar CLIENT_SEARCH_FIELDS_VERSION sempre que client_search_fields mudar:
+# o backfill do startup recalcula os documentos com versão anterior.
+CLIENT_SEARCH_FIELDS_VERSION = 5
+CLIENT_SEARCH_SOURCE_PROJECTION = {"_id": 1, "cpf": 1, "name": 1, "address": 1, "bairro": 1}
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_TOTAL_ESTIMATE_CAP = 1000  # Contagens param aqui ("1000+")
+CROSS_PROVIDER_PROJECTION = {
+    "_id": 0, "id": 1, "provider_id": 1, "name": 1, "cpf": 1, "address": 1, "bairro": 1,
+    "debt_amount": 1, "reason": 1, "inclusion_date": 1, "risk_level": 1, "provider_notes": 1
+}
+
+# Abreviações comuns de logradouro/bairro (já sem acento e em maiúsculas)
+ADDRESS_ABBREVIATIONS = {
+    "R": "RUA", "AV": "AVENIDA", "AVN": "AVENIDA", "AVEN": "AVENIDA",
+    "TV": "TRAVESSA", "TRAV": "TRAVESSA", "AL": "ALAMEDA", "ROD": "RODOVIA",
+    "EST": "ESTRADA", "ESTR": "ESTRADA", "PC": "PRACA", "PCA": "PRACA", "PRC": "PRACA",
+    "BC": "BECO", "LG": "LARGO", "LGO": "LARGO", "VL": "VILA", "JD": "JARDIM",
+    "JARD": "JARDIM", "PQ": "PARQUE", "PQE": "PARQUE", "CJ": "CONJUNTO", "CONJ": "CONJUNTO",
+    "RES": "RESIDENCIAL", "STA": "SANTA", "STO": "SANTO", "DR": "DOUTOR",
+    "PROF": "PROFESSOR", "CEL": "CORONEL", "GAL": "GENERAL", "GEN": "GENERAL"
+}
+ADDRESS_STOPWORDS = {"DE", "DA", "DO", "DAS", "DOS", "E"}
+ADDRESS_NUMBER_MARKERS = {"N", "NO", "NUM", "NUMERO"}
+
+# Chave fonética pt-BR: regras aplicadas em ordem sobre cada palavra já sem
+# acento, para que grafias como Luiz/Luis, Souza/Sousa e Thiago/Tiago gerem o
+# mesmo código
+PHONETIC_NAME_STOPWORDS = {"DA", "DE", "DO", "DAS", "DOS", "E"}
+PHONETIC_RULES = [
+    (re.compile(r"Y"), "I"),
+    (re.compile(r"W"), "V"),
+    (re.compile(r"(.)\1+"), r"\1"),
+    (re.compile(r"PH"), "F"),
+    (re.compile(r"TH"), "T"),
+    (re.compile(r"[CS]H"), "X"),
+    (re.compile(r"LH"), "L"),
+    (re.compile(r"NH"), "N"),
+    (re.compile(r"SC(?=[EI])"), "S"),
+    (re.compile(r"C(?=[EI])"), "S"),
+    (re.compile(r"QU?|CK?"), "K"),
+    (re.compile(r"G(?=[EI])"), "J"),
+    (re.compile(r"GU(?=[EI])"), "G"),
+    (re.compile(r"Z"), "S"),
+    (re.compile(r"H"), ""),
+    (re.compile(r"M(?=[^AEIOU]|$)"), "N"),
+    (re.compile(r"L(?=[^AEIOU]|$)"), "U"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+FUZZY_CANDIDATE_LIMIT = 500  # Candidatos ranqueados por similaridade na busca fuzzy
+
+
+def fold_search_text(text: str) -> str:
+    """Uppercase, strip accents/punctuation and collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", str(text or ""))
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r'[^0-9A-Za-z]+', ' ', without_accents).upper().split())
+
+
+def search_trigrams(folded_text: str) -> List[str]:
+    """Distinct 3-character substrings of an already folded text"""
+    return sorted({folded_text[i:i + 3] for i in range(len(folded_text) - 2)})
+
+
+def address_search_tokens(text: str) -> List[str]:
+    """Fold an address fragment and expand abbreviations ("R." -> RUA, "Av." -> AVENIDA)"""
+    tokens = []
+    for token in fold_search_text(text).split():
+        token = ADDRESS_ABBREVIATIONS.get(token, token)
+        if token not in ADDRESS_STOPWORDS and token not in ADDRESS_NUMBER_MARKERS:
+            tokens.append(token)
+    return tokens
+
+
+def parse_client_address(address: str, bairro: str = "") -> dict:
+    """Split a free-text address into street, number and bairro search keys"""
+    # The number is only split off when something proves it is the house number:
+    # a comma or " - " before it ("Rua X, 123 - apto 4"), a marker ("Rua X N 123")
+    # or being the last word ("Rua X 123"). Numeric street names such as
+    # "Rua 25 de Março" or "Rua 7 de Setembro" stay whole.
+    head, separator, tail = address.partition(",")
+    if not separator:
+        head, separator, tail = address.partition(" - ")
+    street_tokens = address_search_tokens(head)
+    number = ""
+    if separator:
+        number = next((t for t in address_search_tokens(tail) if t[0].isdigit()), "")
+    else:
+        words = fold_search_text(head).split()
+        marker = next((i for i, word in enumerate(words[1:-1], 1)
+                       if word in ADDRESS_NUMBER_MARKERS and words[i + 1][0].isdigit()), None)
+        if marker is not None:
+            number = words[marker + 1]
+            street_tokens = address_search_tokens(" ".join(words[:marker]))
+        elif len(words) > 2 and words[-1][0].isdigit():
+            number = words[-1]
+            street_tokens = address_search_tokens(" ".join(words[:-1]))
+    
+    bairro_tokens = address_search_tokens(bairro)
+    all_tokens = set(address_search_tokens(address)) | set(bairro_tokens)
     
-    return await format_cross_provider_clients(clients)
+    return {
+        "address_street": " ".join(street_tokens),
+        "address_number": number,
+        "address_bairro": " ".join(bairro_tokens),
+        "address_tokens": sorted(all_tokens)
+    }
 
 
-@api_router.post("/provider/search/clients/cpf", response_model=List[CrossProviderClient])
-async def search_clients_by_cpf(search_request: ClientSearchRequest, current_user=Depends(get_current_provider)):
-    """Search clients by CPF from other providers"""
-    
-    # Check if provider has active subscription
-    has_active_subscription = await check_subscription_status(current_user["user_id"])
-    if not has_active_subscription:
-        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
+def phonetic_word_code(word: str) -> str:
+    """Brazilian-Portuguese phonetic code of one folded word"""
+    for pattern, replacement in PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def phonetic_name_key(name: str) -> List[str]:
+    """Phonetic codes of every meaningful word of a name, in order"""
+    # Ç é tratado como C (como chega dos ERPs sem acento): Gonçalves == Goncalves
+    folded = fold_search_text(name)
+    return [
+        phonetic_word_code(word) for word in folded.split()
+        if word not in PHONETIC_NAME_STOPWORDS and not word.isdigit()
+    ]
+
+
+def name_similarity(folded_term: str, name_folded: str) -> float:
+    """Average best per-word similarity (0..1) of the search term against a name"""
+    term_words = folded_term.split()
+    name_words = name_folded.split() or [""]
+    if not term_words:
+        return 0.0
+    return sum(
+        max(difflib.SequenceMatcher(None, term_word, name_word).ratio() for name_word in name_words)
+        for term_word in term_words
+    ) / len(term_words)
+
+
+def client_search_fields(client: dict) -> dict:
+    """Build the normalized search keys stored alongside a client document"""
+    name_folded = fold_search_text(client.get("name"))
+    return {
+        "cpf_digits": clean_cpf(str(client.get("cpf") or "")),
+        "name_folded": name_folded,
+        "name_trigrams": search_trigrams(name_folded),
+        "name_phonetic": sorted(set(phonetic_name_key(client.get("name")))),
+        **parse_client_address(client.get("address") or "", client.get("bairro") or ""),
+        "search_fields_version": CLIENT_SEARCH_FIELDS_VERSION
+    }
+
+
+async def backfill_client_search_fields(batch_size: int = 1000) -> int:
+    """Migrate existing clients that are missing (or have outdated) search keys"""
+    query = {
+        "$or": [
+            {"search_fields_version": {"$exists": False}},
+            {"search_fields_version": {"$lt": CLIENT_SEARCH_FIELDS_VERSION}}
+        ]
+    }
+    
+    migrated = 0
+    while True:
+        batch = await db.clients.find(query, CLIENT_SEARCH_SOURCE_PROJECTION).to_list(batch_size)
+        if not batch:
+            break
+        
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": client_search_fields(doc)})
+            for doc in batch
+        ]
+        await db.clients.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+    
+    return migrated
+
+
+# Search pagination
+# Keyset pagination: o cursor opaco guarda o tier de ranking e os valores da
+# chave de ordenação do último item, então qualquer página custa o mesmo que a
+# primeira (nada de skip). O próximo cursor vai no header X-Next-Cursor para
+# manter o corpo da resposta como List[CrossProviderClient].
+def encode_search_cursor(tier: int, keys: list) -> str:
+    """Opaque cursor for the item after which the next page starts"""
+    raw = json.dumps({"t": tier, "k": keys}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: Optional[str], key_count: int, tier_count: int = 1) -> tuple:
+    """Return (tier, keys) from a cursor; (0, None) for the first page"""
+    if not cursor:
+        return 0, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        tier, keys = data["t"], data["k"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    # Keys go straight into the keyset filter: only scalars, never operator documents
+    valid = (
+        type(tier) is int and 0 <= tier < tier_count
+        and isinstance(keys, list) and len(keys) == key_count
+        and all(key is None or type(key) in (str, int, float) for key in keys)
+    )
+    if not valid:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    return tier, keys
+
+
+def keyset_after(fields: list, values: list) -> dict:
+    """Filter for documents strictly after `values` in ascending `fields` order"""
+    clauses = []
+    for i, field in enumerate(fields):
+        clause = dict(zip(fields[:i], values[:i]))
+        clause[field] = {"$gt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def search_page_size(search_request: ClientSearchRequest) -> int:
+    return max(1, min(search_request.limit, SEARCH_RESULTS_LIMIT))
+
+
+def set_search_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int]):
+    """Expose the next cursor and the (capped) total estimate as headers"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Estimate"] = (
+            f"{SEARCH_TOTAL_ESTIMATE_CAP}+" if total >= SEARCH_TOTAL_ESTIMATE_CAP else str(total)
+        )
+
+
+async def fetch_search_page(collection, tier_queries: list, sort_fields: list, projection: dict,
+                            cursor: Optional[str], page_size: int) -> tuple:
+    """One keyset page over ranked tiers (each sorted by sort_fields); returns (docs, next_cursor)"""
+    start_tier, after = decode_search_cursor(cursor, len(sort_fields), len(tier_queries))
+    sort_order = [(field, 1) for field in sort_fields]
+    page = []  # (tier, doc)
+    
+    for tier in range(start_tier, len(tier_queries)):
+        query = tier_queries[tier]
+        if tier == start_tier and after is not None:
+            query = {"$and": [query, keyset_after(sort_fields, after)]}
+        # One extra document tells whether there is a next page
+        docs = await collection.find(query, projection).sort(sort_order).to_list(page_size + 1 - len(page))
+        page.extend((tier, doc) for doc in docs)
+        if len(page) > page_size:
+            break
+    
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last_tier, last_doc = page[-1]
+        next_cursor = encode_search_cursor(last_tier, [last_doc.get(field) for field in sort_fields])
+    return [doc for _, doc in page], next_cursor
+
+
+async def estimate_search_total(collection, tier_queries: list) -> int:
+    """Index-only count of all tiers, stopping at SEARCH_TOTAL_ESTIMATE_CAP"""
+    total = 0
+    for query in tier_queries:
+        total += await collection.count_documents(query, limit=SEARCH_TOTAL_ESTIMATE_CAP - total)
+        if total >= SEARCH_TOTAL_ESTIMATE_CAP:
+            break
+    return total
+
+
+@api_router.post("/provider/search/clients/name", response_model=List[CrossProviderClient])
+async def search_clients_by_name(search_request: ClientSearchRequest, response: Response, current_user=Depends(get_current_provider)):
+    """Search clients by name from other providers"""
+    
+    # Check if provider has active subscription
+    has_active_subscription = await check_subscription_status(current_user["user_id"])
+    if not has_active_subscription:
+        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
+    
+    search_term = search_request.search_term.strip()
+    folded_term = fold_search_text(search_term)
+    if not search_term or len(search_term) < 3 or len(folded_term) < 3:
+        raise HTTPException(status_code=400, detail="Nome deve ter pelo menos 3 caracteres")
+    
+    if search_request.fuzzy:
+        return await search_clients_by_phonetic_name(search_request, response, folded_term, current_user["user_id"])
+    
+    # Search clients from OTHER providers using the trigram index; the regex on
+    # name_folded only filters the candidates returned by the index
+    base_query = {
+        "name_trigrams": {"$all": search_trigrams(folded_term)},
+        "is_active": True,
+        "provider_id": {"$ne": current_user["user_id"]}  # Not from current provider
+    }
+    escaped_term = re.escape(folded_term)
+    word_start = f"(^| ){escaped_term}"
+    
+    # Ranking: names where the term starts a word come first, then substrings
+    tier_queries = [
+        {**base_query, "name_folded": {"$regex": word_start}},
+        {**base_query, "name_folded": {"$regex": escaped_term, "$not": re.compile(word_start)}},
+    ]
+    clients, next_cursor = await fetch_search_page(
+        read_db.clients, tier_queries, ["name_folded", "id"],
+        {**CROSS_PROVIDER_PROJECTION, "name_folded": 1},
+        search_request.cursor, search_page_size(search_request)
+    )
+    
+    total = await estimate_search_total(read_db.clients, tier_queries) if search_request.include_total else None
+    set_search_page_headers(response, next_cursor, total)
+    return await format_cross_provider_clients(clients)
+
+
+async def search_clients_by_phonetic_name(search_request: ClientSearchRequest, response: Response,
+                                         folded_term: str, provider_id: str):
+    """Fuzzy name search: phonetic-key index lookup, ranked by similarity to the typed term"""
+    phonetic_codes = phonetic_name_key(folded_term)
+    if not phonetic_codes:
+        raise HTTPException(status_code=400, detail="Nome deve ter pelo menos 3 caracteres")
+    
+    query = {
+        "name_phonetic": {"$all": sorted(set(phonetic_codes))},
+        "is_active": True,
+        "provider_id": {"$ne": provider_id}  # Not from current provider
+    }
+    # Tier 0: every typed word appears as a whole word, so similarity is exactly 1
+    # and (name, id) order is the ranking; paginated by keyset with no cap
+    exact_words = {"$and": [
+        {"name_folded": {"$regex": f"(^| ){re.escape(word)}( |$)"}} for word in folded_term.split()
+    ]}
+    tier_queries = [{**query, **exact_words}, {**query, "$nor": [exact_words]}]
+    
+    # Cursor keys are (-similarity, name, id) in both tiers; the score is rounded so it is stable
+    start_tier, after = decode_search_cursor(search_request.cursor, 3, len(tier_queries))
+    page_size = search_page_size(search_request)
+    page = []  # (tier, key, doc)
+    projection = {**CROSS_PROVIDER_PROJECTION, "name_folded": 1}
+    
+    if start_tier == 0:
+        exact_query = tier_queries[0]
+        if after is not None:
+            exact_query = {"$and": [exact_query, keyset_after(["name_folded", "id"], after[1:])]}
+        docs = await read_db.clients.find(exact_query, projection).sort(
+            [("name_folded", 1), ("id", 1)]
+        ).to_list(page_size + 1)
+        page.extend((0, (-1.0, c.get("name_folded", ""), c["id"]), c) for c in docs)
+    
+    if len(page) <= page_size:
+        # Tier 1: spelling variants (Sousa for Souza); only here similarity varies, so the
+        # first FUZZY_CANDIDATE_LIMIT candidates are ranked in memory
+        candidates = await read_db.clients.find(tier_queries[1], projection).sort(
+            [("name_folded", 1), ("id", 1)]
+        ).to_list(FUZZY_CANDIDATE_LIMIT)
+        ranked = sorted(
+            ((-round(name_similarity(folded_term, c.get("name_folded", "")), 4), c.get("name_folded", ""), c["id"]), c)
+            for c in candidates
+        )
+        if start_tier == 1 and after is not None:
+            ranked = [(key, c) for key, c in ranked if key > tuple(after)]
+        page.extend((1, key, c) for key, c in ranked[:page_size + 1 - len(page)])
+    
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last_tier, last_key, _ = page[-1]
+        next_cursor = encode_search_cursor(last_tier, list(last_key))
+    
+    total = None
+    if search_request.include_total:
+        # Só o que a paginação alcança: variantes contam até FUZZY_CANDIDATE_LIMIT
+        total = await read_db.clients.count_documents(tier_queries[0], limit=SEARCH_TOTAL_ESTIMATE_CAP)
+        if total < SEARCH_TOTAL_ESTIMATE_CAP:
+            total += await read_db.clients.count_documents(tier_queries[1], limit=FUZZY_CANDIDATE_LIMIT)
+    
+    set_search_page_headers(response, next_cursor, total)
+    return await format_cross_provider_clients([c for _, _, c in page])
+
+
+@api_router.post("/provider/search/clients/cpf", response_model=List[CrossProviderClient])
+async def search_clients_by_cpf(search_request: ClientSearchRequest, response: Response, current_user=Depends(get_current_provider)):
+    """Search clients by CPF from other providers"""
+    
+    # Check if provider has active subscription
+    has_active_subscription = await check_subscription_status(current_user["user_id"])
+    if not has_active_subscription:
+        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
     
     cpf = search_request.search_term.strip()
     if not cpf:
@@ -4861,21 +5577,223 @@ async def search_clients_by_cpf(search_request: ClientSearchRequest, current_use
     if len(cpf_clean) != 11:
         raise HTTPException(status_code=400, detail="CPF deve ter 11 dígitos")
     
-    # Search by exact CPF match from OTHER providers
-    clients = await db.clients.find({
-        "provider_id": {"$ne": current_user["user_id"]},  # Not from current provider
-        "is_active": True,
-        "$or": [
-            {"cpf": cpf},
-            {"cpf": cpf_clean}
-        ]
-    }).to_list(50)
+    # Definite "clean" answers come from the in-memory filter without touching Mongo
+    if not cpf_possibly_negative(cpf_clean):
+        return []
     
-    return await format_cross_provider_clients(clients)
+    # Single-document read on the negative registry; listings from OTHER providers only
+    entry = await read_db.negative_registry.find_one({"_id": cpf_clean})
+    if not entry:
+        return []
+    
+    listings = sorted(
+        (listing for listing in entry["listings"]
+         if listing["provider_id"] != current_user["user_id"]),  # Not from current provider
+        key=lambda listing: (listing["provider_id"], listing["id"])
+    )
+    
+    total = len(listings) if search_request.include_total else None
+    
+    # Same keyset cursor as the other searches, applied to the registry listings
+    _, after = decode_search_cursor(search_request.cursor, 2)
+    if after is not None:
+        listings = [l for l in listings if (l["provider_id"], l["id"]) > tuple(after)]
+    
+    page_size = search_page_size(search_request)
+    next_cursor = None
+    if len(listings) > page_size:
+        last = listings[page_size - 1]
+        next_cursor = encode_search_cursor(0, [last["provider_id"], last["id"]])
+    
+    set_search_page_headers(response, next_cursor, total)
+    return await format_cross_provider_clients(listings[:page_size])
+
+
+@api_router.post("/provider/search/clients/cpf/verdict", response_model=NegativeVerdict)
+async def get_cpf_negative_verdict(search_request: ClientSearchRequest, current_user=Depends(get_current_provider)):
+    """Quick verdict: is this CPF negative at other providers, and how bad"""
+    
+    # Check if provider has active subscription
+    has_active_subscription = await check_subscription_status(current_user["user_id"])
+    if not has_active_subscription:
+        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
+    
+    cpf_clean = ''.join(filter(str.isdigit, search_request.search_term))
+    if len(cpf_clean) != 11:
+        raise HTTPException(status_code=400, detail="CPF deve ter 11 dígitos")
+    
+    if not cpf_possibly_negative(cpf_clean):
+        return NegativeVerdict(cpf=cpf_clean, is_negative=False)
+    
+    entry = await read_db.negative_registry.find_one({"_id": cpf_clean})
+    if not entry:
+        return NegativeVerdict(cpf=cpf_clean, is_negative=False)
+    
+    # Aggregates only over OTHER providers, like the search endpoints
+    listings = [l for l in entry["listings"] if l["provider_id"] != current_user["user_id"]]
+    listed_by_current_provider = len(listings) < len(entry["listings"])
+    if not listings:
+        return NegativeVerdict(
+            cpf=cpf_clean,
+            is_negative=False,
+            listed_by_current_provider=listed_by_current_provider
+        )
+    
+    others = build_negative_registry_entry(cpf_clean, listings)
+    return NegativeVerdict(
+        cpf=cpf_clean,
+        is_negative=True,
+        provider_count=others["provider_count"],
+        total_debt=others["total_debt"],
+        max_debt=others["max_debt"],
+        max_risk_level=others["max_risk_level"],
+        oldest_inclusion_date=others["oldest_inclusion_date"],
+        listed_by_current_provider=listed_by_current_provider
+    )
+
+
+# Bulk CPF screening
+BULK_SCREENING_CHUNK_SIZE = 1000
+BULK_SCREENING_MAX_ROWS = int(os.environ.get('BULK_SCREENING_MAX_ROWS', '200000'))
+BULK_SCREENING_SPOOL_BYTES = 1024 * 1024  # Acima disso o upload vai para disco
+BULK_SCREENING_CPF_KEYS = ("cpf", "cnpj_cpf", "documento", "document")
+
+
+def iter_screening_values(binary_file, is_ndjson: bool):
+    """Yield (line_number, raw_cpf) from a CSV or NDJSON file, one line at a time"""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    
+    if is_ndjson:
+        for line_number, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, line
+                continue
+            if isinstance(record, dict):
+                record = next((record[key] for key in BULK_SCREENING_CPF_KEYS if record.get(key)), "")
+            yield line_number, str(record)
+        return
+    
+    # CSV: ";" (padrão Excel pt-BR) ou ","; usa a coluna "cpf" quando há cabeçalho
+    first_line = text.readline()
+    delimiter = ";" if ";" in first_line else ","
+    reader = csv.reader(itertools.chain([first_line], text), delimiter=delimiter)
+    column = 0
+    for line_number, row in enumerate(reader, 1):
+        if not row:
+            continue
+        if line_number == 1:
+            header = [cell.strip().lower() for cell in row]
+            cpf_columns = [i for i, cell in enumerate(header) if cell in BULK_SCREENING_CPF_KEYS]
+            if cpf_columns:
+                column = cpf_columns[0]
+                continue
+        yield line_number, row[column] if column < len(row) else ""
+
+
+async def stream_bulk_cpf_screening(spool, is_ndjson: bool, provider_id: str):
+    """Resolve uploaded CPFs in chunks and stream NDJSON matches as they are found"""
+    started = time.monotonic()
+    summary = {"type": "summary", "rows": 0, "valid": 0, "invalid": 0, "matched": 0, "truncated": False}
+    invalid_lines = []
+    
+    try:
+        values = iter_screening_values(spool, is_ndjson)
+        while summary["rows"] < BULK_SCREENING_MAX_ROWS:
+            # Read one chunk of lines; only this chunk is held in memory
+            chunk_size = min(BULK_SCREENING_CHUNK_SIZE, BULK_SCREENING_MAX_ROWS - summary["rows"])
+            chunk = list(itertools.islice(values, chunk_size))
+            if not chunk:
+                break
+            
+            pending = {}
+            for line_number, raw_value in chunk:
+                summary["rows"] += 1
+                cpf = clean_cpf(raw_value)
+                if len(cpf) != 11 or not validate_cpf(cpf):
+                    summary["invalid"] += 1
+                    if len(invalid_lines) < 100:
+                        invalid_lines.append(line_number)
+                    continue
+                summary["valid"] += 1
+                pending.setdefault(cpf, line_number)
+            
+            # Bloom pre-check, then one $in query on the registry per chunk
+            candidates = [cpf for cpf in pending if cpf_possibly_negative(cpf)]
+            if not candidates:
+                continue
+            async for entry in read_db.negative_registry.find({"_id": {"$in": candidates}}):
+                listings = [l for l in entry["listings"] if l["provider_id"] != provider_id]
+                if not listings:
+                    continue
+                summary["matched"] += 1
+                clients = await format_cross_provider_clients(listings[:SEARCH_RESULTS_LIMIT])
+                yield json.dumps(jsonable_encoder({
+                    "type": "match",
+                    "line": pending[entry["_id"]],
+                    "cpf": entry["_id"],
+                    "provider_count": len({l["provider_id"] for l in listings}),
+                    "clients": clients
+                }), ensure_ascii=False) + "\n"
+        else:
+            summary["truncated"] = next(values, None) is not None
+    finally:
+        spool.close()
+    
+    summary["invalid_lines"] = invalid_lines
+    summary["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+    yield json.dumps(summary) + "\n"
+
+
+@api_router.post("/provider/search/clients/cpf/bulk")
+async def bulk_screen_clients_by_cpf(file: UploadFile = File(...), current_user=Depends(get_current_provider)):
+    """Screen a CSV/NDJSON list of CPFs against other providers' negative clients"""
+    
+    # Same gate as the single CPF search
+    has_active_subscription = await check_subscription_status(current_user["user_id"])
+    if not has_active_subscription:
+        raise HTTPException(status_code=402, detail="Assinatura expirada. Renove para continuar usando o sistema.")
+    
+    filename = (file.filename or "").lower()
+    is_ndjson = filename.endswith((".ndjson", ".jsonl")) or "ndjson" in (file.content_type or "")
+    if not is_ndjson and not filename.endswith((".csv", ".txt")):
+        raise HTTPException(status_code=400, detail="Envie um arquivo CSV ou NDJSON")
+    
+    # The upload is closed when this handler returns, before the response is
+    # streamed, so it is copied to a spool owned by the generator
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SCREENING_SPOOL_BYTES)
+    await run_in_threadpool(shutil.copyfileobj, file.file, spool)
+    spool.seek(0)
+    
+    return StreamingResponse(
+        stream_bulk_cpf_screening(spool, is_ndjson, current_user["user_id"]),
+        media_type="application/x-ndjson"
+    )
+
+
+@api_router.get("/admin/search/negative-filter")
+async def get_negative_filter_stats(current_user=Depends(get_current_admin)):
+    """Memory, false-positive rate and hit counters of the negative CPF filter"""
+    if negative_cpf_filter is None:
+        return {"ready": False, "checks": negative_filter_checks}
+    
+    return {
+        "ready": True,
+        **negative_cpf_filter.stats(),
+        "max_bytes": NEGATIVE_FILTER_MAX_BYTES,
+        "last_sync": negative_filter_last_sync.isoformat() if negative_filter_last_sync else None,
+        "sync_interval_seconds": NEGATIVE_FILTER_SYNC_SECONDS,
+        "rebuild_interval_minutes": NEGATIVE_FILTER_REBUILD_MINUTES,
+        "checks": negative_filter_checks
+    }
 
 
 @api_router.post("/provider/search/clients/address", response_model=List[CrossProviderClient])
-async def search_clients_by_address(search_request: ClientSearchRequest, current_user=Depends(get_current_provider)):
+async def search_clients_by_address(search_request: ClientSearchRequest, response: Response, current_user=Depends(get_current_provider)):
     """Search clients by address from other providers"""
     
     # Check if provider has active subscription
@@ -4887,23 +5805,324 @@ async def search_clients_by_address(search_request: ClientSearchRequest, current
     if not search_term or len(search_term) < 5:
         raise HTTPException(status_code=400, detail="Endereço deve ter pelo menos 5 caracteres")
     
+    search_tokens = address_search_tokens(search_term)
+    if not search_tokens:
+        raise HTTPException(status_code=400, detail="Informe o logradouro, número ou bairro")
+    
+    # Every complete token must match exactly; the last one may still be being
+    # typed, so it is matched as an anchored prefix (also served by the index)
+    token_filters = [{"address_tokens": token} for token in search_tokens[:-1]]
+    token_filters.append({"address_tokens": {"$regex": f"^{re.escape(search_tokens[-1])}"}})
+    
     # Search clients by address from OTHER providers
-    clients = await db.clients.find({
-        "provider_id": {"$ne": current_user["user_id"]},  # Not from current provider
+    query = {
+        "$and": token_filters,
         "is_active": True,
-        "address": {"$regex": search_term, "$options": "i"}  # Case insensitive search
-    }).to_list(50)  # Limit results
+        "provider_id": {"$ne": current_user["user_id"]}  # Not from current provider
+    }
+    tier_queries = [query]
+    
+    # Street and number typed: the exact address (same street, same number) ranks first
+    parsed = parse_client_address(search_term)
+    if parsed["address_street"] and parsed["address_number"]:
+        exact = {"address_street": parsed["address_street"], "address_number": parsed["address_number"]}
+        tier_queries = [
+            {**exact, "is_active": True, "provider_id": query["provider_id"]},
+            {**query, "$nor": [exact]}
+        ]
+    
+    clients, next_cursor = await fetch_search_page(
+        read_db.clients, tier_queries, ["id"], CROSS_PROVIDER_PROJECTION,
+        search_request.cursor, search_page_size(search_request)
+    )
     
+    total = await estimate_search_total(read_db.clients, tier_queries) if search_request.include_total else None
+    set_search_page_headers(response, next_cursor, total)
     return await format_cross_provider_clients(clients)
 
 
+# Negative registry
+# Read model com um documento por CPF (_id = cpf_digits) agregando todas as
+# negativações ativas. Mantido por refresh_negative_registry nos caminhos que
+# criam, alteram ou inativam clientes; a busca por CPF e o veredito rápido
+# viram leituras de um único documento.
+NEGATIVE_REGISTRY_BATCH_SIZE = 500
+NEGATIVE_LISTING_PROJECTION = {**CROSS_PROVIDER_PROJECTION, "cpf_digits": 1}
+
+
+def client_cpf_digits(client: dict) -> str:
+    """CPF digits of a client document (falls back to the raw cpf for legacy docs)"""
+    return client.get("cpf_digits") or clean_cpf(str(client.get("cpf") or ""))
+
+
+def inclusion_date_key(value) -> str:
+    """Normalize inclusion_date (datetime or ISO string) to YYYY-MM-DD"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return str(value or "")[:10]
+
+
+def build_negative_registry_entry(cpf_digits: str, listings: List[dict]) -> dict:
+    """Aggregate the active listings of one CPF into its registry document"""
+    debts = [float(listing.get("debt_amount") or 0) for listing in listings]
+    inclusion_dates = [inclusion_date_key(listing.get("inclusion_date")) for listing in listings]
+    provider_ids = sorted({listing["provider_id"] for listing in listings})
+    
+    return {
+        "_id": cpf_digits,
+        "listings": listings,
+        "provider_ids": provider_ids,
+        "provider_count": len(provider_ids),
+        "total_debt": round(sum(debts), 2),
+        "max_debt": max(debts),
+        "oldest_inclusion_date": min((d for d in inclusion_dates if d), default=None),
+        "max_risk_level": max(int(listing.get("risk_level") or 1) for listing in listings),
+        "updated_at": datetime.now(timezone.utc)
+    }
+
+
+async def refresh_negative_registry(cpf_digits_list) -> None:
+    """Recompute the registry documents of the given CPFs from the active clients"""
+    cpfs = sorted({cpf for cpf in cpf_digits_list if cpf})
+    
+    for start in range(0, len(cpfs), NEGATIVE_REGISTRY_BATCH_SIZE):
+        chunk = cpfs[start:start + NEGATIVE_REGISTRY_BATCH_SIZE]
+        listings = {cpf: [] for cpf in chunk}
+        
+        async for client in db.clients.find(
+            {"cpf_digits": {"$in": chunk}, "is_active": True},
+            NEGATIVE_LISTING_PROJECTION
+        ):
+            listings[client.pop("cpf_digits")].append(client)
+        
+        operations = []
+        for cpf, cpf_listings in listings.items():
+            if cpf_listings:
+                entry = build_negative_registry_entry(cpf, cpf_listings)
+                operations.append(ReplaceOne({"_id": cpf}, entry, upsert=True))
+                mark_cpf_negative(cpf)
+            else:
+                operations.append(DeleteOne({"_id": cpf}))
+        
+        await db.negative_registry.bulk_write(operations, ordered=False)
+
+
+async def rebuild_negative_registry() -> int:
+    """Rebuild the whole registry without an empty window for concurrent reads"""
+    started_at = datetime.now(timezone.utc)
+    refreshed = 0
+    pending = []
+    last_cpf = None
+    
+    # Sorted scan over the (cpf_digits, is_active, provider_id) index
+    async for client in db.clients.find(
+        {"is_active": True, "cpf_digits": {"$gt": ""}},
+        {"_id": 0, "cpf_digits": 1}
+    ).sort("cpf_digits", 1):
+        cpf = client["cpf_digits"]
+        if cpf == last_cpf:
+            continue
+        last_cpf = cpf
+        pending.append(cpf)
+        if len(pending) >= NEGATIVE_REGISTRY_BATCH_SIZE:
+            await refresh_negative_registry(pending)
+            refreshed += len(pending)
+            pending = []
+    
+    if pending:
+        await refresh_negative_registry(pending)
+        refreshed += len(pending)
+    
+    # Entries not touched by this rebuild no longer have active listings
+    await db.negative_registry.delete_many({"updated_at": {"$lt": started_at}})
+    return refreshed
+
+
+# Negative CPF pre-check (Bloom filter)
+# Filtro em memória com todos os CPFs do negative_registry. Um "não" do filtro
+# é definitivo e responde sem ir ao Mongo; um "talvez" segue para o registro.
+# Escritas deste processo entram na hora; escritas de outras instâncias entram
+# pelo polling de updated_at a cada NEGATIVE_FILTER_SYNC_SECONDS, e a
+# reconstrução periódica descarta CPFs que deixaram de ser negativos.
+NEGATIVE_FILTER_FP_RATE = float(os.environ.get('NEGATIVE_FILTER_FP_RATE', '0.01'))
+NEGATIVE_FILTER_MAX_BYTES = int(os.environ.get('NEGATIVE_FILTER_MAX_BYTES', str(32 * 1024 * 1024)))
+NEGATIVE_FILTER_GROWTH = 1.25  # Folga para CPFs incluídos entre reconstruções
+NEGATIVE_FILTER_SYNC_SECONDS = int(os.environ.get('NEGATIVE_FILTER_SYNC_SECONDS', '5'))
+NEGATIVE_FILTER_REBUILD_MINUTES = int(os.environ.get('NEGATIVE_FILTER_REBUILD_MINUTES', '30'))
+
+
+class NegativeCpfFilter:
+    """Bloom filter over CPF digits with double hashing (blake2b)"""
+    
+    def __init__(self, expected_items: int, fp_rate: float, max_bytes: int):
+        expected_items = max(expected_items, 1000)
+        ideal_bits = math.ceil(-expected_items * math.log(fp_rate) / (math.log(2) ** 2))
+        self.size_bits = max(8, min(ideal_bits, max_bytes * 8))
+        self.hash_count = max(1, round(self.size_bits / expected_items * math.log(2)))
+        self.bits = bytearray((self.size_bits + 7) // 8)
+        self.items = 0
+        self.target_fp_rate = fp_rate
+        self.built_at = datetime.now(timezone.utc)
+    
+    def _positions(self, cpf: str):
+        digest = hashlib.blake2b(cpf.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size_bits for i in range(self.hash_count))
+    
+    def add(self, cpf: str):
+        for position in self._positions(cpf):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.items += 1
+    
+    def might_contain(self, cpf: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(cpf))
+    
+    def stats(self) -> dict:
+        estimated_fp = (1 - math.exp(-self.hash_count * self.items / self.size_bits)) ** self.hash_count
+        return {
+            "insertions": self.items,  # Inclui reinserções do sync incremental
+            "size_bytes": len(self.bits),
+            "hash_count": self.hash_count,
+            "target_fp_rate": self.target_fp_rate,
+            "estimated_fp_rate": round(estimated_fp, 6),
+            "built_at": self.built_at.isoformat()
+        }
+
+
+negative_cpf_filter: Optional[NegativeCpfFilter] = None  # None = ainda não construído
+negative_filter_last_sync: Optional[datetime] = None
+negative_filter_checks = {"definite_negative": 0, "maybe_positive": 0}
+
+
+def cpf_possibly_negative(cpf_digits: str) -> bool:
+    """False only when the filter guarantees the CPF is not in the registry"""
+    if negative_cpf_filter is None:
+        return True
+    if negative_cpf_filter.might_contain(cpf_digits):
+        negative_filter_checks["maybe_positive"] += 1
+        return True
+    negative_filter_checks["definite_negative"] += 1
+    return False
+
+
+def mark_cpf_negative(cpf_digits: str):
+    """Add a CPF that just got a registry entry to the local filter"""
+    if negative_cpf_filter is not None:
+        negative_cpf_filter.add(cpf_digits)
+
+
+async def rebuild_negative_cpf_filter() -> NegativeCpfFilter:
+    """Build a fresh filter from negative_registry and swap it in"""
+    global negative_cpf_filter, negative_filter_last_sync
+    
+    sync_started = datetime.now(timezone.utc)
+    registry_size = await db.negative_registry.estimated_document_count()
+    new_filter = NegativeCpfFilter(
+        int(registry_size * NEGATIVE_FILTER_GROWTH),
+        NEGATIVE_FILTER_FP_RATE,
+        NEGATIVE_FILTER_MAX_BYTES
+    )
+    async for entry in db.negative_registry.find({}, {"_id": 1}):
+        new_filter.add(entry["_id"])
+    
+    negative_cpf_filter = new_filter
+    negative_filter_last_sync = sync_started
+    return new_filter
+
+
+async def sync_negative_cpf_filter():
+    """Add registry entries written by other instances since the last sync"""
+    global negative_filter_last_sync
+    
+    if negative_cpf_filter is None or negative_filter_last_sync is None:
+        return
+    
+    sync_started = datetime.now(timezone.utc)
+    since = negative_filter_last_sync - timedelta(seconds=NEGATIVE_FILTER_SYNC_SECONDS)  # Margem para clock skew
+    async for entry in db.negative_registry.find({"updated_at": {"$gte": since}}, {"_id": 1}):
+        negative_cpf_filter.add(entry["_id"])
+    negative_filter_last_sync = sync_started
+
+
+async def negative_filter_maintenance_loop():
+    """Per-process loop: incremental sync every few seconds, full rebuild periodically"""
+    last_rebuild = time.monotonic()
+    while True:
+        await asyncio.sleep(NEGATIVE_FILTER_SYNC_SECONDS)
+        try:
+            if time.monotonic() - last_rebuild >= NEGATIVE_FILTER_REBUILD_MINUTES * 60:
+                await rebuild_negative_cpf_filter()
+                last_rebuild = time.monotonic()
+            else:
+                await sync_negative_cpf_filter()
+        except Exception as e:
+            print(f"❌ Erro ao atualizar filtro de CPFs negativados: {e}")
+
+
+# Provider card cache
+# Cartões com os dados públicos do provedor usados nas buscas, mensagens e
+# contratos. Preenchidos em lote com $in e invalidados nas rotas que alteram
+# nome, CNPJ, telefone, email ou logo do provedor.
+PROVIDER_CARD_FIELDS = ("name", "cnpj", "logo_url", "phone", "nome_fantasia", "email", "creation_date")
+PROVIDER_CARD_CACHE_TTL = int(os.environ.get('PROVIDER_CARD_CACHE_TTL', '300'))  # segundos
+PROVIDER_CARD_CACHE_SIZE = int(os.environ.get('PROVIDER_CARD_CACHE_SIZE', '5000'))
+provider_card_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+async def get_provider_cards(provider_ids) -> Dict[str, dict]:
+    """Return provider cards by id, loading cache misses with a single $in query"""
+    now = time.monotonic()
+    cards = {}
+    missing = []
+    
+    for provider_id in set(provider_ids):
+        cached = provider_card_cache.get(provider_id)
+        if cached and cached[0] > now:
+            provider_card_cache.move_to_end(provider_id)
+            cards[provider_id] = cached[1]
+        else:
+            missing.append(provider_id)
+    
+    if missing:
+        projection = {"_id": 0, "id": 1, **{field: 1 for field in PROVIDER_CARD_FIELDS}}
+        async for provider in db.providers.find({"id": {"$in": missing}}, projection):
+            # Only keys present in the document, so provider.get(key, default) keeps working
+            card = {key: value for key, value in provider.items()}
+            cards[provider["id"]] = card
+            provider_card_cache[provider["id"]] = (now + PROVIDER_CARD_CACHE_TTL, card)
+            provider_card_cache.move_to_end(provider["id"])
+        
+        while len(provider_card_cache) > PROVIDER_CARD_CACHE_SIZE:
+            provider_card_cache.popitem(last=False)
+    
+    return cards
+
+
+async def get_provider_card(provider_id: str) -> Optional[dict]:
+    """Return a single provider card (None if the provider does not exist)"""
+    cards = await get_provider_cards([provider_id])
+    return cards.get(provider_id)
+
+
+def invalidate_provider_card(provider_id: Optional[str] = None):
+    """Drop one provider card from the cache, or every card when no id is given"""
+    if provider_id is None:
+        provider_card_cache.clear()
+    else:
+        provider_card_cache.pop(provider_id, None)
+
+
 async def format_cross_provider_clients(clients):
     """Format clients for cross-provider search results"""
     formatted_clients = []
     
+    # One batched lookup for every provider in the result page
+    providers = await get_provider_cards(client["provider_id"] for client in clients)
+    
     for client in clients:
         # Get provider information
-        provider = await db.providers.find_one({"id": client["provider_id"]})
+        provider = providers.get(client["provider_id"])
         if not provider:
             continue
         
@@ -5006,7 +6225,16 @@ async def get_all_provider_reminders(current_user=Depends(get_current_provider))
             "provider_id": current_user["user_id"]
         }).sort("reminder_date", 1).to_list(1000)
         
-        # Enrich with client data
+        # Enrich with client data (one batched lookup instead of one per reminder)
+        client_ids = list({reminder["client_id"] for reminder in reminders if reminder.get("client_id")})
+        clients_by_id = {}
+        if client_ids:
+            async for client in db.clients.find(
+                {"id": {"$in": client_ids}, "is_active": True},
+                {"_id": 0, "id": 1, "name": 1, "phone": 1}
+            ):
+                clients_by_id[client["id"]] = client
+        
         enriched_reminders = []
         for reminder in reminders:
             try:
@@ -5019,7 +6247,7 @@ async def get_all_provider_reminders(current_user=Depends(get_current_provider))
                     print(f"Reminder sem client_id: {reminder}")
                     continue
                     
-                client = await db.clients.find_one({"id": reminder["client_id"], "is_active": True})
+                client = clients_by_id.get(reminder["client_id"])
                 if client:
                     reminder["client_name"] = client.get("name", "Nome não encontrado")
                     reminder["client_phone"] = client.get("phone", "Telefone não encontrado")
@@ -5100,7 +6328,9 @@ async def send_reminder_whatsapp(reminder_id: str, current_user=Depends(get_curr
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
     # Get provider data
-    provider = await db.providers.find_one({"id": current_user["user_id"]})
+    provider = await get_provider_card(current_user["user_id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provedor não encontrado")
     
     # Create PIX key (using provider CNPJ)
     pix_key = provider["cnpj"]
@@ -5201,6 +6431,7 @@ async def upload_provider_logo(file: UploadFile = File(...), current_user=Depend
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        invalidate_provider_card(current_user["user_id"])
         
         if result.modified_count == 0:
             print(f"[R2-UPLOAD] Aviso: Provider não foi atualizado no banco")
@@ -5271,6 +6502,7 @@ async def delete_provider_logo(current_user=Depends(get_current_provider)):
         {"id": current_user["user_id"]},
         {"$unset": {"logo_url": ""}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    invalidate_provider_card(current_user["user_id"])
     
     if result.modified_count == 0:
         raise HTTPException(status_code=500, detail="Erro ao remover logo do banco de dados")
@@ -5322,6 +6554,7 @@ async def update_provider_profile(profile_data: ProviderProfileUpdate, current_u
         {"id": current_user["user_id"]},
         {"$set": update_fields}
     )
+    invalidate_provider_card(current_user["user_id"])
     
     if result.modified_count == 0:
         raise HTTPException(status_code=500, detail="Erro ao atualizar perfil")
@@ -5461,6 +6694,7 @@ async def check_provider_payment_status(provider_id: str):
                     "blocked_reason": None
                 }}
             )
+        invalidate_provider_status(provider_id)
         
         return {
             "success": True,
@@ -5528,6 +6762,7 @@ async def get_my_payments(current_user=Depends(get_current_provider)):
                     {"id": provider_id},
                     {"$set": {"is_blocked": is_blocked, "updated_at": today.isoformat()}}
                 )
+                invalidate_provider_status(provider_id)
         
         return {
             "success": True,
@@ -6327,6 +7562,8 @@ async def efi_payment_webhook(request: Request):
                         
                         # Create notification for provider
                         provider_id = payment_record.get("provider_id")
+                        if provider_id:
+                            invalidate_provider_status(provider_id)
                         amount = payment_record.get("amount", 0)
                         
                         notification_message = ""
@@ -6640,6 +7877,247 @@ async def get_debug_info(current_user=Depends(get_current_provider)):
         return {"error": str(e)}
 
 
+# Index registry
+# Índices declarados por coleção e aplicados de forma idempotente no startup
+# (create_index com mesmo nome e chaves não faz nada). Cada entrada lista as
+# formas de consulta que ela atende; GET /admin/indexes/report roda explain
+# nessas formas e mostra o que está coberto e o que ainda cai em COLLSCAN.
+# Os valores dos filtros são só amostras para o explain.
+INDEX_REGISTRY = [
+    # clients
+    {"collection": "clients", "name": "provider_active", "keys": [("provider_id", 1), ("is_active", 1)],
+     "queries": [{"filter": {"provider_id": "p", "is_active": True}},
+                 {"filter": {"provider_id": "p"}}]},
+    {"collection": "clients", "name": "id_provider", "keys": [("id", 1), ("provider_id", 1)],
+     "queries": [{"filter": {"id": "c", "provider_id": "p", "is_active": True}},
+                 {"filter": {"id": "c", "is_active": True}}]},
+    {"collection": "clients", "name": "cpf_digits_active_provider",
+     "keys": [("cpf_digits", 1), ("is_active", 1), ("provider_id", 1)],
+     "queries": [{"filter": {"cpf_digits": "00000000000", "is_active": True, "provider_id": "p"}},
+                 {"filter": {"cpf_digits": {"$in": ["00000000000"]}, "is_active": True}}]},
+    {"collection": "clients", "name": "name_trigrams_active_name",
+     "keys": [("name_trigrams", 1), ("is_active", 1), ("name_folded", 1), ("id", 1)],
+     "queries": [{"filter": {"name_trigrams": {"$all": ["SIL", "ILV"]}, "is_active": True},
+                  "sort": [("name_folded", 1), ("id", 1)]}]},
+    {"collection": "clients", "name": "name_phonetic_active_name",
+     "keys": [("name_phonetic", 1), ("is_active", 1), ("name_folded", 1), ("id", 1)],
+     "queries": [{"filter": {"name_phonetic": {"$all": ["SIUVA"]}, "is_active": True},
+                  "sort": [("name_folded", 1), ("id", 1)]}]},
+    {"collection": "clients", "name": "address_street_number_active",
+     "keys": [("address_street", 1), ("address_number", 1), ("is_active", 1), ("id", 1)],
+     "queries": [{"filter": {"address_street": "RUA FLORES", "address_number": "10", "is_active": True},
+                  "sort": [("id", 1)]}]},
+    {"collection": "clients", "name": "address_tokens_active",
+     "keys": [("address_tokens", 1), ("is_active", 1), ("id", 1)],
+     "queries": [{"filter": {"address_tokens": "RUA", "is_active": True}, "sort": [("id", 1)]}]},
+    {"collection": "clients", "name": "integration_active_external",
+     "keys": [("integration_id", 1), ("is_active", 1), ("external_id", 1)],
+     "queries": [{"filter": {"provider_id": "p", "integration_id": "i", "is_active": True,
+                             "external_id": {"$nin": ["1"]}}}]},
+    {"collection": "clients", "name": "search_fields_version", "keys": [("search_fields_version", 1)],
+     "queries": [{"filter": {"search_fields_version": {"$lt": 1}}}]},
+    # sync jobs (fila de sincronizações manuais)
+    {"collection": "sync_jobs", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "j", "provider_id": "p"}}]},
+    {"collection": "sync_jobs", "name": "active_key_unique", "keys": [("active_key", 1)],
+     "options": {"unique": True, "sparse": True},
+     "queries": [{"filter": {"active_key": "i"}}]},
+    {"collection": "sync_jobs", "name": "status_created", "keys": [("status", 1), ("created_at", 1)],
+     "queries": [{"filter": {"status": "queued"}, "sort": [("created_at", 1)]},
+                 {"filter": {"status": "running", "heartbeat_at": {"$lt": "2000-01-01"}}}]},
+    # sync runs (histórico de sincronizações)
+    {"collection": "sync_runs", "name": "integration_started", "keys": [("integration_id", 1), ("started_at", -1)],
+     "queries": [{"filter": {"integration_id": "i", "provider_id": "p"}, "sort": [("started_at", -1)]},
+                 {"filter": {"integration_id": "i", "provider_id": "p", "started_at": {"$gte": "2000-01-01"}}}]},
+    {"collection": "sync_runs", "name": "started_at", "keys": [("started_at", -1)],
+     "queries": [{"filter": {"started_at": {"$gte": "2000-01-01"}}}]},
+    {"collection": "sync_runs", "name": "expires_at_ttl", "keys": [("expires_at", 1)],
+     "options": {"expireAfterSeconds": 0},
+     "queries": []},
+    # negative registry (read model)
+    {"collection": "negative_registry", "name": "updated_at", "keys": [("updated_at", 1)],
+     "queries": [{"filter": {"updated_at": {"$lt": "2000-01-01"}}}]},
+    # providers
+    {"collection": "providers", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "p"}}, {"filter": {"id": {"$in": ["p"]}}}]},
+    {"collection": "providers", "name": "email_active", "keys": [("email", 1), ("is_active", 1)],
+     "queries": [{"filter": {"email": "a@b.c", "is_active": True}}]},
+    {"collection": "providers", "name": "username_active", "keys": [("username", 1), ("is_active", 1)],
+     "queries": [{"filter": {"username": "a@b.c", "is_active": True}}]},
+    {"collection": "providers", "name": "cnpj", "keys": [("cnpj", 1)],
+     "queries": [{"filter": {"cnpj": "00.000.000/0000-00"}}]},
+    # payments / subscriptions
+    {"collection": "payments", "name": "provider_status_created",
+     "keys": [("provider_id", 1), ("status", 1), ("created_at", -1)],
+     "queries": [{"filter": {"provider_id": "p", "status": "pending", "created_at": {"$gte": "2000-01-01"}}},
+                 {"filter": {"provider_id": "p", "status": {"$in": ["pending", "waiting"]}}}]},
+    {"collection": "payments", "name": "provider_created", "keys": [("provider_id", 1), ("created_at", -1)],
+     "queries": [{"filter": {"provider_id": "p"}, "sort": [("created_at", -1)]}]},
+    {"collection": "payments", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "x", "provider_id": "p"}}]},
+    {"collection": "payments", "name": "payment_id", "keys": [("payment_id", 1)],
+     "queries": [{"filter": {"payment_id": "x"}}]},
+    {"collection": "payments", "name": "charge_id", "keys": [("charge_id", 1)],
+     "queries": [{"filter": {"$or": [{"payment_id": "x"}, {"charge_id": "x"}]}}]},
+    {"collection": "subscriptions", "name": "provider_created", "keys": [("provider_id", 1), ("created_at", -1)],
+     "queries": [{"filter": {"provider_id": "p"}, "sort": [("created_at", -1)]}]},
+    {"collection": "subscriptions", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "s"}}]},
+    # notifications
+    {"collection": "notifications", "name": "active_created", "keys": [("is_active", 1), ("created_at", -1)],
+     "queries": [{"filter": {"is_active": True}, "sort": [("created_at", -1)]}]},
+    {"collection": "notifications", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "n"}}]},
+    {"collection": "notification_reads", "name": "provider_notification",
+     "keys": [("provider_id", 1), ("notification_id", 1)],
+     "queries": [{"filter": {"provider_id": "p"}},
+                 {"filter": {"provider_id": "p", "notification_id": "n"}}]},
+    {"collection": "notification_reads", "name": "notification_id", "keys": [("notification_id", 1)],
+     "queries": [{"filter": {"notification_id": "n"}}]},
+    # visitors
+    {"collection": "visitors", "name": "id", "keys": [("id", 1)],
+     "queries": [{"filter": {"id": "v"}}]},
+    {"collection": "visitors", "name": "last_visit", "keys": [("last_visit", 1)],
+     "queries": [{"filter": {"last_visit": {"$gte": "2000-01-01"}}}]},
+    # ERP integrations
+    {"collection": "provider_integrations", "name": "auto_sync_active",
+     "keys": [("auto_sync_enabled", 1), ("is_active", 1)],
+     "queries": [{"filter": {"auto_sync_enabled": True, "is_active": True}}]},
+    {"collection": "provider_integrations", "name": "provider_type",
+     "keys": [("provider_id", 1), ("integration_type", 1)],
+     "queries": [{"filter": {"provider_id": "p"}},
+                 {"filter": {"provider_id": "p", "integration_type": "ixc"}}]},
+    # misc
+    {"collection": "temp_data", "name": "key_timestamp", "keys": [("key", 1), ("timestamp", -1)],
+     "queries": [{"filter": {"key": "k", "timestamp": {"$gte": "2000-01-01"}}}]},
+    {"collection": "password_reset_tokens", "name": "token_hash_used", "keys": [("token_hash", 1), ("used", 1)],
+     "queries": [{"filter": {"token_hash": "t", "used": False}}]},
+    {"collection": "password_reset_tokens", "name": "email_used", "keys": [("email", 1), ("used", 1)],
+     "queries": [{"filter": {"email": "a@b.c", "used": False}}]},
+    {"collection": "admins", "name": "username", "keys": [("username", 1)],
+     "queries": [{"filter": {"username": "master"}}]},
+]
+
+
+# Opções de índice comparadas com o que já existe no MongoDB
+INDEX_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def index_spec_differences(spec: dict, info: dict) -> List[str]:
+    """What differs between a registry entry and the index_information() entry of the same name"""
+    differences = []
+    existing_keys = [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+                     for field, direction in info.get("key", [])]
+    if existing_keys != [tuple(key) for key in spec["keys"]]:
+        differences.append(f"chaves {existing_keys} != {spec['keys']}")
+    options = spec.get("options", {})
+    for option in INDEX_COMPARED_OPTIONS:
+        expected, current = options.get(option), info.get(option)
+        if option in ("unique", "sparse"):
+            expected, current = bool(expected), bool(current)
+        if expected != current:
+            differences.append(f"{option} {current!r} != {expected!r}")
+    return differences
+
+
+async def apply_index_registry() -> dict:
+    """Create every registered index; returns {"created"|"existing"|"conflict"|"failed": [...]}"""
+    summary = {"created": [], "existing": [], "conflict": [], "failed": []}
+    existing_by_collection = {}
+    
+    for spec in INDEX_REGISTRY:
+        collection = db[spec["collection"]]
+        label = f'{spec["collection"]}.{spec["name"]}'
+        if spec["collection"] not in existing_by_collection:
+            existing_by_collection[spec["collection"]] = await collection.index_information()
+        existing = existing_by_collection[spec["collection"]].get(spec["name"])
+        if existing is not None:
+            # Mesmo nome com chaves/opções diferentes não é recriado sozinho (drop manual)
+            differences = index_spec_differences(spec, existing)
+            if differences:
+                print(f"⚠️ Índice {label} existe com definição diferente: {'; '.join(differences)}")
+                summary["conflict"].append(label)
+            else:
+                summary["existing"].append(label)
+            continue
+        try:
+            await collection.create_index(spec["keys"], name=spec["name"], **spec.get("options", {}))
+            summary["created"].append(label)
+        except Exception as e:
+            # Ex.: mesmas chaves já indexadas com outro nome (IndexOptionsConflict)
+            print(f"⚠️ Índice {label} não criado: {e}")
+            summary["failed"].append(label)
+    
+    return summary
+
+
+def explain_plan_summary(node) -> tuple:
+    """Walk an explain winningPlan and return (stages, index_names)"""
+    stages, index_names = [], []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        if node.get("indexName"):
+            index_names.append(node["indexName"])
+        for value in node.values():
+            child_stages, child_indexes = explain_plan_summary(value)
+            stages += child_stages
+            index_names += child_indexes
+    elif isinstance(node, list):
+        for item in node:
+            child_stages, child_indexes = explain_plan_summary(item)
+            stages += child_stages
+            index_names += child_indexes
+    return stages, index_names
+
+
+@api_router.get("/admin/indexes/report")
+async def get_index_report(current_user=Depends(get_current_admin)):
+    """Per collection: registered vs existing indexes and the plan of each registered query shape"""
+    try:
+        report = {}
+        for spec in INDEX_REGISTRY:
+            name = spec["collection"]
+            if name not in report:
+                existing = await db[name].index_information()
+                registered = [s["name"] for s in INDEX_REGISTRY if s["collection"] == name]
+                report[name] = {
+                    "indexes": sorted(existing),
+                    "missing": [index for index in registered if index not in existing],
+                    "conflicts": [s["name"] for s in INDEX_REGISTRY
+                                  if s["collection"] == name and s["name"] in existing
+                                  and index_spec_differences(s, existing[s["name"]])],
+                    "unregistered": sorted(set(existing) - set(registered) - {"_id_"}),
+                    "queries": [],
+                    "collscan_count": 0
+                }
+            
+            for shape in spec["queries"]:
+                command = {"find": name, "filter": shape["filter"]}
+                if shape.get("sort"):
+                    command["sort"] = SON(shape["sort"])
+                explain = await db.command("explain", command, verbosity="queryPlanner")
+                stages, index_names = explain_plan_summary(explain.get("queryPlanner", {}).get("winningPlan", {}))
+                collscan = "COLLSCAN" in stages
+                report[name]["queries"].append({
+                    "expected_index": spec["name"],
+                    "filter": shape["filter"],
+                    "sort": shape.get("sort"),
+                    "plan": "COLLSCAN" if collscan else "IXSCAN" if index_names else (stages[0] if stages else ""),
+                    "indexes_used": sorted(set(index_names)),
+                    "in_memory_sort": "SORT" in stages
+                })
+                if collscan:
+                    report[name]["collscan_count"] += 1
+        
+        return {
+            "collections": jsonable_encoder(report),
+            "total_collscans": sum(c["collscan_count"] for c in report.values())
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar relatório de índices: {str(e)}")
+
+
 # Create master admin if not exists
 @app.on_event("startup")
 async def create_master_admin():
@@ -6654,25 +8132,83 @@ async def create_master_admin():
         await db.admins.insert_one(admin_dict)
         print("Master admin created: username=master, password=master123")
     
+    # Declared indexes (idempotent; search and registry queries depend on them)
+    try:
+        index_summary = await apply_index_registry()
+        print(f"🗂️ Índices: {len(index_summary['created'])} criado(s), "
+              f"{len(index_summary['existing'])} existente(s), {len(index_summary['conflict'])} em conflito, "
+              f"{len(index_summary['failed'])} com erro")
+    except Exception as e:
+        print(f"❌ Erro ao aplicar registro de índices: {e}")
+    
+    # Source tags for clients imported before integration_id/external_id existed
+    try:
+        tagged = await tag_legacy_imported_clients()
+        if tagged:
+            print(f"🏷️ {tagged} cliente(s) importado(s) etiquetado(s) com a integração de origem")
+    except Exception as e:
+        print(f"❌ Erro ao etiquetar clientes importados: {e}")
+    
+    # Normalized search keys for cross-provider client search
+    try:
+        migrated = await backfill_client_search_fields()
+        if migrated:
+            print(f"🔎 Chaves de busca recalculadas para {migrated} cliente(s)")
+        
+        # First deploy (or CPF keys changed): build the negative registry read model
+        registry_empty = await db.negative_registry.find_one({}, {"_id": 1}) is None
+        if migrated or registry_empty:
+            registry_size = await rebuild_negative_registry()
+            print(f"📒 Registro de negativados reconstruído: {registry_size} CPF(s)")
+        
+        cpf_filter = await rebuild_negative_cpf_filter()
+        print(f"🧮 Filtro de CPFs negativados: {cpf_filter.stats()}")
+        app.state.negative_filter_task = asyncio.create_task(negative_filter_maintenance_loop())
+    except Exception as e:
+        print(f"❌ Erro ao preparar índices de busca de clientes: {e}")
+    
     # Start the scheduler for auto-sync
     print("\n" + "="*80)
     print("🚀 INICIANDO SCHEDULER DE SINCRONIZAÇÃO AUTOMÁTICA")
     print("="*80)
-    print("⏰ O scheduler verificará a cada 1 minuto se há sincronizações agendadas")
-    print("📋 Integrações com auto-sync ativo serão sincronizadas no horário configurado")
-    print("="*80 + "\n")
     
-    # Add job to run every minute
+    # One job per integration at its auto_sync_time, plus a periodic refresh from the database
+    try:
+        scheduled = await register_auto_sync_jobs()
+        print(f"📋 {scheduled} integração(ões) com auto-sync agendado")
+    except Exception as e:
+        print(f"❌ Erro ao agendar auto-sync das integrações: {e}")
+    
+    # Background workers for queued manual syncs
+    try:
+        stale_jobs = await fail_orphaned_sync_jobs() + await fail_stale_sync_jobs()
+        if stale_jobs:
+            print(f"⚠️ {stale_jobs} job(s) de sincronização interrompido(s) marcados como erro")
+    except Exception as e:
+        print(f"❌ Erro ao verificar jobs de sincronização: {e}")
+    app.state.sync_job_workers = start_sync_job_workers()
+    print(f"🧵 {SYNC_JOB_WORKERS} worker(s) de sincronização iniciados")
+    scheduler.add_job(
+        fail_stale_sync_jobs,
+        CronTrigger(minute='*/10'),
+        id='sync_jobs_stale',
+        name='Fail Stale Sync Jobs',
+        replace_existing=True
+    )
+    
     scheduler.add_job(
-        run_scheduled_auto_sync,
-        CronTrigger(minute='*'),  # Run every minute
-        id='auto_sync_job',
-        name='Auto Sync Integrations',
+        register_auto_sync_jobs,
+        CronTrigger(minute=f"*/{AUTO_SYNC_REFRESH_MINUTES}"),
+        id='auto_sync_refresh',
+        name='Refresh Auto Sync Jobs',
         replace_existing=True
     )
+    print("="*80 + "\n")
     
-    scheduler.start()
-    print("✅ Scheduler iniciado com sucesso!\n")
+    # Started paused: only the instance holding the scheduler lease fires jobs
+    scheduler.start(paused=True)
+    app.state.scheduler_leader_task = asyncio.create_task(scheduler_leader_loop())
+    print(f"✅ Scheduler iniciado (instância {scheduler_instance_id}, aguardando lease de líder)\n")
 
 
 # Visitor tracking endpoints (public)
@@ -6730,24 +8266,24 @@ async def get_visitor_stats():
     """Get visitor statistics for the website"""
     try:
         # Total unique visitors
-        total_visitors = await db.visitors.count_documents({})
+        total_visitors = await read_db.visitors.count_documents({})
         
         # Total visits (sum of visit_count for all visitors)
         pipeline_total_visits = [
             {"$group": {"_id": None, "total": {"$sum": "$visit_count"}}}
         ]
-        total_visits_result = await db.visitors.aggregate(pipeline_total_visits).to_list(length=1)
+        total_visits_result = await read_db.visitors.aggregate(pipeline_total_visits).to_list(length=1)
         total_visits = total_visits_result[0]["total"] if total_visits_result else 0
         
         # Today's visitors (based on last_visit)
         today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        today_visitors = await db.visitors.count_documents({
+        today_visitors = await read_db.visitors.count_documents({
             "last_visit": {"$gte": today_start}
         })
         
         # This month's visitors
         month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_visitors = await db.visitors.count_documents({
+        month_visitors = await read_db.visitors.count_documents({
             "last_visit": {"$gte": month_start}
         })
         
@@ -7003,6 +8539,8 @@ async def create_provider_integration(
         }
         
         await db.provider_integrations.insert_one(new_integration)
+        schedule_integration_auto_sync(new_integration)
+        await notify_auto_sync_change()
         
         return {
             "success": True,
@@ -7035,16 +8573,13 @@ async def test_integration_connection(
             raise HTTPException(status_code=404, detail="Integração não encontrada")
         
         # Test based on integration type
-        if integration["integration_type"] == "ixc":
-            success, message = await test_ixc_connection(integration)
-        elif integration["integration_type"] == "mk-auth":
-            success, message = await test_mkauth_connection(integration)
-        elif integration["integration_type"] == "sgp":
-            success, message = await test_sgp_connection(integration)
-        elif integration["integration_type"] == "radiusnet":
-            success, message = await test_radiusnet_connection(integration)
-        else:
+        if get_connector_class(integration["integration_type"]) is None:
             success, message = False, "Tipo de integração não suportado"
+        else:
+            try:
+                success, message = await get_connector(integration).test()
+            except ErpError as e:
+                success, message = False, f"❌ {str(e)}"
         
         # Update integration status
         current_time = datetime.now(timezone.utc)
@@ -7073,46 +8608,250 @@ async def test_integration_connection(
         raise HTTPException(status_code=500, detail=f"Erro ao testar integração: {str(e)}")
 
 
-@api_router.post("/provider/integrations/{integration_id}/sync")
-async def sync_integration_data(
-    integration_id: str,
-    current_user=Depends(get_current_provider)
-):
-    """Manually trigger data synchronization"""
+# Sync jobs
+# Sincronizações manuais viram documentos em sync_jobs e rodam em workers em
+# background (SYNC_JOB_WORKERS por processo); a API devolve o id do job na
+# hora e o frontend acompanha o estágio (fetch, hash_lookup, details,
+# normalize, import, reconcile).
+# active_key (índice único esparso) só existe enquanto o job está na fila ou
+# rodando, então um segundo envio para a mesma integração reaproveita o job.
+SYNC_JOB_WORKERS = int(os.environ.get('SYNC_JOB_WORKERS', '2'))
+SYNC_JOB_POLL_SECONDS = float(os.environ.get('SYNC_JOB_POLL_SECONDS', '5'))
+SYNC_JOB_STALE_MINUTES = int(os.environ.get('SYNC_JOB_STALE_MINUTES', '10'))  # sem heartbeat por este tempo = worker morto
+SYNC_JOB_HEARTBEAT_SECONDS = float(os.environ.get('SYNC_JOB_HEARTBEAT_SECONDS', '30'))
+SYNC_JOB_STAGES = ["fetch", "hash_lookup", "details", "normalize", "import", "reconcile"]
+SYNC_JOB_PUBLIC_PROJECTION = {"_id": 0, "active_key": 0, "worker_id": 0}
+current_sync_job_id: ContextVar[Optional[str]] = ContextVar("current_sync_job_id", default=None)
+sync_job_wakeup: Optional[asyncio.Event] = None
+sync_job_worker_id = f"{platform.node()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+# Sync runs
+# Cada execução de sincronização (manual, agendada ou pelo cron) vira um
+# documento em sync_runs com a duração de cada estágio, as requisições e bytes
+# trocados com o ERP e as linhas lidas/gravadas/removidas, para saber se uma
+# noite lenta veio do ERP, da normalização ou do Mongo. Expira após
+# SYNC_RUN_RETENTION_DAYS (índice TTL em expires_at).
+SYNC_RUN_RETENTION_DAYS = int(os.environ.get('SYNC_RUN_RETENTION_DAYS', '90'))
+SYNC_RUN_PUBLIC_PROJECTION = {"_id": 0, "expires_at": 0}
+current_sync_run: ContextVar[Optional[dict]] = ContextVar("current_sync_run", default=None)
+
+
+def start_sync_run(integration: dict, trigger: str, job_id: Optional[str] = None) -> dict:
+    """In-memory record of a sync run; stage timings accumulate until finish_sync_run"""
+    return {
+        "id": str(uuid.uuid4()),
+        "integration_id": integration["id"],
+        "provider_id": integration["provider_id"],
+        "integration_type": integration.get("integration_type"),
+        "trigger": trigger,
+        "job_id": job_id,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "stages": {},
+        "clock": time.monotonic(),
+        "stage": None,
+        "stage_clock": None,
+        "connector": None,
+        "debtors": 0
+    }
+
+
+def mark_sync_run_stage(stage: str):
+    """Close the current run's previous stage and start timing `stage` (no-op outside a run)"""
+    run = current_sync_run.get()
+    if run is None or run["stage"] == stage:
+        return
+    now = time.monotonic()
+    if run["stage"]:
+        # Estágios se alternam (normalize/import por lote), então o tempo acumula
+        run["stages"][run["stage"]] = run["stages"].get(run["stage"], 0) + now - run["stage_clock"]
+    run["stage"] = stage
+    run["stage_clock"] = now
+
+
+def note_sync_run(**fields):
+    """Attach live details (connector, debtor count) to the current sync run, if any"""
+    run = current_sync_run.get()
+    if run is not None:
+        run.update(fields)
+
+
+async def finish_sync_run(run: dict, result: dict):
+    """Persist the run with its stage durations, HTTP counters and row counts"""
+    now = time.monotonic()
+    if run["stage"]:
+        run["stages"][run["stage"]] = run["stages"].get(run["stage"], 0) + now - run["stage_clock"]
+    connector = run["connector"]
+    status = "success" if result.get("status") == "success" else "error"
+    written = result.get("clients_synced", 0) + result.get("clients_updated", 0)
+    
+    doc = {
+        "id": run["id"],
+        "integration_id": run["integration_id"],
+        "provider_id": run["provider_id"],
+        "integration_type": run["integration_type"],
+        "trigger": run["trigger"],
+        "job_id": run["job_id"],
+        "started_at": run["started_at"],
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "duration_seconds": round(now - run["clock"], 3),
+        "status": status,
+        "message": result.get("message", ""),
+        "error": result.get("message", "") if status == "error" else None,
+        "stages": {stage: round(seconds, 3) for stage, seconds in run["stages"].items()},
+        "http": dict(connector.stats) if connector else {"requests": 0, "retries": 0, "bytes": 0},
+        "rows": {
+            "examined": connector.records_seen if connector else 0,
+            "debtors": run["debtors"],
+            "written": written,
+            "inserted": result.get("clients_synced", 0),
+            "updated": result.get("clients_updated", 0),
+            "unchanged": result.get("clients_unchanged", 0),
+            "failed": result.get("clients_failed", 0),
+            "removed": result.get("clients_removed", 0)
+        },
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=SYNC_RUN_RETENTION_DAYS)
+    }
     try:
-        provider_id = current_user["user_id"]
-        
-        integration = await db.provider_integrations.find_one({
-            "id": integration_id,
-            "provider_id": provider_id
-        })
-        
-        if not integration:
-            raise HTTPException(status_code=404, detail="Integração não encontrada")
-        
-        if not integration.get("is_active"):
-            raise HTTPException(status_code=400, detail="Integração está desativada")
-        
-        # Mark sync as in progress
-        await db.provider_integrations.update_one(
-            {"id": integration_id},
-            {
-                "$set": {
-                    "last_sync_status": "in_progress",
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
+        await db.sync_runs.insert_one(doc)
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar execução de sincronização da integração {run['integration_id']}: {e}")
+
+
+def sync_run_stats_group() -> dict:
+    """$group accumulators shared by the provider and admin sync trend endpoints"""
+    group = {
+        "runs": {"$sum": 1},
+        "errors": {"$sum": {"$cond": [{"$eq": ["$status", "error"]}, 1, 0]}},
+        "avg_duration_seconds": {"$avg": "$duration_seconds"},
+        "max_duration_seconds": {"$max": "$duration_seconds"},
+        "http_requests": {"$sum": "$http.requests"},
+        "http_bytes": {"$sum": "$http.bytes"},
+        "rows_examined": {"$sum": "$rows.examined"},
+        "rows_written": {"$sum": "$rows.written"},
+        "rows_removed": {"$sum": "$rows.removed"}
+    }
+    for stage in SYNC_JOB_STAGES:
+        group[f"avg_{stage}_seconds"] = {"$avg": f"$stages.{stage}"}
+    return group
+
+
+def round_sync_stats(row: dict) -> dict:
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()}
+
+
+async def sync_run_trends(match: dict) -> dict:
+    """Totals and per-day series of the sync runs matching `match`"""
+    summary = await read_db.sync_runs.aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, **sync_run_stats_group()}}
+    ]).to_list(length=1)
+    daily = await read_db.sync_runs.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"$substr": ["$started_at", 0, 10]}, **sync_run_stats_group()}},
+        {"$sort": {"_id": 1}}
+    ]).to_list(length=None)
+    
+    summary = round_sync_stats(summary[0]) if summary else {"runs": 0, "errors": 0}
+    summary.pop("_id", None)
+    return {
+        "summary": summary,
+        "daily": [round_sync_stats({"date": row.pop("_id"), **row}) for row in daily]
+    }
+
+
+async def report_sync_stage(stage: str, processed: Optional[int] = None, total: Optional[int] = None):
+    """Record the running job's current stage and time it in the current sync run"""
+    mark_sync_run_stage(stage)
+    job_id = current_sync_job_id.get()
+    if not job_id:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    update = {"stage": stage, "heartbeat_at": now}
+    if processed is not None:
+        update["progress"] = {"processed": processed, "total": total}
+    try:
+        await db.sync_jobs.update_one(
+            {"id": job_id},
+            {"$set": update, "$min": {f"stage_started_at.{stage}": now}}
         )
-        
-        # Sync based on integration type
-        if integration["integration_type"] == "ixc":
-            result = await sync_ixc_data(integration, provider_id)
-        elif integration["integration_type"] == "mk-auth":
-            result = await sync_mkauth_data(integration, provider_id)
-        elif integration["integration_type"] == "sgp":
-            result = await sync_sgp_data(integration, provider_id)
-        elif integration["integration_type"] == "radiusnet":
-            result = await sync_radiusnet_data(integration, provider_id)
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar estágio do job {job_id}: {e}")
+
+
+def new_sync_job(integration: dict, trigger: str) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "integration_id": integration["id"],
+        "provider_id": integration["provider_id"],
+        "integration_type": integration["integration_type"],
+        "trigger": trigger,
+        "status": "queued",
+        "stage": None,
+        "stage_started_at": {},
+        "progress": None,
+        "result": None,
+        "active_key": integration["id"],
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "heartbeat_at": now
+    }
+
+
+async def claim_integration_sync(integration: dict, trigger: str) -> Optional[dict]:
+    """Create an already running job holding the integration's active_key; None if another sync holds it"""
+    job = new_sync_job(integration, trigger)
+    job.update({"status": "running", "worker_id": f"{sync_job_worker_id}/{trigger}", "started_at": job["created_at"]})
+    try:
+        await db.sync_jobs.insert_one(job)
+    except DuplicateKeyError:
+        return None
+    job.pop("_id", None)
+    return job
+
+
+async def enqueue_sync_job(integration: dict, trigger: str = "manual") -> tuple:
+    """Queue a sync for the integration; returns (job, created) reusing a queued/running job"""
+    job = new_sync_job(integration, trigger)
+    try:
+        await db.sync_jobs.insert_one(job)
+    except DuplicateKeyError:
+        existing = await db.sync_jobs.find_one({"active_key": integration["id"]}, SYNC_JOB_PUBLIC_PROJECTION)
+        if existing:
+            return existing, False
+        raise
+    
+    if sync_job_wakeup is not None:
+        sync_job_wakeup.set()
+    job.pop("_id", None)
+    job.pop("active_key", None)
+    return job, True
+
+
+async def execute_integration_sync(integration: dict, trigger: str = "manual", job_id: Optional[str] = None) -> dict:
+    """Run the ERP sync for an integration and record the outcome on the integration and in sync_runs"""
+    integration_id = integration["id"]
+    provider_id = integration["provider_id"]
+    
+    # Mark sync as in progress
+    await db.provider_integrations.update_one(
+        {"id": integration_id},
+        {
+            "$set": {
+                "last_sync_status": "in_progress",
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }
+        }
+    )
+    
+    # Sync based on integration type
+    run = start_sync_run(integration, trigger, job_id)
+    token = current_sync_run.set(run)
+    try:
+        if get_connector_class(integration["integration_type"]) is not None:
+            result = await sync_erp_data(integration, provider_id)
         else:
             result = {
                 "status": "error",
@@ -7120,28 +8859,215 @@ async def sync_integration_data(
                 "clients_synced": 0,
                 "clients_failed": 0
             }
-        
-        # Update integration status
-        current_time = datetime.now(timezone.utc)
+    except Exception as e:
+        await finish_sync_run(run, {"status": "error", "message": f"Erro: {str(e)}"})
+        raise
+    finally:
+        current_sync_run.reset(token)
+    await finish_sync_run(run, result)
+    
+    # Update integration status
+    current_time = datetime.now(timezone.utc)
+    await db.provider_integrations.update_one(
+        {"id": integration_id},
+        {
+            "$set": {
+                "last_sync": current_time.isoformat(),
+                "last_sync_status": result["status"],
+                "last_sync_message": result.get("message", ""),
+                "updated_at": current_time.isoformat()
+            },
+            "$inc": {"sync_count": 1}
+        }
+    )
+    return result
+
+
+async def sync_job_heartbeat(job_id: str):
+    """Refresh heartbeat_at while a job runs (stages can take longer than the stale cutoff)"""
+    while True:
+        await asyncio.sleep(SYNC_JOB_HEARTBEAT_SECONDS)
+        try:
+            await db.sync_jobs.update_one(
+                {"id": job_id, "status": "running"},
+                {"$set": {"heartbeat_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception as e:
+            print(f"⚠️ Erro ao atualizar heartbeat do job {job_id}: {e}")
+
+
+async def run_sync_job(job: dict) -> dict:
+    """Execute a job that holds the integration's active_key, then release it; returns the result"""
+    integration_id = job["integration_id"]
+    token = current_sync_job_id.set(job["id"])
+    heartbeat = asyncio.create_task(sync_job_heartbeat(job["id"]))
+    cancelled = False
+    try:
+        integration = await db.provider_integrations.find_one({"id": integration_id})
+        if not integration or not integration.get("is_active"):
+            result = {"status": "error", "message": "Integração não encontrada ou desativada"}
+        else:
+            result = await execute_integration_sync(integration, job.get("trigger", "manual"), job["id"])
+    except asyncio.CancelledError:
+        # Worker cancelado (shutdown): fecha o job e libera active_key antes de sair
+        cancelled = True
+        result = {"status": "error", "message": "Sincronização interrompida (servidor encerrando)"}
+    except Exception as e:
+        print(f"❌ Erro no job de sincronização {job['id']}: {e}")
+        result = {"status": "error", "message": f"Erro ao sincronizar dados: {str(e)}"}
         await db.provider_integrations.update_one(
             {"id": integration_id},
-            {
-                "$set": {
-                    "last_sync": current_time.isoformat(),
-                    "last_sync_status": result["status"],
-                    "last_sync_message": result.get("message", ""),
-                    "sync_count": integration.get("sync_count", 0) + 1,
-                    "updated_at": current_time.isoformat()
-                }
-            }
+            {"$set": {
+                "last_sync": datetime.now(timezone.utc).isoformat(),
+                "last_sync_status": "error",
+                "last_sync_message": f"Erro: {str(e)}"
+            }}
         )
+    finally:
+        heartbeat.cancel()
+        current_sync_job_id.reset(token)
+    
+    await db.sync_jobs.update_one(
+        {"id": job["id"]},
+        {
+            "$set": {
+                "status": "success" if result.get("status") == "success" else "error",
+                "stage": "done",
+                "result": result,
+                "finished_at": datetime.now(timezone.utc).isoformat()
+            },
+            "$unset": {"active_key": ""}
+        }
+    )
+    if cancelled:
+        raise asyncio.CancelledError()
+    return result
+
+
+async def sync_job_worker(worker_number: int):
+    """Claim queued jobs (oldest first) and run them until cancelled"""
+    while True:
+        try:
+            job = await db.sync_jobs.find_one_and_update(
+                {"status": "queued"},
+                {"$set": {
+                    "status": "running",
+                    "worker_id": f"{sync_job_worker_id}/{worker_number}",
+                    "started_at": datetime.now(timezone.utc).isoformat(),
+                    "heartbeat_at": datetime.now(timezone.utc).isoformat()
+                }},
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                await run_sync_job(job)
+                continue
+            
+            # Fila vazia: espera um novo job deste processo ou o próximo poll (jobs de outros workers)
+            sync_job_wakeup.clear()
+            try:
+                await asyncio.wait_for(sync_job_wakeup.wait(), timeout=SYNC_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Erro no worker de sincronização {worker_number}: {e}")
+            await asyncio.sleep(SYNC_JOB_POLL_SECONDS)
+
+
+async def fail_sync_jobs(query: dict) -> int:
+    """Mark the matching running jobs as interrupted and release their active_key"""
+    result = await db.sync_jobs.update_many(
+        {**query, "status": "running"},
+        {
+            "$set": {
+                "status": "error",
+                "stage": "done",
+                "result": {"status": "error", "message": "Sincronização interrompida (servidor reiniciado)"},
+                "finished_at": datetime.now(timezone.utc).isoformat()
+            },
+            "$unset": {"active_key": ""}
+        }
+    )
+    return result.modified_count
+
+
+async def fail_stale_sync_jobs() -> int:
+    """Close running jobs whose worker stopped reporting (e.g. the process was restarted)"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(minutes=SYNC_JOB_STALE_MINUTES)).isoformat()
+    return await fail_sync_jobs({"heartbeat_at": {"$lt": cutoff}})
+
+
+def sync_job_worker_alive(worker_id: str) -> bool:
+    """Whether the process (on this host) that claimed a job is still running"""
+    process_id = worker_id.split("/")[0]
+    if process_id == sync_job_worker_id:
+        return True
+    try:
+        pid = int(process_id.rsplit("-", 2)[1])
+    except (IndexError, ValueError):
+        return True  # Formato desconhecido: deixa para o corte por heartbeat
+    if pid == os.getpid():
+        return False  # Mesmo pid com outro id: execução anterior deste processo (ex.: container reiniciado)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+async def fail_orphaned_sync_jobs() -> int:
+    """At startup, close running jobs claimed on this host by a process that no longer exists"""
+    prefix = f"^{re.escape(platform.node())}-"
+    orphaned = [
+        job["id"]
+        async for job in db.sync_jobs.find(
+            {"status": "running", "worker_id": {"$regex": prefix}}, {"_id": 0, "id": 1, "worker_id": 1}
+        )
+        if not sync_job_worker_alive(job["worker_id"])
+    ]
+    if not orphaned:
+        return 0
+    return await fail_sync_jobs({"id": {"$in": orphaned}})
+
+
+def start_sync_job_workers() -> list:
+    global sync_job_wakeup
+    sync_job_wakeup = asyncio.Event()
+    return [asyncio.create_task(sync_job_worker(number)) for number in range(SYNC_JOB_WORKERS)]
+
+
+@api_router.post("/provider/integrations/{integration_id}/sync")
+async def sync_integration_data(
+    integration_id: str,
+    current_user=Depends(get_current_provider)
+):
+    """Queue a manual data synchronization and return its job id"""
+    try:
+        provider_id = current_user["user_id"]
+        
+        integration = await db.provider_integrations.find_one({
+            "id": integration_id,
+            "provider_id": provider_id
+        })
+        
+        if not integration:
+            raise HTTPException(status_code=404, detail="Integração não encontrada")
+        
+        if not integration.get("is_active"):
+            raise HTTPException(status_code=400, detail="Integração está desativada")
+        
+        job, created = await enqueue_sync_job(integration)
         
         return {
-            "success": result["status"] == "success",
-            "message": result.get("message", ""),
-            "clients_synced": result.get("clients_synced", 0),
-            "clients_failed": result.get("clients_failed", 0),
-            "synced_at": datetime.now(timezone.utc).isoformat()
+            "success": True,
+            "job_id": job["id"],
+            "status": job["status"],
+            "already_running": not created,
+            "message": "Sincronização iniciada" if created else "Sincronização já em andamento para esta integração"
         }
         
     except HTTPException:
@@ -7151,6 +9077,49 @@ async def sync_integration_data(
         raise HTTPException(status_code=500, detail=f"Erro ao sincronizar dados: {str(e)}")
 
 
+@api_router.get("/provider/integrations/sync-jobs/{job_id}")
+async def get_sync_job(
+    job_id: str,
+    current_user=Depends(get_current_provider)
+):
+    """Poll a sync job's status, current stage and final result"""
+    job = await db.sync_jobs.find_one(
+        {"id": job_id, "provider_id": current_user["user_id"]},
+        SYNC_JOB_PUBLIC_PROJECTION
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job de sincronização não encontrado")
+    job["stages"] = SYNC_JOB_STAGES
+    return job
+
+
+@api_router.get("/provider/integrations/{integration_id}/sync-runs")
+async def get_integration_sync_runs(
+    integration_id: str,
+    days: int = 30,
+    limit: int = 20,
+    current_user=Depends(get_current_provider)
+):
+    """Recent sync runs of an integration with stage timings and the trend over the last `days`"""
+    provider_id = current_user["user_id"]
+    integration = await read_db.provider_integrations.find_one(
+        {"id": integration_id, "provider_id": provider_id}, {"_id": 0, "id": 1}
+    )
+    if not integration:
+        raise HTTPException(status_code=404, detail="Integração não encontrada")
+    
+    days = max(1, min(days, SYNC_RUN_RETENTION_DAYS))
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    runs = await read_db.sync_runs.find(
+        {"integration_id": integration_id, "provider_id": provider_id},
+        SYNC_RUN_PUBLIC_PROJECTION
+    ).sort("started_at", -1).limit(max(1, min(limit, 100))).to_list(length=None)
+    trends = await sync_run_trends(
+        {"integration_id": integration_id, "provider_id": provider_id, "started_at": {"$gte": since}}
+    )
+    return {"days": days, "stages": SYNC_JOB_STAGES, "runs": runs, **trends}
+
+
 # Cleanup endpoint removido - reconciliação agora é automática na sincronização
 
 # @api_router.post("/provider/integrations/{integration_id}/cleanup")
@@ -7179,140 +9148,42 @@ async def cleanup_clients_without_debts(
         print(f"=== CLEANUP INICIADO: Removendo clientes sem débitos do {integration_type.upper()}")
         
         # Step 1: Get list of CPFs with active debts from ERP
-        cpfs_com_debito = set()
+        if get_connector_class(integration_type) is None:
+            raise HTTPException(status_code=400, detail="Tipo de integração não suportado")
         
-        if integration_type == "ixc":
-            # Buscar clientes com débitos no IXC
-            import requests
-            import base64
-            from datetime import date, timedelta
-            
-            api_url = integration["api_url"]
-            token = integration["credentials"]["token"]
-            
-            # Encode token em Base64 para Basic Auth
-            token_base64 = base64.b64encode(token.encode()).decode()
-            
-            # CLEANUP: Buscar TODOS os títulos vencidos (não apenas >60 dias)
-            # Diferente da sincronização, o cleanup precisa ver TODOS os débitos
-            # para não remover clientes que têm débitos entre 1-60 dias
-            financeiro_url = f"{api_url}/fn_areceber"
-            data_hoje = date.today().isoformat()
-            
-            financeiro_payload = {
-                "qtype": "fn_areceber.data_vencimento",
-                "query": data_hoje,
-                "oper": "<",  # Menor que hoje = qualquer débito vencido
-                "page": "1",
-                "rp": "5000",
-                "sortname": "fn_areceber.data_vencimento",
-                "sortorder": "asc"
-            }
-            
-            print(f"=== CLEANUP: Buscando TODOS os títulos vencidos (não apenas >60 dias) para evitar remoção incorreta")
-            
-            headers = {
-                "ixcsoft": "listar",  # Header recomendado pelo IXC
-                "Content-Type": "application/json",
-                "Authorization": f"Basic {token_base64}"
-            }
-            
-            try:
-                financeiro_response = requests.post(
-                    financeiro_url,
-                    headers=headers,
-                    json=financeiro_payload,
-                    timeout=30,
-                    verify=False
-                )
-                
-                if financeiro_response.status_code == 200:
-                    financeiro_json = financeiro_response.json()
-                    titulos = financeiro_json.get('registros', [])
-                    
-                    print(f"=== CLEANUP: {len(titulos)} títulos vencidos encontrados no IXC (TODOS os vencimentos)")
-                    
-                    # Agrupar por cliente e filtrar por status "A"
-                    clientes_com_debito_ixc = {}
-                    for titulo in titulos:
-                        status = titulo.get('status', 'A')
-                        if status not in ['A', 'a']:
-                            continue
-                        
-                        cliente_id = titulo.get('cliente_id') or titulo.get('id_cliente')
-                        valor_aberto = float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0))
-                        
-                        if cliente_id and valor_aberto > 0:
-                            if cliente_id not in clientes_com_debito_ixc:
-                                clientes_com_debito_ixc[cliente_id] = True
-                    
-                    print(f"=== CLEANUP: {len(clientes_com_debito_ixc)} clientes únicos com débitos no IXC")
-                    
-                    # Buscar dados completos dos clientes com débito
-                    cliente_url = f"{api_url}/cliente"
-                    for cliente_id in clientes_com_debito_ixc.keys():
-                        try:
-                            cliente_payload = {
-                                "qtype": "cliente.id",
-                                "query": str(cliente_id),
-                                "oper": "=",
-                                "page": "1",
-                                "rp": "1"
-                            }
-                            
-                            cliente_response = requests.post(
-                                cliente_url,
-                                headers=headers,
-                                json=cliente_payload,
-                                timeout=10,
-                                verify=False
-                            )
-                            
-                            if cliente_response.status_code == 200:
-                                cliente_json = cliente_response.json()
-                                clientes = cliente_json.get('registros', [])
-                                
-                                if clientes:
-                                    cliente = clientes[0]
-                                    cpf = cliente.get('cnpj_cpf', '')
-                                    if cpf:
-                                        # Limpa CPF
-                                        cpf_limpo = ''.join(filter(str.isdigit, cpf))
-                                        if cpf_limpo:
-                                            cpfs_com_debito.add(cpf_limpo)
-                        except:
-                            continue
-                    
-                    print(f"=== CLEANUP: {len(cpfs_com_debito)} CPFs com débitos confirmados")
-                    
-                    # VALIDAÇÃO DE SEGURANÇA: Se não encontrou nenhum CPF com débito, pode ser um problema
-                    # Retorna aviso ao invés de remover todos os clientes
-                    if len(titulos) == 0 and len(cpfs_com_debito) == 0:
-                        return {
-                            "success": True,
-                            "message": "⚠️ Nenhum título vencido encontrado no IXC. Nenhum cliente foi removido por segurança.",
-                            "clients_removed": 0,
-                            "removed_clients": []
-                        }
-                    
-                else:
-                    raise HTTPException(status_code=500, detail=f"Erro ao consultar IXC: {financeiro_response.status_code}")
-                    
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Erro ao consultar IXC: {str(e)}")
+        # CLEANUP: o conector busca TODOS os débitos vencidos (não apenas os da sincronização)
+        # para não remover clientes que têm débitos recentes
+        connector = get_connector(integration, for_sync=True)
+        try:
+            cpfs_com_debito = await connector.cleanup_snapshot()
+        except NotImplementedError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao consultar {connector.display_name}: {str(e)}")
         
-        elif integration_type in ["mk-auth", "sgp", "radiusnet"]:
-            raise HTTPException(status_code=501, detail=f"Cleanup não implementado para {integration_type}")
+        print(f"=== CLEANUP: {connector.records_seen} registros lidos, {len(cpfs_com_debito)} CPFs com débitos confirmados")
+        
+        if not connector.listing_complete:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Listagem do {connector.display_name} incompleta. Nenhum cliente foi removido; tente novamente"
+            )
+        
+        # VALIDAÇÃO DE SEGURANÇA: Se não encontrou nenhum CPF com débito, pode ser um problema
+        # Retorna aviso ao invés de remover todos os clientes
+        if connector.records_seen == 0 and len(cpfs_com_debito) == 0:
+            return {
+                "success": True,
+                "message": f"⚠️ Nenhum título vencido encontrado no {connector.display_name}. Nenhum cliente foi removido por segurança.",
+                "clients_removed": 0,
+                "removed_clients": []
+            }
         
         # Step 2: Find all clients imported from this ERP
         clientes_importados = await db.clients.find({
             "provider_id": provider_id,
-            "is_active": True,
-            "$or": [
-                {"reason": {"$regex": f"Importado do {integration_type.upper()}", "$options": "i"}},
-                {"inclusion_reason": {"$regex": f"Importado do {integration_type.upper()}", "$options": "i"}},
-                {"observations": {"$regex": f"Importado do {integration_type.upper()}", "$options": "i"}}
-            ]
+            "integration_id": integration_id,
+            "is_active": True
         }).to_list(length=None)
         
         print(f"=== CLEANUP: {len(clientes_importados)} clientes importados encontrados no banco")
@@ -7320,8 +9191,9 @@ async def cleanup_clients_without_debts(
         # Step 3: Remove clients that don't have debts in ERP
         clientes_removidos = 0
         clientes_removidos_lista = []
+        removed_cpfs = set()
         
-        print(f"=== CLEANUP DEBUG: CPFs com débito no IXC: {cpfs_com_debito}")
+        print(f"=== CLEANUP DEBUG: CPFs com débito no {integration_type.upper()}: {cpfs_com_debito}")
         
         for cliente in clientes_importados:
             cpf_db = cliente.get('cpf', '')
@@ -7344,12 +9216,14 @@ async def cleanup_clients_without_debts(
                     }
                 )
                 
+                removed_cpfs.add(cpf_db_limpo)
                 clientes_removidos += 1
                 clientes_removidos_lista.append({
                     "name": cliente.get('name'),
                     "cpf": cpf_db
                 })
         
+        await refresh_negative_registry(removed_cpfs)
         print(f"=== CLEANUP CONCLUÍDO: {clientes_removidos} clientes removidos")
         
         return {
@@ -7395,6 +9269,8 @@ async def delete_integration(
             "id": integration_id,
             "provider_id": provider_id
         })
+        unschedule_integration_auto_sync(integration_id)
+        await notify_auto_sync_change()
         
         return {
             "success": True,
@@ -7445,6 +9321,8 @@ async def update_auto_sync_settings(
             {"id": integration_id, "provider_id": provider_id},
             {"$set": update_data}
         )
+        schedule_integration_auto_sync({**integration, **update_data})
+        await notify_auto_sync_change()
         
         result = {
             "success": True,
@@ -7502,60 +9380,33 @@ async def run_auto_sync_all(current_user=Depends(get_current_admin)):
             if diff_minutes <= 5:  # Within 5-minute window
                 print(f"=== Sincronizando integração {integration['integration_type']} do provider {integration['provider_id']} ===")
                 
+                # Vai para a fila de sync_jobs como o sync manual: active_key impede rodar junto
+                # com o agendamento do APScheduler ou outro cron na mesma janela
                 try:
-                    # Run sync based on integration type
-                    integration_type = integration["integration_type"]
-                    provider_id = integration["provider_id"]
-                    
-                    if integration_type == "ixc":
-                        sync_result = await sync_ixc_data(integration, provider_id)
-                    elif integration_type == "mk-auth":
-                        sync_result = await sync_mkauth_data(integration, provider_id)
-                    elif integration_type == "sgp":
-                        sync_result = await sync_sgp_data(integration, provider_id)
-                    elif integration_type == "radiusnet":
-                        sync_result = await sync_radiusnet_data(integration, provider_id)
-                    else:
-                        sync_result = {"status": "error", "message": f"Tipo de integração não suportado: {integration_type}"}
-                    
-                    # Update last_sync
-                    await db.provider_integrations.update_one(
-                        {"id": integration["id"]},
-                        {
-                            "$set": {
-                                "last_sync": datetime.now(timezone.utc).isoformat(),
-                                "last_sync_status": sync_result.get("status", "error"),
-                                "last_sync_message": sync_result.get("message", ""),
-                                "sync_count": integration.get("sync_count", 0) + 1
-                            }
-                        }
-                    )
-                    
+                    job, created = await enqueue_sync_job(integration, "cron")
                     results.append({
                         "integration_id": integration["id"],
-                        "integration_type": integration_type,
-                        "provider_id": provider_id,
-                        "status": sync_result.get("status"),
-                        "message": sync_result.get("message"),
-                        "clients_synced": sync_result.get("clients_synced", 0)
+                        "integration_type": integration["integration_type"],
+                        "provider_id": integration["provider_id"],
+                        "status": "queued" if created else "skipped",
+                        "message": "Sincronização enfileirada" if created else "Sincronização já em andamento",
+                        "job_id": job["id"]
                     })
-                    
-                    print(f"=== Sync concluído: {sync_result.get('message')} ===")
+                    print(f"=== {'Job enfileirado' if created else 'Já em andamento, ignorado'}: {job['id']} ===")
                     
                 except Exception as e:
-                    print(f"=== ERRO ao sincronizar integração {integration['id']}: {e} ===")
+                    print(f"=== ERRO ao enfileirar integração {integration['id']}: {e} ===")
                     results.append({
                         "integration_id": integration["id"],
                         "integration_type": integration.get("integration_type"),
                         "provider_id": integration.get("provider_id"),
                         "status": "error",
-                        "message": str(e),
-                        "clients_synced": 0
+                        "message": str(e)
                     })
         
         return {
             "success": True,
-            "message": f"Auto-sync executado para {len(results)} integrações",
+            "message": f"Auto-sync enfileirado para {len(results)} integrações",
             "total_integrations": len(integrations),
             "synced_count": len(results),
             "results": results
@@ -7570,438 +9421,97 @@ async def run_auto_sync_all(current_user=Depends(get_current_admin)):
 
 
 
-async def test_ixc_connection(integration: dict) -> tuple[bool, str]:
-    """Test connection to IXC API"""
-    try:
-        import requests
-        import base64
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        token = credentials.get("token")
-        
-        # Token formato: ID:HASH (ex: 16:8d3e2a7db89f...)
-        if ':' not in token:
-            return False, "❌ Token inválido. Formato esperado: ID:HASH (ex: 16:8d3e2a7db...)"
-        
-        # Codifica token em Base64 para Basic Auth
-        token_base64 = base64.b64encode(token.encode()).decode()
-        
-        # IXC API usa GET com data + Basic Auth + header ixcsoft
-        test_url = f"{api_url}/cliente"
-        
-        headers = {
-            "ixcsoft": "listar",
-            "Content-Type": "application/json",
-            "Authorization": f"Basic {token_base64}"
-        }
-        
-        # Payload mínimo para teste
-        payload = {
-            "qtype": "cliente.id",
-            "query": "1",
-            "oper": ">=",
-            "page": "1",
-            "rp": "1",
-            "sortname": "cliente.id",
-            "sortorder": "desc"
-        }
-        
-        # GET com data (formato usado pelo IXC)
-        response = requests.get(
-            test_url,
-            headers=headers,
-            json=payload,
-            timeout=10,
-            verify=False
-        )
-        
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                if isinstance(result, dict):
-                    if result.get("type") == "error":
-                        return False, f"❌ Erro IXC: {result.get('mensagem', 'Token inválido')}"
-                    if result.get("total") is not None or result.get("registros") is not None:
-                        return True, "✅ Conexão com IXC estabelecida com sucesso"
-                return True, "✅ Conexão com IXC estabelecida"
-            except Exception:
-                return True, "✅ Conexão com IXC estabelecida"
-        elif response.status_code == 401:
-            # Verifica se o token está correto
-            return False, "❌ Erro 401: Token inválido. Verifique se o token está correto e ativo no painel IXC. Contate o suporte do IXC se necessário."
-        elif response.status_code == 403:
-            return False, "❌ Acesso negado. Verifique permissões"
-        else:
-            return False, f"❌ Erro HTTP {response.status_code}"
-            
-    except ValueError:
-        return False, "❌ Token mal formatado. Formato esperado: ID:HASH"
-    except requests.exceptions.SSLError:
-        return False, "❌ Erro de SSL"
-    except requests.exceptions.Timeout:
-        return False, "❌ Timeout (10s)"
-    except requests.exceptions.ConnectionError:
-        return False, "❌ Erro de conexão"
-    except Exception as e:
-        return False, f"❌ Erro: {str(e)}"
-
-
-async def test_mkauth_connection(integration: dict) -> tuple[bool, str]:
-    """Test connection to MK-Auth API"""
+# ERP sync
+# Um único fluxo para todos os ERPs: o conector (erp_connectors.py) lista os
+# devedores, o sync compara o hash de cada um com o gravado no cliente, busca
+# detalhes só dos novos/alterados, importa e reconcilia pelo id externo.
+async def sync_erp_data(integration: dict, provider_id: str) -> dict:
+    """Sync delinquent clients from the integration's ERP through its connector"""
+    started_at = datetime.now(timezone.utc)
+    integration_type = integration["integration_type"]
     try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        api_token = credentials.get("api_token")
-        
-        # Try to connect to MK-Auth API
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Test endpoint - adjust based on MK-Auth documentation
-        test_url = f"{api_url}/api/v1/health"
-        response = requests.get(test_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            return True, "✅ Conexão com MK-Auth estabelecida com sucesso"
-        elif response.status_code == 401:
-            return False, "❌ Token de autenticação inválido"
-        else:
-            return False, f"❌ Erro HTTP {response.status_code}"
-            
-    except requests.exceptions.Timeout:
-        return False, "❌ Timeout na conexão com MK-Auth. Verifique a URL"
-    except requests.exceptions.ConnectionError:
-        return False, "❌ Erro de conexão. Verifique a URL da API"
-    except Exception as e:
-        return False, f"❌ Erro inesperado: {str(e)}"
-
-
-async def test_sgp_connection(integration: dict) -> tuple[bool, str]:
-    """Test connection to SGP API"""
-    try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        api_key = credentials.get("api_key")
-        api_secret = credentials.get("api_secret")
-        
-        # Try to authenticate with SGP
-        headers = {
-            "X-API-Key": api_key,
-            "X-API-Secret": api_secret,
-            "Content-Type": "application/json"
-        }
-        
-        # Test endpoint - adjust based on SGP documentation
-        test_url = f"{api_url}/api/auth/validate"
-        response = requests.get(test_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            return True, "✅ Conexão com SGP estabelecida com sucesso"
-        elif response.status_code == 401 or response.status_code == 403:
-            return False, "❌ Credenciais inválidas (API Key ou Secret incorretos)"
-        else:
-            return False, f"❌ Erro HTTP {response.status_code}"
-            
-    except requests.exceptions.Timeout:
-        return False, "❌ Timeout na conexão com SGP. Verifique a URL"
-    except requests.exceptions.ConnectionError:
-        return False, "❌ Erro de conexão. Verifique a URL da API"
-    except Exception as e:
-        return False, f"❌ Erro inesperado: {str(e)}"
-
-
-async def test_radiusnet_connection(integration: dict) -> tuple[bool, str]:
-    """Test connection to RadiusNet API"""
-    try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        username = credentials.get("username")
-        password = credentials.get("password")
-        
-        # Try to authenticate with RadiusNet
-        auth_url = f"{api_url}/api/login"
-        auth_data = {
-            "username": username,
-            "password": password
-        }
-        
-        response = requests.post(auth_url, json=auth_data, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success') or result.get('token'):
-                return True, "✅ Conexão com RadiusNet estabelecida com sucesso"
-            else:
-                return False, "❌ Falha na autenticação"
-        elif response.status_code == 401:
-            return False, "❌ Credenciais inválidas"
-        else:
-            return False, f"❌ Erro HTTP {response.status_code}"
-            
-    except requests.exceptions.Timeout:
-        return False, "❌ Timeout na conexão com RadiusNet. Verifique a URL"
-    except requests.exceptions.ConnectionError:
-        return False, "❌ Erro de conexão. Verifique a URL da API"
-    except Exception as e:
-        return False, f"❌ Erro inesperado: {str(e)}"
-
-
-async def sync_ixc_data(integration: dict, provider_id: str) -> dict:
-    """Sync client data from IXC"""
-    try:
-        import requests
-        import base64
-        import json
-        
-        # LOG COMPLETO
         print("=" * 80)
-        print("DEBUG sync_ixc_data - INÍCIO")
-        print(f"Integration completo: {json.dumps(integration, default=str, indent=2)}")
-        print(f"Provider ID: {provider_id}")
-        
-        credentials = integration.get("credentials", {})
-        print(f"Credentials: {credentials}")
-        print(f"Tipo credentials: {type(credentials)}")
-        
-        api_url = integration.get("api_url", "").rstrip('/')
-        print(f"API URL: {api_url}")
-        
-        token = credentials.get("token", "")
-        print(f"Token bruto: '{token}'")
-        print(f"Tipo token: {type(token)}")
-        print(f"Comprimento token: {len(str(token))}")
-        
-        # Converte token para string se necessário
-        if token:
-            token = str(token).strip()
-            print(f"Token após conversão: '{token}'")
-            print(f"Tem ':' ? {':' in token}")
-        
-        # Verifica formato do token
-        if not token or ':' not in token:
-            print("ERRO: Token mal formatado!")
-            print("=" * 80)
-            return {
-                "status": "error",
-                "message": f"Token mal formatado. Token recebido: '{token}' (tipo: {type(token)})",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        # Codifica token em Base64
-        token_base64 = base64.b64encode(token.encode()).decode()
+        print(f"SYNC {integration_type.upper()} - INÍCIO (provider {provider_id}, integração {integration.get('id')})")
         
-        headers = {
-            "ixcsoft": "listar",
-            "Content-Type": "application/json",
-            "Authorization": f"Basic {token_base64}"
-        }
+        connector = get_connector(integration, for_sync=True)
+        note_sync_run(connector=connector)
+        name = connector.display_name
         
-        # PASSO 1: Busca títulos VENCIDOS HÁ MAIS DE 60 DIAS (data_vencimento < hoje - 60 dias)
-        from datetime import date, timedelta
-        
-        financeiro_url = f"{api_url}/fn_areceber"
-        
-        # Data limite: hoje - 60 dias
-        # Busca apenas títulos com MAIS DE 60 DIAS de atraso
-        data_limite = (date.today() - timedelta(days=60)).isoformat()
-        
-        # Buscar apenas títulos com status "A" (Aberto/Em vermelho)
-        # e que estejam vencidos há MAIS DE 60 DIAS
-        # IMPORTANTE: grid_param filtra títulos ATIVOS (status='A') E LIBERADOS (liberado='S')
-        # Isso evita importar títulos pagos, cancelados ou não liberados pelo IXC
-        financeiro_payload = {
-            "qtype": "fn_areceber.data_vencimento",
-            "query": data_limite,
-            "oper": "<",  # Menor que (hoje - 60 dias) = mais de 60 dias de atraso
-            "page": "1",
-            "rp": "5000",  # Aumentado para pegar mais títulos
-            "sortname": "fn_areceber.data_vencimento",
-            "sortorder": "asc",  # Mais antigos primeiro
-            "grid_param": '[{"TB":"fn_areceber.status", "OP" : "=", "P" : "A"},{"TB":"fn_areceber.liberado", "OP" : "=", "P" : "S"}]'  # Apenas títulos ativos E liberados
-        }
-        
-        print(f"=== Buscando títulos ATIVOS (status='A'), LIBERADOS (liberado='S') E VENCIDOS HÁ MAIS DE 60 DIAS (data_vencimento < {data_limite})")
-        
-        financeiro_response = requests.post(
-            financeiro_url,
-            headers=headers,
-            json=financeiro_payload,
-            timeout=30,
-            verify=False
-        )
-        
-        if financeiro_response.status_code != 200:
+        # PASSO 1: Lista os devedores no ERP (página a página)
+        await report_sync_stage("fetch")
+        debtors = {}
+        try:
+            async for page in connector.iter_debtors():
+                for debtor in page:
+                    debtors[debtor["external_id"]] = debtor
+                await report_sync_stage("fetch", processed=connector.records_seen)
+        except ErpDeadlineExceeded:
+            raise
+        except (ErpError, ValueError) as e:
+            # Listagem incompleta: não importa nem reconcilia com dados parciais
             return {
                 "status": "error",
-                "message": f"Erro ao buscar financeiro: HTTP {financeiro_response.status_code}",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        financeiro_json = financeiro_response.json()
-        titulos = financeiro_json.get('registros', [])
-        
-        print(f"=== Total de títulos vencidos retornados pela API: {len(titulos)}")
-        
-        if not titulos:
-            return {
-                "status": "success",
-                "message": "Nenhum título vencido encontrado no IXC",
+                "message": f"Erro ao buscar devedores no {name}: {str(e)}",
                 "clients_synced": 0,
                 "clients_failed": 0
             }
         
-        # PASSO 2: Agrupa títulos por cliente e pega APENAS OS 2 MAIS ANTIGOS
-        # A API já retorna apenas títulos com status='A' (Ativo) e liberado='S'
-        cliente_debitos = {}
-        for titulo in titulos:
-            cliente_id = titulo.get('cliente_id') or titulo.get('id_cliente')
-            valor_aberto = float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0))
-            data_vencimento = titulo.get('data_vencimento', '')
-            
-            # Apenas títulos com valor > 0
-            if cliente_id and valor_aberto > 0:
-                if cliente_id not in cliente_debitos:
-                    cliente_debitos[cliente_id] = {
-                        'valor_total': 0,
-                        'titulos': []
-                    }
-                cliente_debitos[cliente_id]['titulos'].append({
-                    'valor': valor_aberto,
-                    'data_vencimento': data_vencimento,
-                    'titulo': titulo
-                })
-        
-        print(f"=== Títulos válidos (status='A', liberado='S' e valor > 0): {sum(len(c['titulos']) for c in cliente_debitos.values())}")
-        
-        # PASSO 2.5: Para cada cliente, pega APENAS os 2 títulos mais antigos
-        print("=== Processando clientes com títulos vencidos e em aberto...")
-        for cliente_id in cliente_debitos.keys():
-            # Ordena por data de vencimento (mais antigo primeiro)
-            titulos_ordenados = sorted(
-                cliente_debitos[cliente_id]['titulos'],
-                key=lambda x: x['data_vencimento']
-            )
-            
-            # Pega APENAS os 2 primeiros (mais antigos)
-            dois_mais_antigos = titulos_ordenados[:2]
-            
-            # Soma apenas esses 2
-            cliente_debitos[cliente_id]['valor_total'] = sum(t['valor'] for t in dois_mais_antigos)
-            cliente_debitos[cliente_id]['titulos'] = [t['titulo'] for t in dois_mais_antigos]
-            cliente_debitos[cliente_id]['quantidade'] = len(dois_mais_antigos)
-            
-            print(f"Cliente {cliente_id}: {len(dois_mais_antigos)} título(s) vencido(s) - R$ {cliente_debitos[cliente_id]['valor_total']:.2f}")
+        print(f"=== {connector.records_seen} registro(s) lidos, {len(debtors)} devedor(es) no {name}")
+        note_sync_run(debtors=len(debtors))
         
-        if not cliente_debitos:
+        if not debtors:
+            if not connector.listing_complete:
+                return {
+                    "status": "error",
+                    "message": f"Listagem do {name} incompleta: nenhum devedor recebido e nenhum cliente removido",
+                    "clients_synced": 0,
+                    "clients_failed": 0
+                }
+            if not connector.reconcile_when_empty and not connector.records_seen:
+                # Listagem vazia pode ser filtro/erro do ERP: não remove ninguém
+                return {
+                    "status": "success",
+                    "message": f"Nenhum título vencido encontrado no {name}",
+                    "clients_synced": 0,
+                    "clients_failed": 0
+                }
             print("=== Nenhum cliente com débito encontrado. Executando reconciliação para remover todos os importados...")
-            # RECONCILIAÇÃO: Remover TODOS os clientes importados do IXC, pois não há mais ninguém com débito
-            clientes_importados = await db.clients.find({
-                "provider_id": provider_id,
-                "is_active": True,
-                "$or": [
-                    {"reason": {"$regex": "Importado do IXC", "$options": "i"}},
-                    {"inclusion_reason": {"$regex": "Importado do IXC", "$options": "i"}},
-                    {"observations": {"$regex": "Importado do IXC", "$options": "i"}}
-                ]
-            }).to_list(length=None)
-            
-            clients_removed = 0
-            for cliente in clientes_importados:
-                print(f"=== RECONCILIAÇÃO: Inativando {cliente.get('name')} (CPF: {cliente.get('cpf')}) - sem débitos no IXC")
-                await db.clients.update_one(
-                    {"id": cliente["id"]},
-                    {
-                        "$set": {
-                            "is_active": False,
-                            "deleted_at": datetime.now(timezone.utc).isoformat(),
-                            "updated_at": datetime.now(timezone.utc).isoformat()
-                        }
-                    }
-                )
-                clients_removed += 1
-            
+            try:
+                clients_removed = await reconcile_imported_clients(provider_id, integration["id"], [])
+            except ReconcileLimitExceeded as e:
+                print(f"⚠️ RECONCILIAÇÃO {integration_type.upper()} CANCELADA: {e}")
+                return {
+                    "status": "success",
+                    "message": f"Nenhum cliente com débito encontrado no {name}. ⚠️ {e}",
+                    "clients_synced": 0,
+                    "clients_failed": 0
+                }
+            await save_sync_watermark(integration, started_at, True)
             return {
                 "status": "success",
-                "message": f"Nenhum cliente com débito encontrado no IXC. {clients_removed} cliente(s) removido(s) automaticamente.",
+                "message": f"Nenhum cliente com débito encontrado no {name}. {clients_removed} cliente(s) removido(s) automaticamente.",
                 "clients_synced": 0,
                 "clients_failed": 0,
                 "clients_removed": clients_removed
             }
         
-        # PASSO 3: Busca dados dos clientes com débito
-        clientes_com_debito = []
-        
-        for cliente_id, debito_info in cliente_debitos.items():
-            cliente_url = f"{api_url}/cliente"
-            cliente_payload = {
-                "qtype": "cliente.id",
-                "query": str(cliente_id),
-                "oper": "=",
-                "page": "1",
-                "rp": "1"
-            }
-            
-            try:
-                cliente_response = requests.get(
-                    cliente_url,
-                    headers=headers,
-                    json=cliente_payload,
-                    timeout=10,
-                    verify=False
-                )
-                
-                if cliente_response.status_code == 200:
-                    cliente_json = cliente_response.json()
-                    clientes = cliente_json.get('registros', [])
-                    
-                    if clientes:
-                        cliente = clientes[0]
-                        # Adiciona valor de débito real ao cliente (apenas 2 títulos mais antigos)
-                        cliente['valor_debito'] = debito_info['valor_total']
-                        cliente['numero_titulos'] = debito_info['quantidade']
-                        cliente['total_titulos_vencidos'] = debito_info['quantidade']
-                        
-                        # Adiciona informações dos boletos (até 2 títulos mais antigos)
-                        cliente['boletos'] = []
-                        for titulo in debito_info['titulos']:
-                            # Gera URL do boleto se não houver gateway_link
-                            url_boleto = titulo.get('gateway_link', '')
-                            if not url_boleto and titulo.get('id'):
-                                # Gera URL do boleto usando o ID do título
-                                # Formato padrão IXC: https://seuixc.com.br/central_assinante_web/boleto/{id_titulo}
-                                url_boleto = f"{api_url.replace('/webservice/v1', '')}/central_assinante_web/boleto/{titulo.get('id')}"
-                            
-                            boleto_info = {
-                                'valor': float(titulo.get('valor_aberto', 0) or titulo.get('valor', 0)),
-                                'vencimento': titulo.get('data_vencimento', ''),
-                                'linha_digitavel': titulo.get('linha_digitavel', ''),
-                                'url_boleto': url_boleto,
-                                'nosso_numero': titulo.get('nn_boleto', ''),
-                                'id_titulo': titulo.get('id', ''),
-                                'codigo_barras': titulo.get('codigo_barras', '')
-                            }
-                            # Só adiciona se tiver informações válidas
-                            if boleto_info['valor'] > 0:
-                                cliente['boletos'].append(boleto_info)
-                                print(f"DEBUG - Boleto adicionado: ID={boleto_info['id_titulo']}, Valor={boleto_info['valor']}, URL={boleto_info['url_boleto']}, Linha={boleto_info['linha_digitavel'][:20]}...")
-                        
-                        clientes_com_debito.append(cliente)
-            except Exception as e:
-                print(f"Erro ao buscar cliente {cliente_id}: {e}")
-                continue
-        
-        if not clientes_com_debito:
+        # PASSO 2: Sync incremental - só busca/regrava devedores que mudaram desde o
+        # último sync (o sync completo periódico ignora os hashes)
+        full_sync = integration_needs_full_sync(integration)
+        alterados = list(debtors.values())
+        if not full_sync:
+            await report_sync_stage("hash_lookup")
+            known_hashes = await load_known_hashes(integration["id"], debtors.keys(), "erp_debt_hash")
+            alterados = [debtor for debtor in alterados if known_hashes.get(debtor["external_id"]) != debtor["hash"]]
+        clients_unchanged = len(debtors) - len(alterados)
+        print(f"=== Sync {'completo' if full_sync else 'incremental'}: {len(alterados)} devedor(es) novos ou alterados, {clients_unchanged} sem alteração")
+        
+        # PASSO 3: Detalhes dos devedores alterados (no IXC, /cliente em lotes de ids)
+        await report_sync_stage("details")
+        records = await connector.fetch_details(alterados) if alterados else []
+        print(f"=== {len(records)}/{len(alterados)} cliente(s) encontrados no {name}")
+        
+        if alterados and not records:
             return {
                 "status": "error",
                 "message": "Erro ao buscar dados dos clientes",
@@ -8009,163 +9519,69 @@ async def sync_ixc_data(integration: dict, provider_id: str) -> dict:
                 "clients_failed": 0
             }
         
-        # Importa clientes com débito real
-        result = await import_clients_to_system(clientes_com_debito, provider_id, "ixc")
-        
-        # PASSO 3: RECONCILIAÇÃO - Inativa clientes que não estão mais no IXC
-        # Pega lista de CPFs dos clientes que vieram do IXC nesta sincronização
-        cpfs_atuais_ixc = set()
-        for cliente in clientes_com_debito:
-            cpf = cliente.get('cnpj_cpf', '')
-            if cpf:
-                # Limpa CPF (remove pontos, traços)
-                cpf_limpo = ''.join(filter(str.isdigit, cpf))
-                if cpf_limpo:
-                    cpfs_atuais_ixc.add(cpf_limpo)
-        
-        print(f"=== RECONCILIAÇÃO: {len(cpfs_atuais_ixc)} CPFs ativos no IXC")
-        
-        # Busca todos os clientes IMPORTADOS DO IXC deste provider que estão ATIVOS
-        clientes_importados_ixc = await db.clients.find({
-            "provider_id": provider_id,
-            "is_active": True,
-            "$or": [
-                {"reason": {"$regex": "Importado do IXC", "$options": "i"}},
-                {"inclusion_reason": {"$regex": "Importado do IXC", "$options": "i"}},
-                {"observations": {"$regex": "Importado do IXC", "$options": "i"}}
-            ]
-        }).to_list(length=None)
+        result = await import_clients_to_system(
+            records, provider_id, integration_type, integration["id"], skip_unchanged=not full_sync
+        )
+        if clients_unchanged:
+            if not records:
+                result["status"] = "success"  # Nada mudou no ERP desde o último sync
+            result["clients_unchanged"] = result.get("clients_unchanged", 0) + clients_unchanged
+            result["message"] = (
+                f"Sincronização concluída: {result.get('clients_synced', 0)} novos, {result.get('clients_updated', 0)} atualizados, "
+                f"{result.get('clients_failed', 0)} falhas, {result['clients_unchanged']} sem alteração"
+            )
+            if result.get("clients_skipped"):
+                result["message"] += f", {result['clients_skipped']} já cadastrados manualmente (não alterados)"
         
-        print(f"=== RECONCILIAÇÃO: {len(clientes_importados_ixc)} clientes importados do IXC no sistema")
+        # Se nenhum cliente do ERP pôde ser importado, não reconcilia (evita apagar tudo por erro de formato)
+        if records and result.get("status") == "error":
+            return result
         
-        # Inativa clientes que não estão mais no IXC
+        # PASSO 4: RECONCILIAÇÃO - Inativa clientes que não estão mais entre os devedores
+        # (inclusive os que falharam nos detalhes continuam, para não removê-los por engano)
         clients_removed = 0
-        for cliente_db in clientes_importados_ixc:
-            cpf_db = cliente_db.get('cpf', '')
-            # Limpa CPF do banco
-            cpf_db_limpo = ''.join(filter(str.isdigit, cpf_db))
-            
-            # Se o CPF NÃO está na lista atual do IXC, inativa o cliente
-            if cpf_db_limpo and cpf_db_limpo not in cpfs_atuais_ixc:
-                print(f"=== RECONCILIAÇÃO: Inativando cliente {cliente_db.get('name')} (CPF: {cpf_db}) - não tem mais débitos no IXC")
-                
-                await db.clients.update_one(
-                    {"id": cliente_db["id"]},
-                    {
-                        "$set": {
-                            "is_active": False,
-                            "deleted_at": datetime.now(timezone.utc).isoformat(),
-                            "updated_at": datetime.now(timezone.utc).isoformat()
-                        }
-                    }
-                )
-                clients_removed += 1
-        
-        print(f"=== RECONCILIAÇÃO: {clients_removed} clientes inativados (sem débitos no IXC)")
+        if not connector.listing_complete:
+            # Menos registros que o total anunciado pelo ERP: o ausente pode ser só perda
+            print(f"⚠️ RECONCILIAÇÃO {integration_type.upper()} CANCELADA: listagem incompleta")
+            result["message"] = f"{result.get('message', '')} | ⚠️ Reconciliação cancelada: listagem do {name} incompleta"
+        else:
+            try:
+                clients_removed = await reconcile_imported_clients(provider_id, integration["id"], debtors.keys())
+            except ReconcileLimitExceeded as e:
+                print(f"⚠️ RECONCILIAÇÃO {integration_type.upper()} CANCELADA: {e}")
+                result["message"] = f"{result.get('message', '')} | ⚠️ {e}"
+        print(f"=== RECONCILIAÇÃO {integration_type.upper()}: {clients_removed} cliente(s) inativado(s) (sem débitos no ERP)")
         
-        # Atualiza mensagem de resultado
-        original_message = result.get("message", "")
         if clients_removed > 0:
-            result["message"] = f"{original_message} | {clients_removed} cliente(s) removido(s) (sem débitos no IXC)"
+            result["message"] = f"{result.get('message', '')} | {clients_removed} cliente(s) removido(s) (sem débitos no {name})"
             result["clients_removed"] = clients_removed
         
+        # Sync completo com listagem incompleta não conta como completo
+        await save_sync_watermark(integration, started_at, full_sync and connector.listing_complete)
         return result
         
-    except ValueError:
+    except ErpDeadlineExceeded as e:
+        print(f"=== SYNC {integration_type.upper()} INTERROMPIDA: {e}")
         return {
             "status": "error",
-            "message": "Token mal formatado",
+            "message": f"Sincronização interrompida: {str(e)}",
             "clients_synced": 0,
             "clients_failed": 0
         }
-    except Exception as e:
+    except httpx.TimeoutException:
         return {
             "status": "error",
-            "message": f"Erro: {str(e)}",
+            "message": f"Timeout ao consultar o {integration_type.upper()}",
             "clients_synced": 0,
             "clients_failed": 0
         }
-
-
-async def sync_mkauth_data(integration: dict, provider_id: str) -> dict:
-    """Sync client data from MK-Auth"""
-    try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        api_token = credentials.get("api_token")
-        
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Get delinquent clients from MK-Auth
-        debt_threshold = integration.get("settings", {}).get("debt_days_threshold", 5)
-        clients_url = f"{api_url}/api/v1/clientes/inadimplentes?dias={debt_threshold}"
-        
-        response = requests.get(clients_url, headers=headers, timeout=30)
-        if response.status_code != 200:
-            return {
-                "status": "error",
-                "message": f"Erro ao buscar clientes: HTTP {response.status_code}",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        mkauth_clients = response.json().get('data', [])
-        
-        # Import clients into our system
-        result = await import_clients_to_system(mkauth_clients, provider_id, "mk-auth")
-        
-        return result
-        
-    except Exception as e:
+    except ErpError as e:
         return {
             "status": "error",
-            "message": f"Erro na sincronização: {str(e)}",
+            "message": str(e),
             "clients_synced": 0,
             "clients_failed": 0
         }
-
-
-async def sync_sgp_data(integration: dict, provider_id: str) -> dict:
-    """Sync client data from SGP"""
-    try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        api_key = credentials.get("api_key")
-        api_secret = credentials.get("api_secret")
-        
-        headers = {
-            "X-API-Key": api_key,
-            "X-API-Secret": api_secret,
-            "Content-Type": "application/json"
-        }
-        
-        # Get delinquent clients from SGP
-        debt_threshold = integration.get("settings", {}).get("debt_days_threshold", 5)
-        clients_url = f"{api_url}/api/clientes/inadimplentes?dias_atraso={debt_threshold}"
-        
-        response = requests.get(clients_url, headers=headers, timeout=30)
-        if response.status_code != 200:
-            return {
-                "status": "error",
-                "message": f"Erro ao buscar clientes: HTTP {response.status_code}",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        sgp_clients = response.json().get('clientes', [])
-        
-        # Import clients into our system
-        result = await import_clients_to_system(sgp_clients, provider_id, "sgp")
-        
-        return result
-        
     except Exception as e:
         return {
             "status": "error",
@@ -8175,81 +9591,175 @@ async def sync_sgp_data(integration: dict, provider_id: str) -> dict:
         }
 
 
-async def sync_radiusnet_data(integration: dict, provider_id: str) -> dict:
-    """Sync client data from RadiusNet"""
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))  # upserts por bulk_write
+
+# Sync incremental: devedores cujo conteúdo não mudou desde o último sync não
+# são regravados (nem consultados no /cliente do IXC); de tempos em tempos um
+# sync completo ignora os hashes para corrigir qualquer divergência
+INTEGRATION_FULL_RESYNC_HOURS = float(os.environ.get('INTEGRATION_FULL_RESYNC_HOURS', '168'))
+
+# Reconciliação não inativa mais que este percentual dos clientes ativos de uma
+# integração numa só execução (integrações com menos de RECONCILE_CAP_MIN_CLIENTS
+# clientes ficam fora da trava)
+RECONCILE_MAX_REMOVAL_PERCENT = float(os.environ.get('RECONCILE_MAX_REMOVAL_PERCENT', '50'))
+RECONCILE_CAP_MIN_CLIENTS = int(os.environ.get('RECONCILE_CAP_MIN_CLIENTS', '20'))
+
+
+def integration_needs_full_sync(integration: dict) -> bool:
+    """True when the last full resync is older than INTEGRATION_FULL_RESYNC_HOURS (or never happened)"""
+    last_full = (integration.get("sync_watermark") or {}).get("last_full_sync_at")
+    if not last_full:
+        return True
     try:
-        import requests
-        
-        credentials = integration["credentials"]
-        api_url = integration["api_url"].rstrip('/')
-        username = credentials.get("username")
-        password = credentials.get("password")
-        
-        # Authenticate with RadiusNet
-        auth_url = f"{api_url}/api/login"
-        auth_data = {
-            "username": username,
-            "password": password
-        }
-        
-        auth_response = requests.post(auth_url, json=auth_data, timeout=10)
-        if auth_response.status_code != 200:
-            return {
-                "status": "error",
-                "message": "Falha na autenticação com RadiusNet",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        auth_result = auth_response.json()
-        token = auth_result.get('token')
-        
-        if not token:
-            return {
-                "status": "error",
-                "message": "Token não recebido do RadiusNet",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        # Get delinquent clients from RadiusNet
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        debt_threshold = integration.get("settings", {}).get("debt_days_threshold", 5)
-        clients_url = f"{api_url}/api/clientes/inadimplentes?dias={debt_threshold}"
-        
-        response = requests.get(clients_url, headers=headers, timeout=30)
-        if response.status_code != 200:
-            return {
-                "status": "error",
-                "message": f"Erro ao buscar clientes: HTTP {response.status_code}",
-                "clients_synced": 0,
-                "clients_failed": 0
-            }
-        
-        radiusnet_clients = response.json().get('clientes', [])
-        
-        # Import clients into our system
-        result = await import_clients_to_system(radiusnet_clients, provider_id, "radiusnet")
-        
-        return result
-        
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Erro na sincronização: {str(e)}",
-            "clients_synced": 0,
-            "clients_failed": 0
+        last_full_at = datetime.fromisoformat(last_full)
+    except ValueError:
+        return True
+    return datetime.now(timezone.utc) - last_full_at >= timedelta(hours=INTEGRATION_FULL_RESYNC_HOURS)
+
+
+async def save_sync_watermark(integration: dict, started_at: datetime, full_sync: bool):
+    """Record when the integration last synced successfully (and whether it was a full resync)"""
+    watermark = {
+        "last_sync_at": started_at.isoformat(),
+        "last_mode": "full" if full_sync else "delta",
+        "last_full_sync_at": started_at.isoformat() if full_sync
+        else (integration.get("sync_watermark") or {}).get("last_full_sync_at")
+    }
+    await db.provider_integrations.update_one({"id": integration["id"]}, {"$set": {"sync_watermark": watermark}})
+
+
+async def load_known_hashes(integration_id: str, external_ids, field: str) -> Dict[str, str]:
+    """external_id -> stored hash for the integration's active clients among `external_ids`"""
+    external_ids = list(external_ids)
+    known = {}
+    for start in range(0, len(external_ids), IMPORT_BATCH_SIZE):
+        chunk = external_ids[start:start + IMPORT_BATCH_SIZE]
+        async for doc in db.clients.find(
+            {"integration_id": integration_id, "is_active": True, "external_id": {"$in": chunk}},
+            {"_id": 0, "external_id": 1, field: 1}
+        ):
+            if doc.get(field):
+                known[doc["external_id"]] = doc[field]
+    return known
+
+
+class ReconcileLimitExceeded(Exception):
+    """Reconciliation would inactivate more than RECONCILE_MAX_REMOVAL_PERCENT of the integration's clients"""
+
+
+async def reconcile_imported_clients(provider_id: str, integration_id: str, current_external_ids) -> int:
+    """Inactivate the integration's clients whose external id is no longer among the ERP debtors"""
+    await report_sync_stage("reconcile")
+    base_query = {
+        "provider_id": provider_id,
+        "integration_id": integration_id,
+        "is_active": True
+    }
+    query = {
+        **base_query,
+        # Sem external_id (importados antes da etiqueta de origem): $nin também casaria
+        # com eles, então ficam fora até um sync gravar o id do ERP
+        "external_id": {"$exists": True, "$nin": [external_id for external_id in current_external_ids if external_id]}
+    }
+    
+    # Trava de segurança: resposta errada do ERP não pode esvaziar a lista de uma vez
+    to_remove = await db.clients.count_documents(query)
+    if to_remove:
+        active = await db.clients.count_documents(base_query)
+        if active >= RECONCILE_CAP_MIN_CLIENTS and to_remove * 100 > active * RECONCILE_MAX_REMOVAL_PERCENT:
+            raise ReconcileLimitExceeded(
+                f"Reconciliação cancelada: {to_remove} de {active} cliente(s) seriam removidos "
+                f"(limite de {RECONCILE_MAX_REMOVAL_PERCENT:.0f}% por sincronização)"
+            )
+    
+    removed_cpfs = await db.clients.distinct("cpf_digits", query)
+    now = datetime.now(timezone.utc).isoformat()
+    result = await db.clients.update_many(query, {
+        "$set": {
+            "is_active": False,
+            "deleted_at": now,
+            "updated_at": now
         }
+    })
+    await refresh_negative_registry(removed_cpfs)
+    return result.modified_count
+
+
+async def tag_legacy_imported_clients() -> int:
+    """Tag clients imported before source tagging (matched by the 'Importado do ...' text) with their integration"""
+    tagged = 0
+    integrations = await db.provider_integrations.find(
+        {}, {"_id": 0, "id": 1, "provider_id": 1, "integration_type": 1}
+    ).to_list(length=None)
+    for integration in integrations:
+        label = re.escape(f"Importado do {integration['integration_type'].upper()}")
+        result = await db.clients.update_many(
+            {
+                "provider_id": integration["provider_id"],
+                "source_system": {"$exists": False},
+                "$or": [
+                    {"reason": {"$regex": label, "$options": "i"}},
+                    {"inclusion_reason": {"$regex": label, "$options": "i"}},
+                    {"observations": {"$regex": label, "$options": "i"}}
+                ]
+            },
+            {"$set": {"source_system": integration["integration_type"], "integration_id": integration["id"]}}
+        )
+        tagged += result.modified_count
+    return tagged
+
+
+def build_client_upsert(normalized_client: dict, provider_id: str, source_system: str, integration_id: Optional[str], now: datetime) -> UpdateOne:
+    """Upsert keyed on (provider_id, cpf_digits, is_active, integration_id) for one normalized ERP client"""
+    # Campos atualizados em todo sync, só em clientes desta integração (o filtro
+    # inclui integration_id); external_id completa clientes antigos etiquetados
+    update_data = {
+        "external_id": normalized_client.get("external_id", ""),
+        "sync_hash": normalized_client["sync_hash"],
+        "debt_amount": normalized_client["debt_amount"],
+        "reason": normalized_client.get("reason"),
+        "risk_level": normalized_client.get("risk_level"),
+        "phone": normalized_client.get("phone"),
+        "updated_at": now
+    }
+    
+    # Adiciona boletos se existirem
+    if normalized_client.get("boletos"):
+        update_data["boletos"] = normalized_client["boletos"]
+    if normalized_client.get("debt_hash"):
+        update_data["erp_debt_hash"] = normalized_client["debt_hash"]
+    
+    # Campos gravados só quando o cliente é criado
+    new_client = {
+        "id": str(uuid.uuid4()),
+        "source_system": source_system,
+        "name": normalized_client["name"],
+        "cpf": normalized_client["cpf"],
+        "email": normalized_client.get("email", ""),
+        "address": normalized_client.get("address", ""),
+        "bairro": normalized_client.get("bairro", ""),
+        "inclusion_date": normalized_client.get("inclusion_date", now.date().isoformat()),
+        "observations": f"Importado do {source_system.upper()} em {now.strftime('%d/%m/%Y %H:%M')}",
+        "created_at": now
+    }
+    new_client.update(client_search_fields(new_client))
+    new_client.pop("cpf_digits", None)  # Já vem do filtro do upsert
+    if "boletos" not in update_data:
+        new_client["boletos"] = []
+    
+    return UpdateOne(
+        {"provider_id": provider_id, "cpf_digits": normalized_client["cpf"], "is_active": True,
+         "integration_id": integration_id},
+        {"$set": update_data, "$setOnInsert": new_client},
+        upsert=True
+    )
 
 
-async def import_clients_to_system(external_clients: list, provider_id: str, source_system: str) -> dict:
+async def import_clients_to_system(external_clients: list, provider_id: str, source_system: str,
+                                   integration_id: Optional[str] = None, skip_unchanged: bool = False) -> dict:
     """
     Import clients from external ERP system into ControleIsp database
-    Handles data normalization and duplicate prevention
+    Normalizes in chunks and writes each chunk with one unordered bulk upsert
     """
     try:
         print(f"=== IMPORT CLIENTS - Total recebido: {len(external_clients)}")
@@ -8258,92 +9768,85 @@ async def import_clients_to_system(external_clients: list, provider_id: str, sou
         clients_synced = 0
         clients_failed = 0
         clients_updated = 0
-        
-        for idx, ext_client in enumerate(external_clients):
-            try:
-                # Normalize data based on source system
+        clients_unchanged = 0
+        clients_skipped = 0
+        touched_cpfs = set()
+        
+        for start in range(0, len(external_clients), IMPORT_BATCH_SIZE):
+            chunk = external_clients[start:start + IMPORT_BATCH_SIZE]
+            now = datetime.now(timezone.utc)
+            await report_sync_stage("normalize", processed=start, total=len(external_clients))
+            
+            # Normaliza o lote; CPFs repetidos ficam com a última linha (antes: insert + update)
+            rows = {}
+            for ext_client in chunk:
                 normalized_client = normalize_client_data(ext_client, source_system)
-                
                 if not normalized_client:
-                    print(f"Cliente {idx+1} FALHOU na normalização")
-                    print(f"Dados originais: {ext_client}")
                     clients_failed += 1
                     continue
-                
-                print(f"Cliente {idx+1} normalizado: {normalized_client.get('name', 'SEM NOME')} - CPF: {normalized_client.get('cpf', 'SEM CPF')} - Débito: R$ {normalized_client.get('debt_amount', 0)}")
-                
-                # Check if client already exists (by CPF)
-                print(f"Verificando duplicata para CPF: {normalized_client['cpf']}")
-                try:
-                    existing_client = await db.clients.find_one({
-                        "provider_id": provider_id,
-                        "cpf": normalized_client["cpf"],
-                        "is_active": True
-                    })
-                    print(f"Resultado busca duplicata: {existing_client}")
-                except Exception as e:
-                    print(f"ERRO ao buscar duplicata: {e}")
-                    existing_client = None
-                
-                if existing_client:
-                    # Update existing client
-                    update_data = {
-                        "debt_amount": normalized_client["debt_amount"],
-                        "reason": normalized_client.get("reason", existing_client.get("reason")),
-                        "risk_level": normalized_client.get("risk_level", existing_client.get("risk_level")),
-                        "phone": normalized_client.get("phone", existing_client.get("phone")),
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                    
-                    # Adiciona boletos se existirem
-                    if "boletos" in normalized_client and normalized_client["boletos"]:
-                        update_data["boletos"] = normalized_client["boletos"]
-                    
-                    await db.clients.update_one(
-                        {"id": existing_client["id"]},
-                        {"$set": update_data}
-                    )
+                normalized_client["sync_hash"] = content_hash(normalized_client)
+                if normalized_client["cpf"] in rows:
                     clients_updated += 1
-                else:
-                    # Create new client
-                    new_client = {
-                        "id": str(uuid.uuid4()),
-                        "provider_id": provider_id,
-                        "name": normalized_client["name"],
-                        "cpf": normalized_client["cpf"],
-                        "email": normalized_client.get("email", ""),
-                        "phone": normalized_client.get("phone", ""),
-                        "address": normalized_client.get("address", ""),
-                        "bairro": normalized_client.get("bairro", ""),
-                        "debt_amount": normalized_client["debt_amount"],
-                        "reason": normalized_client.get("reason", "Inadimplência"),
-                        "risk_level": normalized_client.get("risk_level", 3),
-                        "inclusion_date": normalized_client.get("inclusion_date", datetime.now(timezone.utc).date().isoformat()),
-                        "observations": f"Importado do {source_system.upper()} em {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M')}",
-                        "boletos": normalized_client.get("boletos", []),  # Adiciona boletos
-                        "is_active": True,
-                        "created_at": datetime.now(timezone.utc),
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                    
-                    print(f"Salvando cliente: {new_client['name']} - CPF: {new_client['cpf']}")
-                    result = await db.clients.insert_one(new_client)
-                    print(f"Cliente salvo com ID MongoDB: {result.inserted_id}")
-                    clients_synced += 1
-                    
-            except Exception as e:
-                print(f"Erro ao processar cliente: {e}")
-                clients_failed += 1
+                rows[normalized_client["cpf"]] = normalized_client
+            
+            if rows:
+                # CPF já ativo em cadastro manual (ou de outra integração) não é assumido
+                # pelo ERP; no sync incremental, também não regrava quem já está idêntico
+                async for doc in db.clients.find(
+                    {"provider_id": provider_id, "is_active": True, "cpf_digits": {"$in": list(rows)}},
+                    {"_id": 0, "cpf_digits": 1, "sync_hash": 1, "integration_id": 1}
+                ):
+                    row = rows.get(doc["cpf_digits"])
+                    if not row:
+                        continue
+                    if doc.get("integration_id") != integration_id:
+                        del rows[doc["cpf_digits"]]
+                        clients_skipped += 1
+                    elif skip_unchanged and doc.get("sync_hash") == row["sync_hash"]:
+                        del rows[doc["cpf_digits"]]
+                        clients_unchanged += 1
+            
+            if not rows:
                 continue
+            
+            await report_sync_stage("import", processed=start, total=len(external_clients))
+            cpfs = list(rows)
+            operations = [build_client_upsert(rows[cpf], provider_id, source_system, integration_id, now) for cpf in cpfs]
+            try:
+                result = await db.clients.bulk_write(operations, ordered=False)
+                details = result.bulk_api_result
+            except BulkWriteError as e:
+                # Erros por linha: o resto do lote (unordered) foi gravado normalmente
+                details = e.details
+                for error in details.get("writeErrors", []):
+                    print(f"Erro ao importar cliente CPF {cpfs[error['index']]}: {error.get('errmsg')}")
+            
+            failed_indexes = {error["index"] for error in details.get("writeErrors", [])}
+            inserted = len(details.get("upserted", []))
+            clients_synced += inserted
+            clients_updated += len(cpfs) - len(failed_indexes) - inserted
+            clients_failed += len(failed_indexes)
+            touched_cpfs.update(cpf for index, cpf in enumerate(cpfs) if index not in failed_indexes)
+        
+        if clients_failed:
+            print(f"⚠️ {clients_failed} cliente(s) do {source_system.upper()} não importados (dados inválidos ou erro de gravação)")
         
-        status = "success" if clients_synced > 0 or clients_updated > 0 else "error"
+        await refresh_negative_registry(touched_cpfs)
+        
+        status = "success" if clients_synced > 0 or clients_updated > 0 or clients_unchanged > 0 or clients_skipped > 0 else "error"
         message = f"Sincronização concluída: {clients_synced} novos, {clients_updated} atualizados, {clients_failed} falhas"
+        if clients_unchanged:
+            message += f", {clients_unchanged} sem alteração"
+        if clients_skipped:
+            message += f", {clients_skipped} já cadastrados manualmente (não alterados)"
         
         return {
             "status": status,
             "message": message,
             "clients_synced": clients_synced,
             "clients_updated": clients_updated,
+            "clients_unchanged": clients_unchanged,
+            "clients_skipped": clients_skipped,
             "clients_failed": clients_failed
         }
         
@@ -8361,55 +9864,13 @@ def normalize_client_data(client_data: dict, source_system: str) -> dict:
     Normalize client data from different ERP systems into ControleIsp format
     """
     try:
-        normalized = {}
-        
-        if source_system == "ixc":
-            # IXC format normalization
-            normalized["name"] = client_data.get("razao", client_data.get("fantasia", "")).strip().upper()
-            normalized["cpf"] = clean_cpf(client_data.get("cnpj_cpf", ""))
-            normalized["email"] = client_data.get("email", "").strip().lower()
-            normalized["phone"] = clean_phone(client_data.get("telefone_celular", client_data.get("fone", "")))
-            normalized["address"] = client_data.get("endereco", "").strip()
-            normalized["bairro"] = client_data.get("bairro", "").strip()
-            # Usa valor de débito real (soma dos 2 títulos mais antigos)
-            normalized["debt_amount"] = float(client_data.get("valor_debito", 0))
-            num_titulos = client_data.get("numero_titulos", 0)
-            normalized["reason"] = f"Importado do IXC - {num_titulos} título(s) vencido(s)" if num_titulos else "Importado do IXC"
-            # Preserva boletos
-            normalized["boletos"] = client_data.get("boletos", [])
-            
-        elif source_system == "mk-auth":
-            # MK-Auth format normalization
-            normalized["name"] = client_data.get("name", client_data.get("full_name", "")).strip().upper()
-            normalized["cpf"] = clean_cpf(client_data.get("cpf", client_data.get("document", "")))
-            normalized["email"] = client_data.get("email", "").strip().lower()
-            normalized["phone"] = clean_phone(client_data.get("phone", client_data.get("mobile", "")))
-            normalized["address"] = client_data.get("street", "").strip()
-            normalized["bairro"] = client_data.get("neighborhood", client_data.get("district", "")).strip()
-            normalized["debt_amount"] = float(client_data.get("debt", client_data.get("debt_amount", 0)))
-            normalized["reason"] = "Inadimplência"
-            
-        elif source_system == "sgp":
-            # SGP format normalization
-            normalized["name"] = client_data.get("nome_cliente", client_data.get("nome", "")).strip().upper()
-            normalized["cpf"] = clean_cpf(client_data.get("cpf", ""))
-            normalized["email"] = client_data.get("email_principal", client_data.get("email", "")).strip().lower()
-            normalized["phone"] = clean_phone(client_data.get("telefone_principal", client_data.get("telefone", "")))
-            normalized["address"] = client_data.get("logradouro", client_data.get("endereco", "")).strip()
-            normalized["bairro"] = client_data.get("bairro", "").strip()
-            normalized["debt_amount"] = float(client_data.get("valor_em_aberto", client_data.get("debito", 0)))
-            normalized["reason"] = "Inadimplência"
-            
-        elif source_system == "radiusnet":
-            # RadiusNet format normalization
-            normalized["name"] = client_data.get("nome", client_data.get("cliente_nome", "")).strip().upper()
-            normalized["cpf"] = clean_cpf(client_data.get("cpf", client_data.get("documento", "")))
-            normalized["email"] = client_data.get("email", "").strip().lower()
-            normalized["phone"] = clean_phone(client_data.get("telefone", client_data.get("contato", "")))
-            normalized["address"] = client_data.get("endereco", "").strip()
-            normalized["bairro"] = client_data.get("bairro", "").strip()
-            normalized["debt_amount"] = float(client_data.get("debito_total", client_data.get("valor_devido", 0)))
-            normalized["reason"] = "Inadimplência"
+        connector_class = get_connector_class(source_system)
+        if connector_class is None:
+            return None
+        
+        normalized = connector_class.normalize_fields(client_data)
+        normalized["debt_hash"] = client_data.get("hash_debito", "")
+        normalized["external_id"] = connector_class.external_id(client_data)
         
         # Validate required fields
         if not normalized.get("name") or not normalized.get("cpf"):
@@ -8459,7 +9920,7 @@ async def get_integrations_overview(current_user=Depends(get_current_admin)):
     try:
         # Count integrations by type
         integration_stats = {}
-        integrations = await db.provider_integrations.find({}).to_list(500)
+        integrations = await read_db.provider_integrations.find({}).to_list(500)
         
         for integration in integrations:
             int_type = integration["integration_type"]
@@ -8492,6 +9953,68 @@ async def get_integrations_overview(current_user=Depends(get_current_admin)):
         raise HTTPException(status_code=500, detail=f"Erro ao obter dados: {str(e)}")
 
 
+@api_router.get("/admin/integrations/sync-runs")
+async def get_sync_run_trends(days: int = 30, limit: int = 10, current_user=Depends(get_current_admin)):
+    """Sync trends across all integrations, including the slowest ones over the last `days`"""
+    try:
+        days = max(1, min(days, SYNC_RUN_RETENTION_DAYS))
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+        match = {"started_at": {"$gte": since}}
+        trends = await sync_run_trends(match)
+        
+        slowest = await read_db.sync_runs.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": "$integration_id",
+                "provider_id": {"$first": "$provider_id"},
+                "integration_type": {"$first": "$integration_type"},
+                **sync_run_stats_group()
+            }},
+            {"$sort": {"avg_duration_seconds": -1}},
+            {"$limit": max(1, min(limit, 100))}
+        ]).to_list(length=None)
+        
+        by_type = await read_db.sync_runs.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$integration_type", **sync_run_stats_group()}},
+            {"$sort": {"avg_duration_seconds": -1}}
+        ]).to_list(length=None)
+        
+        # Nomes de provedores e integrações para a tabela do painel
+        provider_names = {
+            provider["id"]: provider.get("name", "")
+            async for provider in read_db.providers.find(
+                {"id": {"$in": list({row["provider_id"] for row in slowest})}}, {"_id": 0, "id": 1, "name": 1}
+            )
+        }
+        integration_names = {
+            integration["id"]: integration.get("display_name", "")
+            async for integration in read_db.provider_integrations.find(
+                {"id": {"$in": [row["_id"] for row in slowest]}}, {"_id": 0, "id": 1, "display_name": 1}
+            )
+        }
+        
+        return {
+            "days": days,
+            "stages": SYNC_JOB_STAGES,
+            **trends,
+            "by_type": [round_sync_stats({"integration_type": row.pop("_id"), **row}) for row in by_type],
+            "slowest_integrations": [
+                round_sync_stats({
+                    "integration_id": row["_id"],
+                    "integration_name": integration_names.get(row["_id"], ""),
+                    "provider_name": provider_names.get(row["provider_id"], ""),
+                    **{key: value for key, value in row.items() if key != "_id"}
+                })
+                for row in slowest
+            ]
+        }
+        
+    except Exception as e:
+        print(f"Erro ao obter histórico de sincronizações: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao obter dados: {str(e)}")
+
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -8504,6 +10027,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Estimate"],
 )
 
 # Configure logging
@@ -8517,9 +10041,30 @@ logger = logging.getLogger(__name__)
 @app.on_event("shutdown")
 async def shutdown_db_client():
     # Shutdown scheduler
+    negative_filter_task = getattr(app.state, "negative_filter_task", None)
+    if negative_filter_task:
+        negative_filter_task.cancel()
+    sync_job_workers = getattr(app.state, "sync_job_workers", [])
+    for worker in sync_job_workers:
+        worker.cancel()
+    if sync_job_workers:
+        # Espera os jobs cancelados gravarem o erro antes de fechar o MongoDB
+        await asyncio.wait(sync_job_workers, timeout=10)
+    
     print("\n🛑 Parando scheduler de sincronização automática...")
+    leader_task = getattr(app.state, "scheduler_leader_task", None)
+    if leader_task:
+        leader_task.cancel()
     scheduler.shutdown()
+    if scheduler_is_leader:
+        try:
+            await release_scheduler_lease()
+        except Exception as e:
+            print(f"⚠️ Erro ao liberar lease do scheduler: {e}")
     print("✅ Scheduler parado com sucesso!\n")
     
+    # Close the pooled ERP HTTP clients
+    await erp_http_pool.close()
+    
     # Close MongoDB connection
     client.close()
\ No newline at end of file
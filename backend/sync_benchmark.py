@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ponta a ponta da sincronização com ERPs contra o simulador local
+
+Sobe erp_simulator.py (ou usa um já rodando via --simulator-url), cria uma
+integração por ERP num banco próprio e roda execute_integration_sync duas
+vezes por ERP: sync completo e, depois de alterar uma fração dos títulos no
+simulador, sync incremental. Para cada execução grava em JSON devedores/s,
+tempo de event loop bloqueado, operações no MongoDB por devedor e os tempos
+por estágio registrados em sync_runs.
+
+Uso:
+    python sync_benchmark.py --clients 50000 --latency-ms 40 --output sync.json
+    python sync_benchmark.py --erps ixc --baseline sync.json
+
+As operações no MongoDB são contadas com um CommandListener do pymongo
+registrado antes de importar server.py.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from pymongo import monitoring
+
+from erp_simulator import add_config_arguments
+
+# Configuração: o benchmark usa um banco próprio para nunca tocar nos dados reais
+BENCHMARK_DB_NAME = os.environ.get("SYNC_BENCHMARK_DB_NAME", "controleisp_sync_benchmark")
+LOOP_PROBE_SECONDS = 0.01  # intervalo do sensor de atraso do event loop
+LOOP_BLOCK_THRESHOLD_MS = 5  # atrasos acima disto contam como loop bloqueado
+
+# api_url e credenciais de cada ERP no simulador
+ERP_TARGETS = {
+    "ixc": ("/ixc/webservice/v1", {"token": "1:simulador"}),
+    "mk-auth": ("/mkauth", {"api_token": "simulador"}),
+    "sgp": ("/sgp", {"api_key": "simulador", "api_secret": "simulador"}),
+    "radiusnet": ("/radiusnet", {"username": "simulador", "password": "simulador"}),
+}
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Count commands sent to the benchmark database, by command name"""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def started(self, event):
+        if event.database_name == BENCHMARK_DB_NAME and event.command_name not in IGNORED_COMMANDS:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class LoopLagMonitor:
+    """Sleep in short intervals and record how late the event loop wakes up"""
+
+    def __init__(self):
+        self.lags_ms = []
+        self.task = None
+
+    async def probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_PROBE_SECONDS
+            await asyncio.sleep(LOOP_PROBE_SECONDS)
+            self.lags_ms.append(max(0.0, (loop.time() - expected) * 1000))
+
+    def start(self):
+        self.task = asyncio.create_task(self.probe())
+
+    async def stop(self) -> dict:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        blocked = [lag for lag in self.lags_ms if lag > LOOP_BLOCK_THRESHOLD_MS]
+        return {
+            "blocked_ms": round(sum(blocked), 1),
+            "blocked_events": len(blocked),
+            "max_lag_ms": round(max(self.lags_ms, default=0.0), 1),
+            "p99_lag_ms": round(percentile(self.lags_ms, 99), 1)
+        }
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def start_simulator(args) -> subprocess.Popen:
+    """Run erp_simulator.py in a separate process so its CPU time does not count as loop lag"""
+    command = [
+        sys.executable, str(Path(__file__).parent / "erp_simulator.py"),
+        "--port", str(args.simulator_port),
+        "--clients", str(args.clients),
+        "--debtor-ratio", str(args.debtor_ratio),
+        "--titles-per-client", str(args.titles_per_client),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--latency-per-1k-ms", str(args.latency_per_1k_ms),
+        "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+    ]
+    return subprocess.Popen(command, cwd=Path(__file__).parent)
+
+
+async def wait_for_simulator(url: str, process: subprocess.Popen = None, timeout: float = 300) -> dict:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while True:
+            if process and process.poll() is not None:
+                raise RuntimeError(f"Simulador encerrou com código {process.returncode}")
+            try:
+                response = await http.get(f"{url}/_sim/health")
+                if response.status_code == 200:
+                    return response.json()
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Simulador não respondeu em {url}")
+            await asyncio.sleep(0.5)
+
+
+async def run_sync(server, counter: MongoCommandCounter, integration_id: str) -> dict:
+    """One execute_integration_sync with loop lag and Mongo command counts"""
+    integration = await server.db.provider_integrations.find_one({"id": integration_id})
+    counter.counts.clear()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    result = await server.execute_integration_sync(integration, "benchmark")
+    elapsed = time.perf_counter() - started
+    loop = await monitor.stop()
+    mongo_ops = dict(counter.counts)
+
+    run = await server.db.sync_runs.find_one(
+        {"integration_id": integration_id}, {"_id": 0}, sort=[("started_at", -1)]
+    )
+    debtors = run["rows"]["debtors"] if run else 0
+    total_ops = sum(mongo_ops.values())
+    return {
+        "status": result.get("status"),
+        "message": result.get("message"),
+        "duration_seconds": round(elapsed, 3),
+        "debtors": debtors,
+        "debtors_per_second": round(debtors / elapsed, 1) if elapsed else 0.0,
+        "event_loop": loop,
+        "mongo": {
+            "operations": total_ops,
+            "operations_per_debtor": round(total_ops / debtors, 3) if debtors else None,
+            "by_command": mongo_ops
+        },
+        "stages": run["stages"] if run else {},
+        "http": run["http"] if run else {},
+        "rows": run["rows"] if run else {}
+    }
+
+
+async def run_benchmark(server, counter: MongoCommandCounter, args) -> dict:
+    db = server.db
+    results = {}
+    async with httpx.AsyncClient() as http:
+        for integration_type in args.erps:
+            prefix, credentials = ERP_TARGETS[integration_type]
+            await db.client.drop_database(db.name)
+            await server.apply_index_registry()
+            provider_id = f"benchmark-{integration_type}"
+            await db.providers.insert_one({"id": provider_id, "name": f"Provedor Benchmark {integration_type}",
+                                           "is_active": True})
+            await db.provider_integrations.insert_one({
+                "id": f"integration-{integration_type}",
+                "provider_id": provider_id,
+                "integration_type": integration_type,
+                "display_name": f"Simulador {integration_type}",
+                "api_url": f"{args.simulator_url}{prefix}",
+                "credentials": credentials,
+                # Mesmo corte do IXC (mais de 60 dias) para os ERPs que recebem o limite por parâmetro
+                "settings": {"debt_days_threshold": 60},
+                "is_active": True,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+
+            print(f"⏱️  {integration_type}: sync completo")
+            full = await run_sync(server, counter, f"integration-{integration_type}")
+            await http.post(f"{args.simulator_url}/_sim/advance", params={"fraction": args.change_rate})
+            print(f"⏱️  {integration_type}: sync incremental ({args.change_rate:.0%} dos títulos alterados)")
+            delta = await run_sync(server, counter, f"integration-{integration_type}")
+            results[integration_type] = {"full": full, "delta": delta}
+            print(f"   {full['debtors_per_second']} devedores/s (completo), {delta['debtors_per_second']} devedores/s (incremental)")
+    return results
+
+
+def compare_with_baseline(results: dict, baseline_path: str, tolerance: float) -> list:
+    """Return the runs whose throughput dropped or Mongo operations per debtor grew past tolerance"""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    regressions = []
+    for erp, runs in results.items():
+        for mode, current in runs.items():
+            previous = baseline.get(erp, {}).get(mode)
+            if not previous:
+                continue
+            before, after = previous["debtors_per_second"], current["debtors_per_second"]
+            if before and after < before / tolerance:
+                regressions.append(f"{erp}.{mode}.debtors_per_second: {before} -> {after}")
+            before = previous["mongo"]["operations_per_debtor"]
+            after = current["mongo"]["operations_per_debtor"]
+            if before and after and after > before * tolerance:
+                regressions.append(f"{erp}.{mode}.mongo.operations_per_debtor: {before} -> {after}")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark da sincronização com ERPs (simulador local)")
+    add_config_arguments(parser)
+    parser.add_argument("--erps", default=",".join(ERP_TARGETS), help="ERPs separados por vírgula")
+    parser.add_argument("--change-rate", type=float, default=0.02, help="fração dos títulos alterados antes do sync incremental")
+    parser.add_argument("--simulator-url", help="simulador já rodando (padrão: sobe um em --simulator-port)")
+    parser.add_argument("--simulator-port", type=int, default=8765)
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="regressão se piorar mais que esta razão")
+    args = parser.parse_args()
+    args.erps = [erp.strip() for erp in args.erps.split(",") if erp.strip()]
+    unknown = [erp for erp in args.erps if erp not in ERP_TARGETS]
+    if unknown:
+        parser.error(f"ERPs desconhecidos: {', '.join(unknown)}")
+
+    simulator = None
+    if not args.simulator_url:
+        args.simulator_url = f"http://127.0.0.1:{args.simulator_port}"
+        simulator = start_simulator(args)
+
+    try:
+        dataset = await wait_for_simulator(args.simulator_url, simulator)
+
+        # server.py lê DB_NAME no import: aponta para o banco do benchmark antes; o
+        # listener precisa estar registrado antes de server.py criar o cliente do Mongo
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ.setdefault("SECRET_KEY", "benchmark")
+        os.environ["DB_NAME"] = BENCHMARK_DB_NAME
+        counter = MongoCommandCounter()
+        monitoring.register(counter)
+        sys.path.insert(0, str(Path(__file__).parent))
+        import server
+
+        report = {
+            "revision": git_revision(),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "database": BENCHMARK_DB_NAME,
+            "simulator": {
+                "url": args.simulator_url,
+                **dataset,
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "latency_per_1k_ms": args.latency_per_1k_ms,
+                "error_rate": args.error_rate
+            },
+            "change_rate": args.change_rate,
+            "results": await run_benchmark(server, counter, args)
+        }
+        await server.erp_http_pool.close()
+    finally:
+        if simulator:
+            simulator.terminate()
+            simulator.wait()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"✅ Resultado salvo em {args.output}")
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare_with_baseline(report["results"], args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regressão: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Nenhuma regressão em relação ao baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
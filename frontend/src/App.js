@@ -21,6 +21,36 @@ import "./App.css";
 const BACKEND_URL = 'https://www.controleisp.com.br';
 const API = `${BACKEND_URL}/api`;
 
+// Manual ERP syncs run as background jobs: poll until the job finishes or
+// SYNC_JOB_MAX_WAIT_MS passes (the job keeps running on the server)
+const SYNC_JOB_POLL_MS = 2000;
+const SYNC_JOB_MAX_WAIT_MS = 10 * 60 * 1000;
+const SYNC_STAGE_LABELS = {
+  fetch: "buscando dados no ERP",
+  hash_lookup: "comparando com o último sync",
+  details: "buscando detalhes dos clientes",
+  normalize: "normalizando clientes",
+  import: "importando clientes",
+  reconcile: "removendo clientes sem débito"
+};
+
+const waitForSyncJob = async (jobId, token, onStage) => {
+  const deadline = Date.now() + SYNC_JOB_MAX_WAIT_MS;
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, SYNC_JOB_POLL_MS));
+    const response = await axios.get(`${API}/provider/integrations/sync-jobs/${jobId}`, {
+      headers: { Authorization: `Bearer ${token}` }
+    });
+    const job = response.data;
+    if (job.status === "success" || job.status === "error" || Date.now() >= deadline) {
+      return job;
+    }
+    if (onStage && job.stage) {
+      onStage(SYNC_STAGE_LABELS[job.stage] || job.stage);
+    }
+  }
+};
+
 // ERP Logo Component with Animation
 const ERPLogo = ({ src, alt, delay }) => {
   return (
@@ -2543,13 +2573,20 @@ const AdminDashboard = ({ onLogout }) => {
         headers: { Authorization: `Bearer ${token}` }
       });
 
-      if (response.data.success) {
-        toast.success(`✅ Sincronização concluída! ${response.data.clients_synced} clientes importados`);
+      const toastId = toast.loading(response.data.message);
+      const job = await waitForSyncJob(response.data.job_id, token, (stage) => toast.loading(`Sincronizando: ${stage}...`, { id: toastId }));
+      toast.dismiss(toastId);
+      const result = job.result || {};
+
+      if (job.status === "success") {
+        toast.success(`✅ Sincronização concluída! ${result.clients_synced || 0} clientes importados`);
         
         // Reload clients to show newly synced data
         loadClients();
+      } else if (job.status === "error") {
+        toast.error("❌ " + result.message);
       } else {
-        toast.error("❌ " + response.data.message);
+        toast.info("⏳ Sincronização ainda em andamento. Verifique o status da integração mais tarde.");
       }
       
       loadProviderIntegrations(); // Reload to show updated status
@@ -5612,13 +5649,20 @@ const ProviderDashboard = ({ onLogout }) => {
         headers: { Authorization: `Bearer ${token}` }
       });
 
-      if (response.data.success) {
-        toast.success(`✅ Sincronização concluída! ${response.data.clients_synced} clientes novos importados, ${response.data.clients_updated || 0} atualizados`);
+      const toastId = toast.loading(response.data.message);
+      const job = await waitForSyncJob(response.data.job_id, token, (stage) => toast.loading(`Sincronizando: ${stage}...`, { id: toastId }));
+      toast.dismiss(toastId);
+      const result = job.result || {};
+
+      if (job.status === "success") {
+        toast.success(`✅ Sincronização concluída! ${result.clients_synced || 0} clientes novos importados, ${result.clients_updated || 0} atualizados`);
         
         // Reload clients to show newly synced data
         loadClients();
+      } else if (job.status === "error") {
+        toast.error("❌ " + result.message);
       } else {
-        toast.error("❌ " + response.data.message);
+        toast.info("⏳ Sincronização ainda em andamento. Verifique o status da integração mais tarde.");
       }
       
       loadProviderIntegrations(); // Reload to show updated status
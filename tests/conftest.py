@@ -0,0 +1,14 @@
+"""
+Unit tests for backend/server.py helpers
+server.py reads its configuration on import, so the environment is set before
+any test module imports it (no MongoDB connection is opened at import time)
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "controleisp_tests")
+os.environ.setdefault("SECRET_KEY", "tests")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,85 @@
+"""Client search keys: phonetic name codes and keyset pagination cursors"""
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Luiz", "Luis"),
+    ("Souza", "Sousa"),
+    ("Thiago", "Tiago"),
+    ("Gonçalves", "Goncalves"),
+])
+def test_phonetic_name_key_matches_spelling_variants(first, second):
+    assert server.phonetic_name_key(first) == server.phonetic_name_key(second)
+
+
+def test_phonetic_name_key_keeps_word_order_and_skips_stopwords():
+    assert server.phonetic_name_key("Luiz da Souza 2") == [
+        server.phonetic_word_code("LUIZ"), server.phonetic_word_code("SOUZA")
+    ]
+
+
+def test_phonetic_name_key_distinguishes_different_names():
+    assert server.phonetic_name_key("Silva") != server.phonetic_name_key("Souza")
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("tier, keys", [
+    (0, ["c-1"]),
+    (1, [-0.75, "JOAO SOUZA", "c-2"]),
+    (0, [None, "Ação"]),
+])
+def test_search_cursor_round_trip(tier, keys):
+    cursor = server.encode_search_cursor(tier, keys)
+    assert "=" not in cursor
+    assert server.decode_search_cursor(cursor, len(keys), tier_count=2) == (tier, keys)
+
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_missing_cursor_starts_at_first_page(cursor):
+    assert server.decode_search_cursor(cursor, 1) == (0, None)
+
+
+@pytest.mark.parametrize("cursor", [
+    "@@@not-base64@@@",
+    "é",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),  # não é UTF-8
+    raw_cursor("{")[:-2],  # JSON truncado
+    raw_cursor([0, ["c-1"]]),
+    raw_cursor(7),
+    raw_cursor({"k": ["c-1"]}),
+    raw_cursor({"t": 0}),
+    raw_cursor({"t": 0, "k": ["c-1", "c-2"]}),  # aridade errada
+    raw_cursor({"t": 0, "k": []}),
+    raw_cursor({"t": 2, "k": ["c-1"]}),  # tier inexistente
+    raw_cursor({"t": -1, "k": ["c-1"]}),
+    raw_cursor({"t": "0", "k": ["c-1"]}),
+    raw_cursor({"t": True, "k": ["c-1"]}),
+    raw_cursor({"t": 0, "k": "c"}),  # string não vira lista de letras
+    raw_cursor({"t": 0, "k": {"c": 1}}),
+    raw_cursor({"t": 0, "k": [{"$ne": None}]}),  # operador injetado no filtro
+    raw_cursor({"t": 0, "k": [["c-1"]]}),
+])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_search_cursor(cursor, 1, tier_count=2)
+    assert error.value.status_code == 400
+
+
+def test_keyset_after_single_field():
+    assert server.keyset_after(["id"], ["c-1"]) == {"$or": [{"id": {"$gt": "c-1"}}]}
+
+
+def test_keyset_after_breaks_ties_on_later_fields():
+    assert server.keyset_after(["name_folded", "id"], ["ANA", "c-1"]) == {"$or": [
+        {"name_folded": {"$gt": "ANA"}},
+        {"name_folded": "ANA", "id": {"$gt": "c-1"}}
+    ]}
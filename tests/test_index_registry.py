@@ -0,0 +1,87 @@
+"""Index registry: comparing registered specs with index_information() and applying them"""
+import asyncio
+
+import pytest
+
+import server
+
+SPEC = {"collection": "clients", "name": "provider_name", "keys": [("provider_id", 1), ("name", 1)]}
+UNIQUE_SPEC = {"collection": "sync_jobs", "name": "active_key_unique", "keys": [("active_key", 1)],
+               "options": {"unique": True, "sparse": True}}
+TTL_SPEC = {"collection": "sync_runs", "name": "expires_at_ttl", "keys": [("expires_at", 1)],
+            "options": {"expireAfterSeconds": 0}}
+PARTIAL_SPEC = {"collection": "clients", "name": "cpf_active", "keys": [("cpf_digits", 1)],
+                "options": {"partialFilterExpression": {"is_active": True}}}
+
+
+def info(keys, **options):
+    """An index_information() entry as the server returns it (float directions, "v")"""
+    return {"v": 2, "key": [(field, float(direction)) for field, direction in keys], **options}
+
+
+@pytest.mark.parametrize("spec, existing", [
+    (SPEC, info([("provider_id", 1), ("name", 1)])),
+    (UNIQUE_SPEC, info([("active_key", 1)], unique=True, sparse=True)),
+    (TTL_SPEC, info([("expires_at", 1)], expireAfterSeconds=0)),
+    (PARTIAL_SPEC, info([("cpf_digits", 1)], partialFilterExpression={"is_active": True})),
+])
+def test_matching_index_has_no_differences(spec, existing):
+    assert server.index_spec_differences(spec, existing) == []
+
+
+def test_unique_false_matches_missing_option():
+    spec = {**SPEC, "options": {"unique": False}}
+    assert server.index_spec_differences(spec, info(SPEC["keys"])) == []
+
+
+@pytest.mark.parametrize("keys", [
+    [("name", 1), ("provider_id", 1)],  # mesma chave, ordem diferente
+    [("provider_id", 1), ("name", -1)],
+    [("provider_id", 1)],
+    [("provider_id", 1), ("name", 1), ("id", 1)],
+])
+def test_key_differences_are_reported(keys):
+    differences = server.index_spec_differences(SPEC, info(keys))
+    assert len(differences) == 1 and differences[0].startswith("chaves")
+
+
+@pytest.mark.parametrize("spec, existing, option", [
+    (UNIQUE_SPEC, info([("active_key", 1)], sparse=True), "unique"),
+    (UNIQUE_SPEC, info([("active_key", 1)], unique=True), "sparse"),
+    (SPEC, info(SPEC["keys"], unique=True), "unique"),
+    (TTL_SPEC, info([("expires_at", 1)]), "expireAfterSeconds"),
+    (TTL_SPEC, info([("expires_at", 1)], expireAfterSeconds=3600), "expireAfterSeconds"),
+    (PARTIAL_SPEC, info([("cpf_digits", 1)]), "partialFilterExpression"),
+    (PARTIAL_SPEC, info([("cpf_digits", 1)], partialFilterExpression={"is_active": False}),
+     "partialFilterExpression"),
+])
+def test_option_differences_are_reported(spec, existing, option):
+    differences = server.index_spec_differences(spec, existing)
+    assert len(differences) == 1 and differences[0].startswith(option)
+
+
+def test_text_index_directions_are_compared_as_strings():
+    spec = {"collection": "clients", "name": "name_text", "keys": [("name", "text")]}
+    assert server.index_spec_differences(spec, info([])) != []
+    assert server.index_spec_differences(spec, {"key": [("name", "text")]}) == []
+
+
+def test_apply_index_registry_reports_conflicts(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["controleisp_tests"]
+    monkeypatch.setattr(server, "db", database)
+
+    async def run():
+        # Mesmo nome do registro, mas sem unique: não pode ser aceito como existente
+        await database.sync_jobs.create_index([("active_key", 1)], name="active_key_unique")
+
+        summary = await server.apply_index_registry()
+        assert summary["conflict"] == ["sync_jobs.active_key_unique"]
+        assert summary["failed"] == []
+        assert len(summary["created"]) == len(server.INDEX_REGISTRY) - 1
+
+        summary = await server.apply_index_registry()
+        assert summary["conflict"] == ["sync_jobs.active_key_unique"]
+        assert summary["created"] == []
+
+    asyncio.run(run())
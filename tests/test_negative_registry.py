@@ -0,0 +1,117 @@
+"""Negative registry read model and the Bloom filter in front of it"""
+import asyncio
+
+import pytest
+
+import server
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    database = mongomock_motor.AsyncMongoMockClient()["controleisp_tests"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "read_db", database)
+    monkeypatch.setattr(server, "negative_cpf_filter", None)
+    monkeypatch.setattr(server, "negative_filter_last_sync", None)
+    return database
+
+
+def make_client(client_id, cpf_digits, provider_id="p1", integration_id=None, **extra):
+    return {
+        "id": client_id, "provider_id": provider_id, "name": f"Cliente {client_id}",
+        "cpf": cpf_digits, "cpf_digits": cpf_digits, "debt_amount": 100.0,
+        "risk_level": 2, "inclusion_date": "2026-01-10", "is_active": True,
+        "integration_id": integration_id, "external_id": client_id if integration_id else None,
+        **extra
+    }
+
+
+def test_filter_has_no_false_negatives_after_add():
+    bloom = server.NegativeCpfFilter(1000, 0.01, 1024 * 1024)
+    cpfs = [f"{n:011d}" for n in range(10_000_000_000, 10_000_002_000)]
+    for cpf in cpfs:
+        bloom.add(cpf)
+    assert all(bloom.might_contain(cpf) for cpf in cpfs)
+
+
+def test_filter_rejects_most_unknown_cpfs():
+    bloom = server.NegativeCpfFilter(1000, 0.01, 1024 * 1024)
+    for n in range(1000):
+        bloom.add(f"{n:011d}")
+    false_positives = sum(bloom.might_contain(f"{n:011d}") for n in range(50_000, 60_000))
+    assert false_positives < 300  # 1% alvo, com folga
+
+
+def test_cpf_possibly_negative_before_the_filter_is_built(monkeypatch):
+    monkeypatch.setattr(server, "negative_cpf_filter", None)
+    assert server.cpf_possibly_negative("12345678901")
+
+
+def test_rebuild_keeps_every_registry_cpf(mock_db):
+    async def run():
+        cpfs = [f"{n:011d}" for n in range(3000)]
+        await mock_db.negative_registry.insert_many([{"_id": cpf} for cpf in cpfs])
+        await server.rebuild_negative_cpf_filter()
+        assert all(server.cpf_possibly_negative(cpf) for cpf in cpfs)
+
+        # Entradas gravadas depois da reconstrução entram pelo refresh local
+        await mock_db.clients.insert_one(make_client("c1", "99999999999"))
+        await server.refresh_negative_registry(["99999999999"])
+        assert server.cpf_possibly_negative("99999999999")
+
+    asyncio.run(run())
+
+
+def test_refresh_aggregates_active_listings(mock_db):
+    async def run():
+        await mock_db.clients.insert_many([
+            make_client("c1", "11111111111", provider_id="p1", debt_amount=100.0),
+            make_client("c2", "11111111111", provider_id="p2", debt_amount=50.5, risk_level=4),
+            make_client("c3", "11111111111", provider_id="p3", is_active=False)
+        ])
+        await server.refresh_negative_registry(["11111111111"])
+
+        entry = await mock_db.negative_registry.find_one({"_id": "11111111111"})
+        assert entry["provider_ids"] == ["p1", "p2"]
+        assert entry["total_debt"] == 150.5
+        assert entry["max_risk_level"] == 4
+
+    asyncio.run(run())
+
+
+def test_delete_client_refreshes_registry(mock_db):
+    async def run():
+        await mock_db.clients.insert_many([
+            make_client("c1", "11111111111", provider_id="p1"),
+            make_client("c2", "11111111111", provider_id="p2"),
+            make_client("c3", "22222222222", provider_id="p1")
+        ])
+        await server.rebuild_negative_registry()
+
+        await server.delete_client("c1", {"user_id": "p1"})
+        entry = await mock_db.negative_registry.find_one({"_id": "11111111111"})
+        assert entry["provider_ids"] == ["p2"]
+
+        await server.delete_client("c3", {"user_id": "p1"})
+        assert await mock_db.negative_registry.find_one({"_id": "22222222222"}) is None
+
+    asyncio.run(run())
+
+
+def test_reconcile_refreshes_registry(mock_db):
+    async def run():
+        await mock_db.clients.insert_many([
+            make_client("e1", "11111111111", integration_id="i1"),
+            make_client("e2", "22222222222", integration_id="i1"),
+            make_client("e3", "33333333333", integration_id="i1")
+        ])
+        await server.rebuild_negative_registry()
+
+        removed = await server.reconcile_imported_clients("p1", "i1", ["e1", "e2"])
+        assert removed == 1
+        assert await mock_db.negative_registry.find_one({"_id": "33333333333"}) is None
+        assert await mock_db.negative_registry.count_documents({}) == 2
+
+    asyncio.run(run())